@@ -2,30 +2,34 @@
 
 This module contains the multi-agent system for planning, architecting,
 and implementing software projects based on natural language descriptions.
+
+Exports are imported on first access, so that light modules such as the
+daemon client do not pay for importing LangChain and the provider SDKs.
 """
 
-from .graph import agent
-from .states import AgentState, Plan, TaskPlan, CoderState, ImplementationTask
-from .tools import (
-    read_file,
-    write_file,
-    list_files,
-    get_current_directory,
-    run_cmd,
-    init_project_root,
-)
+import importlib
+
+_EXPORTS = {
+    "agent": ".graph",
+    "AgentState": ".states",
+    "Plan": ".states",
+    "LeanPlan": ".states",
+    "TaskPlan": ".states",
+    "FileBundle": ".states",
+    "CoderState": ".states",
+    "ImplementationTask": ".states",
+    "read_file": ".tools",
+    "write_file": ".tools",
+    "list_files": ".tools",
+    "get_current_directory": ".tools",
+    "run_cmd": ".tools",
+    "init_project_root": ".tools",
+}
+
+__all__ = list(_EXPORTS)
+
 
-__all__ = [
-    "agent",
-    "AgentState",
-    "Plan",
-    "TaskPlan",
-    "CoderState",
-    "ImplementationTask",
-    "read_file",
-    "write_file",
-    "list_files",
-    "get_current_directory",
-    "run_cmd",
-    "init_project_root",
-]
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,571 @@
+"""Provider batch-API execution for bulk offline generation.
+
+Nightly bulk runs care about cost and throughput, not latency. In batch mode
+the shared LLM is a ``BatchChatModel``: instead of calling the interactive
+endpoint, each call hands its chat completion request to a
+``BatchCollector`` and blocks. The collector gathers the requests of all
+concurrent runs, and once no new request arrived for a short quiet period it
+submits them as one provider batch (upload a JSONL file, create the batch,
+poll until it finishes, download the output). Every waiting call then
+resumes its run with its own response.
+
+Runs move through the graph in lockstep this way: all planners go out as
+one batch, then all architects, then the coder turns::
+
+    COMPANIO_BATCH_API=1 python main.py --batch prompts.jsonl
+    python main.py --batch prompts.jsonl --batch-api    # same
+
+The protocol is the OpenAI Batch API, which OpenAI and Groq serve;
+``COMPANIO_BATCH_BASE_URL`` points at any other compatible endpoint. For
+offline testing the module serves a stand-in of that API, answered by the
+stand-in model::
+
+    python -m Agent.batch --port 8765 &
+    COMPANIO_BATCH_BASE_URL=http://127.0.0.1:8765/v1 python main.py --batch prompts.jsonl --batch-api
+"""
+
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatResult
+from langchain_openai import ChatOpenAI
+from langchain_openai.chat_models.base import _convert_dict_to_message, _convert_message_to_dict
+from openai.lib._parsing import type_to_response_format_param
+
+from .config import get_batch_api_settings
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Providers with an OpenAI-compatible batch API
+BATCH_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "llama": "https://api.groq.com/openai/v1",
+}
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchError(RuntimeError):
+    """Raised when a batch, or one request of it, fails."""
+
+
+class BatchCollector:
+    """Gathers chat completion requests of concurrent runs into provider batches.
+
+    Args:
+        client: ``openai.OpenAI`` client of the batch provider
+        flush_seconds: Submit once no new request arrived for this long
+        poll_seconds: Interval between status checks of a submitted batch
+        max_requests: Submit as soon as this many requests are waiting
+        completion_window: Completion window requested from the provider
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        flush_seconds: float = 5.0,
+        poll_seconds: float = 30.0,
+        max_requests: int = 50000,
+        completion_window: str = "24h",
+    ):
+        self.client = client
+        self.flush_seconds = flush_seconds
+        self.poll_seconds = poll_seconds
+        self.max_requests = max_requests
+        self.completion_window = completion_window
+        self._lock = threading.Condition()
+        self._pending: List[Tuple[str, Dict[str, Any], Future]] = []
+        self._last_request = 0.0
+        self._closed = threading.Event()
+        self._stats = {"batches": 0, "requests": 0, "failed_requests": 0, "wait_seconds": 0.0}
+        self._thread = threading.Thread(target=self._collect, name="batch-collector", daemon=True)
+        self._thread.start()
+
+    def submit(self, body: Dict[str, Any]) -> Future:
+        """Queue a chat completion request body for the next batch.
+
+        Returns:
+            Future resolved with the response body
+
+        Raises:
+            BatchError: If the collector has been closed
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._closed.is_set():
+                raise BatchError("Batch collector is closed")
+            self._pending.append((f"req-{uuid.uuid4().hex}", body, future))
+            self._last_request = time.monotonic()
+            self._lock.notify_all()
+        return future
+
+    def report(self) -> Dict[str, Any]:
+        """Return the number of batches and requests and the time spent waiting on batches."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+    def close(self) -> None:
+        """Stop collecting; requests that were never submitted fail."""
+        with self._lock:
+            self._closed.set()
+            pending, self._pending = self._pending, []
+            self._lock.notify_all()
+        for _, _, future in pending:
+            future.set_exception(BatchError("Batch collector closed before the request was submitted"))
+
+    def _collect(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed.is_set():
+                    self._lock.wait()
+                if self._closed.is_set():
+                    return
+                # Give the other runs time to reach their next call
+                while len(self._pending) < self.max_requests:
+                    quiet = time.monotonic() - self._last_request
+                    if quiet >= self.flush_seconds or self._closed.is_set():
+                        break
+                    self._lock.wait(self.flush_seconds - quiet)
+                requests = self._pending[:self.max_requests]
+                self._pending = self._pending[self.max_requests:]
+            # Batches are polled on their own threads, so the next one can collect meanwhile
+            threading.Thread(target=self._run_batch, args=(requests,), name="batch-poller", daemon=True).start()
+
+    def _run_batch(self, requests: List[Tuple[str, Dict[str, Any], Future]]) -> None:
+        started = time.monotonic()
+        try:
+            results = self.execute([(custom_id, body) for custom_id, body, _ in requests])
+        except Exception as e:
+            logger.error(f"Batch of {len(requests)} requests failed: {e}")
+            results = {custom_id: {"error": str(e)} for custom_id, _, _ in requests}
+        missing = {"error": "the batch returned no result for the request"}
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["requests"] += len(requests)
+            self._stats["failed_requests"] += sum("error" in results.get(custom_id, missing) for custom_id, _, _ in requests)
+            self._stats["wait_seconds"] += time.monotonic() - started
+        for custom_id, _, future in requests:
+            result = results.get(custom_id, missing)
+            if "error" in result:
+                future.set_exception(BatchError(f"Batch request {custom_id} failed: {result['error']}"))
+            else:
+                future.set_result(result["body"])
+
+    def execute(self, requests: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Submit one batch and wait until the provider finished it.
+
+        Args:
+            requests: (custom id, chat completion request body) pairs
+
+        Returns:
+            Per custom id, ``{"body": response}`` or ``{"error": message}``;
+            requests the batch did not get to are missing
+
+        Raises:
+            BatchError: If the provider failed the whole batch or the
+                collector was closed while waiting
+        """
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+            for custom_id, body in requests
+        ]
+        upload = self.client.files.create(
+            file=("requests.jsonl", ("\n".join(lines) + "\n").encode("utf-8")), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id, endpoint=BATCH_ENDPOINT, completion_window=self.completion_window
+        )
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+        while batch.status not in TERMINAL_STATUSES:
+            if self._closed.wait(self.poll_seconds):
+                raise BatchError(f"Batch collector closed while waiting on batch {batch.id}")
+            batch = self.client.batches.retrieve(batch.id)
+        logger.info(f"Batch {batch.id} {batch.status}")
+        if batch.status == "failed":
+            errors = "; ".join(e.message or e.code or "" for e in (batch.errors.data or [])) if batch.errors else ""
+            raise BatchError(f"Batch {batch.id} failed" + (f": {errors}" if errors else ""))
+
+        # Expired and cancelled batches still return what they finished
+        results: Dict[str, Dict[str, Any]] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = {"body": response["body"]}
+                else:
+                    error = record.get("error") or (response.get("body") or {}).get("error") or response
+                    results[record["custom_id"]] = {"error": error}
+        return results
+
+
+class BatchChatModel(ChatOpenAI):
+    """OpenAI-format chat model that sends its requests through a ``BatchCollector``.
+
+    Requests are built and responses parsed exactly like ``ChatOpenAI``
+    does, so tools and structured output work unchanged; only the transport
+    differs. Each call blocks until its batch finished. Batch endpoints do
+    not stream, so streaming is disabled.
+
+    Attributes:
+        collector: Collector the requests go to
+    """
+    collector: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "openai-batch"
+
+    def _generate(
+        self,
+        messages: List[Any],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        payload = self._batch_payload(messages, stop, **kwargs)
+        return self._batch_result(payload, self.collector.submit(payload).result())
+
+    async def _agenerate(
+        self,
+        messages: List[Any],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Without this, async callers (hedging, cancellable runs) would use the interactive endpoint
+        payload = self._batch_payload(messages, stop, **kwargs)
+        # A cancelled caller leaves the request in its batch, whose results resolve the future
+        response = await asyncio.shield(asyncio.wrap_future(self.collector.submit(payload)))
+        return self._batch_result(payload, response)
+
+    def _batch_payload(self, messages: List[Any], stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        payload.pop("stream", None)
+        response_format = payload.get("response_format")
+        if isinstance(response_format, type):
+            # The same strict JSON schema the SDK sends for interactive structured calls
+            payload["response_format"] = type_to_response_format_param(response_format)
+        return payload
+
+    def _batch_result(self, payload: Dict[str, Any], response: Dict[str, Any]) -> ChatResult:
+        result = self._create_chat_result(response)
+        message = result.generations[0].message
+        if payload.get("response_format") is not None and isinstance(message.content, str):
+            # The SDK's parse() fills this in for interactive structured calls
+            try:
+                message.additional_kwargs["parsed"] = json.loads(message.content)
+            except ValueError:
+                pass
+        return result
+
+
+def build_batch_model(api_provider: str, api_key: str, model_name: str, base_url: Optional[str] = None) -> BatchChatModel:
+    """Create the batch-mode chat model for a provider.
+
+    Each model has its own collector, so pooled keys submit separate batches.
+
+    Args:
+        api_provider: Provider name; without COMPANIO_BATCH_BASE_URL or
+            ``base_url`` only providers of ``BATCH_BASE_URLS`` are supported
+        api_key: API key for the provider
+        model_name: Model to use
+        base_url: OpenAI-compatible endpoint of this key, if not the provider's
+
+    Returns:
+        Chat model whose calls are collected into batches
+
+    Raises:
+        ValueError: If the provider has no OpenAI-compatible batch API
+    """
+    import openai
+
+    settings = get_batch_api_settings()
+    base_url = settings["base_url"] or base_url or BATCH_BASE_URLS.get(api_provider)
+    if base_url is None:
+        raise ValueError(
+            f"Provider {api_provider!r} has no OpenAI-compatible batch API; use one of "
+            f"{', '.join(sorted(BATCH_BASE_URLS))} or set COMPANIO_BATCH_BASE_URL"
+        )
+    collector = BatchCollector(
+        openai.OpenAI(api_key=api_key, base_url=base_url),
+        flush_seconds=settings["flush_seconds"],
+        poll_seconds=settings["poll_seconds"],
+        max_requests=settings["max_requests"],
+        completion_window=settings["completion_window"],
+    )
+    logger.info(f"Batch API mode: requests go to {base_url} in batches")
+    return BatchChatModel(
+        api_key=api_key,
+        model=model_name,
+        collector=collector,
+        use_responses_api=False,
+        disable_streaming=True,
+    )
+
+
+class StandInBatchServer:
+    """Local stand-in of the OpenAI Batch API, answered by the stand-in model.
+
+    Serves the file upload, batch creation, batch status and file content
+    endpoints. Batches finish after ``processing_seconds``.
+
+    Args:
+        host: Interface to listen on
+        port: Port to listen on (0: any free port)
+        processing_seconds: Time every batch takes
+        model: Chat model answering the requests (default: ``StandInChatModel``)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, processing_seconds: float = 0.0, model: Any = None):
+        if model is None:
+            from .stand_in import StandInChatModel
+            model = StandInChatModel()
+        self.model = model
+        self.processing_seconds = processing_seconds
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the API, e.g. ``http://127.0.0.1:8765/v1``."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StandInBatchServer":
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stand-in-batch", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInBatchServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def _new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids):06d}"
+
+    def add_file(self, filename: str, purpose: str, data: bytes) -> Dict[str, Any]:
+        """Store a file and return its file object."""
+        file = {
+            "id": self._new_id("file"),
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self._lock:
+            self.files[file["id"]] = {**file, "data": data}
+        return file
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> Dict[str, Any]:
+        """Create a batch and start processing it.
+
+        Raises:
+            KeyError: If the input file does not exist
+        """
+        with self._lock:
+            data = self.files[input_file_id]["data"]
+        batch = {
+            "id": self._new_id("batch"),
+            "object": "batch",
+            "endpoint": endpoint,
+            "completion_window": completion_window,
+            "created_at": int(time.time()),
+            "input_file_id": input_file_id,
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self._lock:
+            self.batches[batch["id"]] = batch
+        threading.Thread(target=self._process, args=(batch, data), daemon=True).start()
+        return dict(batch)
+
+    def _process(self, batch: Dict[str, Any], data: bytes) -> None:
+        outputs, errors = [], []
+        for line in data.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            record = {"id": self._new_id("batch_req"), "custom_id": request["custom_id"], "error": None}
+            try:
+                record["response"] = {"status_code": 200, "request_id": record["id"], "body": self.answer(request["body"])}
+                outputs.append(record)
+            except Exception as e:
+                record["response"] = {"status_code": 400, "request_id": record["id"], "body": {"error": {"message": str(e)}}}
+                errors.append(record)
+        time.sleep(self.processing_seconds)
+        update: Dict[str, Any] = {
+            "status": "completed",
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)},
+        }
+        for key, records in (("output_file_id", outputs), ("error_file_id", errors)):
+            if records:
+                content = "".join(json.dumps(r) + "\n" for r in records).encode("utf-8")
+                update[key] = self.add_file(f"{batch['id']}_{key}.jsonl", "batch_output", content)["id"]
+        with self._lock:
+            batch.update(update)
+
+    def answer(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one chat completion request body with a chat completion response.
+
+        Raises:
+            NotImplementedError: If the stand-in has no answer for a requested schema
+        """
+        from . import states
+
+        messages = [_convert_dict_to_message(m) for m in body["messages"]]
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = getattr(states, response_format["json_schema"]["name"], None)
+            prompt = "\n".join(str(m.content) for m in messages)
+            message = AIMessage(content=self.model.structured_response(schema, prompt).model_dump_json())
+        else:
+            message = self.model.invoke(messages)
+        usage = message.usage_metadata or {}
+        return {
+            "id": self._new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stand-in"),
+            "choices": [{
+                "index": 0,
+                "message": _convert_message_to_dict(message),
+                "finish_reason": "tool_calls" if message.tool_calls else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": usage.get("input_tokens", 0),
+                "completion_tokens": usage.get("output_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0),
+            },
+        }
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                logger.debug(f"stand-in batch API: {format % args}")
+
+            def _reply(self, status: int, body: Any, content_type: str = "application/json") -> None:
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self) -> None:
+                self._reply(404, {"error": {"message": f"Not found: {self.path}", "type": "invalid_request_error"}})
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if self.path == "/v1/files":
+                    form = _parse_multipart(self.headers.get("Content-Type", ""), body)
+                    if "file" not in form:
+                        self._reply(400, {"error": {"message": "Missing file", "type": "invalid_request_error"}})
+                        return
+                    filename, data = form["file"]
+                    self._reply(200, server.add_file(filename or "upload.jsonl", form.get("purpose", (None, b"batch"))[1].decode(), data))
+                elif self.path == "/v1/batches":
+                    request = json.loads(body or b"{}")
+                    try:
+                        batch = server.create_batch(
+                            request["input_file_id"], request.get("endpoint", BATCH_ENDPOINT), request.get("completion_window", "24h")
+                        )
+                    except KeyError as e:
+                        self._reply(400, {"error": {"message": f"Unknown or missing {e}", "type": "invalid_request_error"}})
+                        return
+                    self._reply(200, batch)
+                else:
+                    self._not_found()
+
+            def do_GET(self) -> None:
+                parts = self.path.strip("/").split("/")
+                with server._lock:
+                    if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in server.batches:
+                        self._reply(200, dict(server.batches[parts[2]]))
+                    elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in server.files:
+                        self._reply(200, server.files[parts[2]]["data"], "application/octet-stream")
+                    else:
+                        self._not_found()
+
+        return Handler
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Dict[str, Tuple[Optional[str], bytes]]:
+    """Return the fields of a multipart/form-data body as name -> (filename, data)."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b"")
+    return fields
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the OpenAI Batch API for offline batch runs")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--processing-seconds", type=float, default=1.0, help="Time every batch takes (default: 1)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    server = StandInBatchServer(args.host, args.port, args.processing_seconds)
+    print(f"Stand-in batch API on {server.url}; use COMPANIO_BATCH_BASE_URL={server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
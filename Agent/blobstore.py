@@ -0,0 +1,351 @@
+"""Content-addressed blob store for generated files.
+
+Generated projects share a lot of near-identical boilerplate. When the
+store is enabled (``COMPANIO_BLOB_STORE=1``), ``write_file`` stores each
+file once under ``<workspace root>/.blobs/objects`` keyed by its SHA-256
+and materializes it into the project directory as a copy-on-write reflink
+where the file system supports it and as a plain copy otherwise, so project
+files stay ordinary writable files. Copies save no space: every copied file
+is stored twice, once in the project and once as a blob.
+
+Hardlinks save space on every file system but share the blob's inode, so
+they are only used when asked for (``COMPANIO_BLOB_LINK_MODE=hardlink``):
+the project files are then read-only, and editing one in place (as root
+can) would change the content of every project linked to the same blob.
+
+References from project paths to blobs are tracked in a small SQLite
+ledger that accounts for deduplication and lets blobs be garbage collected
+once no project uses them. Writers hold a shared lock on the store while
+they link a blob and record the reference, and ``gc`` deletes blobs under
+an exclusive one, so a blob is never removed between being found and
+being linked.
+
+Usage:
+    python -m Agent.blobstore report [STORE_DIR]
+    python -m Agent.blobstore gc [STORE_DIR]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sqlite3
+import stat
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_DIRNAME = ".blobs"
+
+# Linux ioctl request for cloning a file's extents (copy-on-write reflink)
+_FICLONE = 0x40049409
+
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+
+
+class BlobStore:
+    """A content-addressed store with reference counting.
+
+    Args:
+        root: Directory holding the ``objects`` tree and the ref ledger
+        link_mode: How blobs are materialized: "auto" tries reflink, then
+            copy; the other modes force a single method ("hardlink" leaves
+            project files read-only)
+    """
+
+    def __init__(self, root: pathlib.Path, link_mode: str = "auto"):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {link_mode}")
+        self.root = pathlib.Path(root).resolve()
+        self.objects = self.root / "objects"
+        self.link_mode = link_mode
+        self.objects.mkdir(parents=True, exist_ok=True)
+        self._db_path = self.root / "refs.sqlite3"
+        self._lock_path = self.root / "lock"
+        self._warned_copy = False
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "path TEXT PRIMARY KEY, digest TEXT NOT NULL, method TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS refs_digest ON refs(digest)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        """Hold the store lock: shared by writers, exclusive for deleting blobs."""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        """Return the on-disk path of a blob."""
+        return self.objects / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` once and return its SHA-256 digest.
+
+        The blob may be garbage collected until a reference to it is
+        recorded; ``write`` stores and links it in one step.
+        """
+        with self._locked():
+            return self._put(data)
+
+    def _put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest
+
+    def write(self, dest: pathlib.Path, data: bytes) -> str:
+        """Store ``data`` and materialize it at ``dest``.
+
+        Returns:
+            The materialization method used ("reflink", "hardlink" or "copy")
+        """
+        with self._locked():
+            return self._materialize(self._put(data), dest)
+
+    def materialize(self, digest: str, dest: pathlib.Path) -> str:
+        """Place the blob ``digest`` at ``dest``, replacing any existing file.
+
+        Returns:
+            The materialization method used
+
+        Raises:
+            FileNotFoundError: If the blob does not exist
+        """
+        with self._locked():
+            return self._materialize(digest, dest)
+
+    def _materialize(self, digest: str, dest: pathlib.Path) -> str:
+        src = self.blob_path(digest)
+        if not src.exists():
+            raise FileNotFoundError(f"Blob not found: {digest}")
+        dest = pathlib.Path(dest).resolve()
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        # Materialize next to the destination, then atomically swap it in
+        tmp = dest.parent / f".{dest.name}.blob-tmp-{os.getpid()}-{threading.get_ident()}"
+        if tmp.exists() or tmp.is_symlink():
+            tmp.unlink()
+        method = self._link(src, tmp)
+        os.replace(tmp, dest)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO refs(path, digest, method) VALUES (?, ?, ?)",
+                (str(dest), digest, method),
+            )
+        return method
+
+    def _link(self, src: pathlib.Path, dest: pathlib.Path) -> str:
+        modes = ("reflink", "copy") if self.link_mode == "auto" else (self.link_mode,)
+        for mode in modes:
+            try:
+                if mode == "reflink":
+                    _reflink(src, dest)
+                elif mode == "hardlink":
+                    os.link(src, dest)
+                else:
+                    shutil.copyfile(src, dest)
+                    os.chmod(dest, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+                    if self.link_mode == "auto" and not self._warned_copy:
+                        self._warned_copy = True
+                        logger.warning(
+                            f"Reflinks are not supported for {dest.parent}; files are copied, so the blob store "
+                            "saves no space there (set COMPANIO_BLOB_STORE=0, or COMPANIO_BLOB_LINK_MODE=hardlink "
+                            "for read-only project files)"
+                        )
+                return mode
+            except OSError as e:
+                if dest.exists():
+                    dest.unlink()
+                if self.link_mode != "auto":
+                    raise
+                logger.debug(f"{mode} failed for {src} -> {dest}: {e}")
+        raise OSError(f"Could not materialize {src} at {dest}")
+
+    def release(self, path: pathlib.Path) -> None:
+        """Forget the reference held by ``path`` (the file itself is left alone)."""
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM refs WHERE path = ?", (str(pathlib.Path(path).resolve()),))
+
+    def refcount(self, digest: str) -> int:
+        """Return the number of recorded references to a blob."""
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM refs WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def gc(self, dry_run: bool = False) -> Dict[str, int]:
+        """Drop stale references and delete unreferenced blobs.
+
+        A reference is stale when its path no longer exists or no longer
+        holds the blob's content (for example after the project was deleted
+        or the file was rewritten outside of the store).
+
+        Returns:
+            Counts of stale refs, removed blobs and freed bytes
+        """
+        stale = []
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT path, digest, method FROM refs").fetchall()
+        for path, digest, method in rows:
+            if not self._ref_is_live(pathlib.Path(path), digest, method):
+                stale.append(path)
+        if stale and not dry_run:
+            with closing(self._connect()) as db, db:
+                db.executemany("DELETE FROM refs WHERE path = ?", [(p,) for p in stale])
+
+        stale_paths = set(stale)
+        live = {digest for path, digest, _ in rows if path not in stale_paths}
+
+        removed = freed = 0
+        with self._locked(exclusive=not dry_run):
+            for blob in self._iter_blobs():
+                digest = blob.parent.name + blob.name
+                # Re-check the ledger so blobs referenced since the scan survive
+                if digest in live or (not dry_run and self.refcount(digest)):
+                    continue
+                size = blob.stat().st_size
+                if not dry_run:
+                    os.chmod(blob, stat.S_IRUSR | stat.S_IWUSR)
+                    blob.unlink()
+                removed += 1
+                freed += size
+        logger.info(f"Blob GC: {len(stale)} stale refs, {removed} blobs removed, {freed} bytes freed")
+        return {"stale_refs": len(stale), "removed_blobs": removed, "freed_bytes": freed}
+
+    def _ref_is_live(self, path: pathlib.Path, digest: str, method: str) -> bool:
+        blob = self.blob_path(digest)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return False
+        if not blob.exists():
+            return False
+        if method == "hardlink":
+            return os.path.samestat(st, blob.stat())
+        if st.st_size != blob.stat().st_size:
+            return False
+        return _sha256_file(path) == digest
+
+    def _iter_blobs(self):
+        for shard in self.objects.iterdir():
+            if shard.is_dir():
+                for blob in shard.iterdir():
+                    if not blob.name.startswith(".tmp-"):
+                        yield blob
+
+    def usage_report(self) -> Dict[str, Any]:
+        """Report stored versus logical bytes and the deduplication ratio.
+
+        Only reflinked and hardlinked files share the blob's storage; copied
+        files count as stored bytes of their own, so ``saved_bytes`` is
+        negative when copies make the store cost more than it saves.
+        """
+        blob_sizes = {blob.parent.name + blob.name: blob.stat().st_size for blob in self._iter_blobs()}
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT digest, method FROM refs").fetchall()
+        logical = sum(blob_sizes.get(digest, 0) for digest, _ in rows)
+        copied = sum(blob_sizes.get(digest, 0) for digest, method in rows if method == "copy")
+        stored = sum(blob_sizes.values()) + copied
+        methods: Dict[str, int] = {}
+        for _, method in rows:
+            methods[method] = methods.get(method, 0) + 1
+        return {
+            "store": str(self.root),
+            "blobs": len(blob_sizes),
+            "references": len(rows),
+            "unreferenced_blobs": len(set(blob_sizes) - {digest for digest, _ in rows}),
+            "stored_bytes": stored,
+            "copied_bytes": copied,
+            "logical_bytes": logical,
+            "saved_bytes": logical - stored,
+            "dedup_ratio": round(logical / stored, 3) if stored else None,
+            "methods": methods,
+        }
+
+
+def _reflink(src: pathlib.Path, dest: pathlib.Path) -> None:
+    """Create ``dest`` as a copy-on-write clone of ``src`` (Linux only)."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    os.chmod(dest, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def _sha256_file(path: pathlib.Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+_stores: Dict[pathlib.Path, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(root: pathlib.Path, link_mode: Optional[str] = None) -> BlobStore:
+    """Return the shared store for ``root``, creating it on first use."""
+    root = pathlib.Path(root).resolve()
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = BlobStore(root, link_mode or "auto")
+            _stores[root] = store
+        return store
+
+
+def store_dir_for_project(project_root: pathlib.Path) -> pathlib.Path:
+    """Return the blob store directory shared by projects next to ``project_root``."""
+    return pathlib.Path(project_root).resolve().parent / BLOB_STORE_DIRNAME
+
+
+def main() -> None:
+    """Command line entry point for store maintenance."""
+    parser = argparse.ArgumentParser(description="Inspect or clean the generated-file blob store")
+    parser.add_argument("command", choices=["report", "gc"], help="Action to perform")
+    parser.add_argument("store", nargs="?", type=pathlib.Path, default=pathlib.Path.cwd() / BLOB_STORE_DIRNAME,
+                        help="Blob store directory (default: ./.blobs)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what gc would remove")
+    args = parser.parse_args()
+
+    if not args.store.is_dir():
+        parser.error(f"No blob store at {args.store}")
+    store = BlobStore(args.store)
+    result = store.gc(dry_run=args.dry_run) if args.command == "gc" else store.usage_report()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
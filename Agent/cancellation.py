@@ -0,0 +1,302 @@
+"""Run deadlines and cooperative cancellation.
+
+A ``CancelToken`` is active for the duration of a run (see
+``use_cancel_token``). It is cancelled explicitly, e.g. when a job is
+cancelled or the user presses Ctrl-C, or automatically once the run's
+deadline passes. Everything a run does checks the active token:
+
+* each node of the graph checks it before starting;
+* LLM calls go through ``CancellableChatModel``, which runs them on the
+  shared background event loop with a timeout equal to the remaining budget
+  and cancels the HTTP request as soon as the token fires;
+* ``run_cmd`` kills the command's process group and file writes are refused;
+* waits, such as for queued coder tasks, wake up on cancellation.
+
+The run then stops with ``RunCancelled`` (``DeadlineExceeded`` on expiry),
+and the runner keeps the state of the nodes that finished, marked with the
+reason, as a partial result.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ConfigDict
+
+from .hedging import background_loop
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "cancelled"
+DEADLINE_EXCEEDED = "deadline_exceeded"
+
+
+class RunCancelled(Exception):
+    """Raised inside a run once its cancel token has fired.
+
+    Attributes:
+        status: Why the run stopped: "cancelled" or "deadline_exceeded"
+    """
+
+    def __init__(self, message: str = "Run cancelled", status: str = CANCELLED):
+        super().__init__(message)
+        self.status = status
+
+
+class DeadlineExceeded(RunCancelled):
+    """Raised inside a run once its deadline has passed."""
+
+    def __init__(self, message: str = "Run deadline exceeded"):
+        super().__init__(message, DEADLINE_EXCEEDED)
+
+
+class CancelToken:
+    """Cancellation flag of one run, with an optional deadline.
+
+    Args:
+        timeout: Seconds from now after which the token fires by itself
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_handle = 0
+        self._timer: Optional[threading.Timer] = None
+        self.reason: Optional[str] = None
+        self.timeout: Optional[float] = None
+        self.deadline: Optional[float] = None  # time.monotonic() value
+        if timeout:
+            self.set_timeout(timeout)
+
+    def set_timeout(self, timeout: float) -> None:
+        """Fire the token ``timeout`` seconds from now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self.timeout = timeout
+            self.deadline = time.monotonic() + timeout
+            self._timer = threading.Timer(max(0.0, timeout), self.cancel, args=(DEADLINE_EXCEEDED,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self, reason: str = CANCELLED) -> bool:
+        """Fire the token and run its callbacks.
+
+        Returns:
+            False if the token had already fired
+        """
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+        logger.info(f"Run {'deadline exceeded' if reason == DEADLINE_EXCEEDED else 'cancelled'}; stopping its work")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+        return True
+
+    def close(self) -> None:
+        """Stop the deadline timer of a finished run."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._callbacks.clear()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Return the seconds left until the deadline (None: no deadline)."""
+        if self._event.is_set():
+            return 0.0
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def error(self) -> RunCancelled:
+        """Return the exception that describes why the token fired."""
+        if self.reason == DEADLINE_EXCEEDED:
+            return DeadlineExceeded(f"Run deadline of {self.timeout:g}s exceeded")
+        return RunCancelled()
+
+    def check(self) -> None:
+        """Raise ``RunCancelled`` if the token has fired."""
+        if self._event.is_set():
+            raise self.error()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the token fires or ``timeout`` passes.
+
+        Returns:
+            True if the token has fired
+        """
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]) -> Optional[int]:
+        """Call ``callback`` when the token fires; immediately if it already has.
+
+        Returns:
+            A handle for ``remove_callback``, or None if it was called already
+        """
+        with self._lock:
+            if not self._event.is_set():
+                handle = self._next_handle
+                self._next_handle += 1
+                self._callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def remove_callback(self, handle: Optional[int]) -> None:
+        with self._lock:
+            self._callbacks.pop(handle, None)
+
+
+_active_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+def get_cancel_token() -> Optional[CancelToken]:
+    """Return the cancel token of the current run, if any."""
+    return _active_token.get()
+
+
+@contextmanager
+def use_cancel_token(token: Optional[CancelToken]) -> Iterator[Optional[CancelToken]]:
+    """Make ``token`` the cancel token of everything run in this context."""
+    reset = _active_token.set(token)
+    try:
+        yield token
+    finally:
+        _active_token.reset(reset)
+
+
+def check_cancelled() -> None:
+    """Raise ``RunCancelled`` if the current run has been cancelled or is past its deadline."""
+    token = _active_token.get()
+    if token is not None:
+        token.check()
+
+
+def remaining_time() -> Optional[float]:
+    """Return the seconds left in the current run (None: no deadline)."""
+    token = _active_token.get()
+    return token.remaining() if token is not None else None
+
+
+def sleep(seconds: float) -> None:
+    """Sleep, waking up early and raising ``RunCancelled`` if the current run is cancelled."""
+    token = _active_token.get()
+    if token is None:
+        time.sleep(seconds)
+    elif token.wait(seconds):
+        raise token.error()
+
+
+async def _bounded(token: CancelToken, call: Callable[[], Awaitable[Any]], context: Optional[contextvars.Context]) -> Any:
+    """Await ``call`` until it finishes, the token fires or the remaining budget runs out."""
+    token.check()
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(call(), context=context)
+    handle = token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    try:
+        return await asyncio.wait_for(task, token.remaining())
+    except asyncio.CancelledError:
+        if token.cancelled:
+            raise token.error() from None
+        raise
+    except TimeoutError:
+        token.cancel(DEADLINE_EXCEEDED)
+        raise token.error() from None
+    finally:
+        token.remove_callback(handle)
+
+
+def _run_bounded(token: CancelToken, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run ``call`` on the background loop in the caller's context and wait for it."""
+    context = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_bounded(token, call, context), background_loop()).result()
+
+
+class CancellableRunnable(Runnable):
+    """Runs a runnable (e.g. a tool-bound or structured model) under a cancel token."""
+
+    def __init__(self, token: CancelToken, inner: Runnable):
+        self.token = token
+        self.inner = inner
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return _run_bounded(self.token, lambda: self.inner.ainvoke(input, config, **kwargs))
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await _bounded(self.token, lambda: self.inner.ainvoke(input, config, **kwargs), None)
+
+
+class CancellableChatModel(BaseChatModel):
+    """Chat model whose requests are cancelled with the run.
+
+    Requests are sent with ``ainvoke`` on the background event loop shared
+    with hedging, so cancelling them closes the HTTP request instead of
+    leaving it running on a thread.
+
+    Attributes:
+        inner: The model requests go to
+        token: Cancel token of the run the requests belong to
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    inner: BaseChatModel
+    token: CancelToken
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return CancellableRunnable(self.token, self.inner.bind_tools(tools, **kwargs))
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        return CancellableRunnable(self.token, self.inner.with_structured_output(schema, **kwargs))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # The inner model is called without callbacks so usage is counted once
+        return _run_bounded(self.token, lambda: self.inner._agenerate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await _bounded(self.token, lambda: self.inner._agenerate(messages, stop=stop, **kwargs), None)
+
+
+def cancellable(model: BaseChatModel) -> BaseChatModel:
+    """Bind a model to the cancel token of the current run, if there is one."""
+    token = _active_token.get()
+    if token is None:
+        return model
+    return CancellableChatModel(inner=model, token=token)
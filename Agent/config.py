@@ -3,12 +3,16 @@
 import os
 import json
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 
 CONFIG_DIR = Path.home() / ".companio"
 CONFIG_FILE = CONFIG_DIR / "config.json"
 
+# Generated projects are stored in the current working directory
+# This ensures the generated_project directory is in the same location as main.py
+PROJECT_ROOT = Path.cwd() / "generated_project"
+
 
 def ensure_config_dir():
     """Ensure the configuration directory exists."""
@@ -41,8 +45,13 @@ def save_config(config: Dict[str, Any]) -> None:
     """
     ensure_config_dir()
     
-    with open(CONFIG_FILE, 'w') as f:
+    # The file holds API key secrets, so only the owner may read it
+    tmp = CONFIG_FILE.with_suffix(".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
         json.dump(config, f, indent=2)
+    os.chmod(tmp, 0o600)
+    os.replace(tmp, CONFIG_FILE)
 
 
 def get_default_config() -> Dict[str, Any]:
@@ -101,14 +110,402 @@ def get_api_provider() -> str:
 def update_api_config(api_provider: str, api_key: str, model_name: str) -> None:
     """Update API configuration.
     
+    Other settings in the configuration file, such as key pools, are kept.
+    
     Args:
         api_provider: The API provider (google, openai, anthropic, etc.)
         api_key: The API key
         model_name: The model name
     """
-    config = {
+    config = load_config()
+    config.update({
         "api_provider": api_provider,
         "api_key": api_key,
         "model_name": model_name
-    }
+    })
     save_config(config)
+
+
+def get_key_pool(api_provider: Optional[str] = None) -> List[Dict[str, Optional[str]]]:
+    """Get the pool of API keys of a provider.
+    
+    Pools are stored in the local configuration file under ``key_pools``,
+    one list per provider, of keys or ``{"api_key", "base_url"}`` objects.
+    The configured ``api_key`` belongs to the pool of the configured
+    provider.
+    
+    Args:
+        api_provider: Provider name (default: the configured provider)
+        
+    Returns:
+        List of dictionaries with api_key and base_url (None: the provider's default endpoint)
+    """
+    config = load_config()
+    provider = api_provider or config.get("api_provider", "google")
+    entries = []
+    if provider == config.get("api_provider", "google") and config.get("api_key", "").strip():
+        entries.append({"api_key": config["api_key"].strip(), "base_url": None})
+    for entry in config.get("key_pools", {}).get(provider, []):
+        if isinstance(entry, str):
+            entry = {"api_key": entry}
+        if not isinstance(entry, dict) or not str(entry.get("api_key", "")).strip():
+            continue
+        item = {"api_key": str(entry["api_key"]).strip(), "base_url": entry.get("base_url") or None}
+        if item not in entries:
+            entries.append(item)
+    return entries
+
+
+def update_key_pool(api_provider: str, entries: List[Dict[str, Optional[str]]]) -> None:
+    """Replace the pooled keys of a provider in the local configuration file.
+    
+    Args:
+        api_provider: Provider name
+        entries: Dictionaries with api_key and an optional base_url
+    """
+    config = load_config()
+    pools = config.setdefault("key_pools", {})
+    pools[api_provider] = [
+        {key: value for key, value in entry.items() if key in ("api_key", "base_url") and value}
+        for entry in entries
+    ]
+    if not pools[api_provider]:
+        del pools[api_provider]
+    save_config(config)
+
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean feature flag from the environment."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def is_blob_store_enabled() -> bool:
+    """Check whether generated files are deduplicated through the blob store.
+    
+    Controlled by the COMPANIO_BLOB_STORE environment variable.
+    
+    Returns:
+        True if the content-addressed blob store is enabled
+    """
+    return _env_flag("COMPANIO_BLOB_STORE")
+
+
+def get_blob_link_mode() -> str:
+    """Get how blobs are materialized into project directories.
+    
+    Returns:
+        One of "auto" (reflink, else copy), "reflink", "hardlink" or "copy"
+        (COMPANIO_BLOB_LINK_MODE); "hardlink" makes project files read-only
+    """
+    return os.getenv("COMPANIO_BLOB_LINK_MODE", "auto").strip().lower() or "auto"
+
+
+def is_snapshots_enabled() -> bool:
+    """Check whether file writes are recorded in per-step project snapshots.
+    
+    Controlled by COMPANIO_SNAPSHOTS (default: enabled).
+    
+    Returns:
+        True if snapshots are recorded
+    """
+    return _env_flag("COMPANIO_SNAPSHOTS", default=True)
+
+
+def is_scaffolding_enabled() -> bool:
+    """Check whether boilerplate tasks are served from the local scaffold library.
+    
+    Enabled by default; set COMPANIO_SCAFFOLDS=0 to send every task to the LLM.
+    
+    Returns:
+        True if scaffolding is enabled
+    """
+    return _env_flag("COMPANIO_SCAFFOLDS", default=True)
+
+
+def _env_number(name: str, default, cast=float):
+    """Read a numeric setting from the environment, falling back on bad values."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+def get_task_cache_settings() -> Dict[str, Any]:
+    """Get settings of the similarity cache for coder tasks.
+    
+    Controlled by COMPANIO_TASK_CACHE (enable), COMPANIO_TASK_CACHE_DIR,
+    COMPANIO_TASK_CACHE_SKIP and COMPANIO_TASK_CACHE_DRAFT (similarity
+    thresholds) and COMPANIO_TASK_CACHE_MAX (entries kept before LRU eviction).
+    
+    Returns:
+        Dictionary with enabled, path, skip_threshold, draft_threshold and max_entries
+    """
+    return {
+        "enabled": _env_flag("COMPANIO_TASK_CACHE"),
+        "path": Path(os.getenv("COMPANIO_TASK_CACHE_DIR") or CONFIG_DIR / "task_cache"),
+        "skip_threshold": _env_number("COMPANIO_TASK_CACHE_SKIP", 0.95),
+        "draft_threshold": _env_number("COMPANIO_TASK_CACHE_DRAFT", 0.6),
+        "max_entries": _env_number("COMPANIO_TASK_CACHE_MAX", 1000, int),
+    }
+
+
+def is_plan_optimizer_enabled() -> bool:
+    """Check whether architect tasks are merged per file before coding.
+    
+    Enabled by default; set COMPANIO_PLAN_OPTIMIZER=0 to run tasks as emitted.
+    
+    Returns:
+        True if the plan optimization pass is enabled
+    """
+    return _env_flag("COMPANIO_PLAN_OPTIMIZER", default=True)
+
+
+def is_streaming_writes_enabled() -> bool:
+    """Check whether the coder streams file content to disk while it is generated.
+    
+    Controlled by the COMPANIO_STREAM_WRITES environment variable (default: on).
+    
+    Returns:
+        True if write_file tool calls are streamed into partial files
+    """
+    return _env_flag("COMPANIO_STREAM_WRITES", default=True)
+
+
+def get_coder_group_limits() -> Dict[str, int]:
+    """Get the limits for implementing related files in one coder session.
+    
+    COMPANIO_CODER_GROUP_TOKENS caps the estimated output tokens of a group
+    (0 disables grouping); COMPANIO_CODER_GROUP_FILES caps its size.
+    
+    Returns:
+        Dictionary with max_tokens and max_files
+    """
+    return {
+        "max_tokens": _env_number("COMPANIO_CODER_GROUP_TOKENS", 6000, int),
+        "max_files": _env_number("COMPANIO_CODER_GROUP_FILES", 4, int),
+    }
+
+
+def get_tool_concurrency() -> int:
+    """Get how many tool calls of one coder turn may run at the same time.
+    
+    Controlled by COMPANIO_TOOL_CONCURRENCY (default: 8, 1 runs them one by one).
+    
+    Returns:
+        The maximum number of concurrent tool calls
+    """
+    return max(1, _env_number("COMPANIO_TOOL_CONCURRENCY", 8, int))
+
+
+def get_transcript_settings() -> Dict[str, Any]:
+    """Get settings of the run transcript writer.
+    
+    Transcripts are enabled by default; set COMPANIO_TRANSCRIPTS=0 to turn
+    them off. COMPANIO_TRANSCRIPT_DIR sets where interactive runs are
+    recorded and COMPANIO_TRANSCRIPT_MAX_CHARS truncates long text fields.
+    
+    Returns:
+        Dictionary with enabled, path and max_field_chars
+    """
+    return {
+        "enabled": _env_flag("COMPANIO_TRANSCRIPTS", default=True),
+        "path": Path(os.getenv("COMPANIO_TRANSCRIPT_DIR") or Path.cwd() / "runs"),
+        "max_field_chars": _env_number("COMPANIO_TRANSCRIPT_MAX_CHARS", 200_000, int),
+    }
+
+
+def get_profiling_settings() -> Dict[str, Any]:
+    """Get settings of the per-node CPU and memory profiler.
+    
+    Profiling is off by default; set COMPANIO_PROFILE=1 (or pass
+    ``main.py --profile``) to enable it. COMPANIO_PROFILE_INTERVAL is the
+    stack sampling interval in seconds and COMPANIO_PROFILE_MEMORY=0 skips
+    the tracemalloc snapshots.
+    
+    Returns:
+        Dictionary with enabled, interval and trace_memory
+    """
+    return {
+        "enabled": _env_flag("COMPANIO_PROFILE"),
+        "interval": _env_number("COMPANIO_PROFILE_INTERVAL", 0.005),
+        "trace_memory": _env_flag("COMPANIO_PROFILE_MEMORY", default=True),
+    }
+
+
+def get_prompt_budgets() -> Dict[str, int]:
+    """Get the approximate token budgets of prompt sections.
+    
+    COMPANIO_PROMPT_PLAN_TOKENS caps the features and files of a plan in the
+    architect prompt; COMPANIO_PROMPT_FILE_TOKENS caps each existing file in
+    the coder prompt (the model can read the rest with read_file).
+    
+    Returns:
+        Dictionary with plan and file budgets
+    """
+    return {
+        "plan": _env_number("COMPANIO_PROMPT_PLAN_TOKENS", 1200, int),
+        "file": _env_number("COMPANIO_PROMPT_FILE_TOKENS", 3000, int),
+    }
+
+
+def get_planner_mode() -> str:
+    """Get which planner prompt and schema are used.
+    
+    "full" (default) asks for a detailed product plan; "lean" asks only for
+    the fields downstream nodes consume plus a one-line UI direction, which
+    cuts the planner's output tokens (COMPANIO_PLANNER_MODE).
+    
+    Returns:
+        "full" or "lean"
+    """
+    mode = os.getenv("COMPANIO_PLANNER_MODE", "full").strip().lower()
+    return mode if mode in ("full", "lean") else "full"
+
+
+def get_fast_path_settings() -> Dict[str, Any]:
+    """Get settings of the single-shot fast path for small apps.
+    
+    Enabled by default; set COMPANIO_FAST_PATH=0 to send every request
+    through the planner, architect and coder. Requests whose complexity
+    score is at most COMPANIO_FAST_PATH_MAX_SCORE are generated in one call
+    of at most COMPANIO_FAST_PATH_MAX_FILES files.
+    
+    Returns:
+        Dictionary with enabled, max_score and max_files
+    """
+    return {
+        "enabled": _env_flag("COMPANIO_FAST_PATH", default=True),
+        "max_score": _env_number("COMPANIO_FAST_PATH_MAX_SCORE", 2, int),
+        "max_files": max(1, _env_number("COMPANIO_FAST_PATH_MAX_FILES", 6, int)),
+    }
+
+
+def get_structured_output_retries() -> int:
+    """Get how many targeted re-asks may repair invalid structured output.
+    
+    Controlled by COMPANIO_REPAIR_RETRIES (default: 2, 0 keeps local repair only).
+    
+    Returns:
+        The retry budget per planner or architect call
+    """
+    return max(0, _env_number("COMPANIO_REPAIR_RETRIES", 2, int))
+
+
+def get_hedging_settings() -> Dict[str, Any]:
+    """Get settings of hedged LLM requests.
+    
+    Hedging is off by default; set COMPANIO_HEDGE=1 to enable it. A request
+    is duplicated once it runs longer than COMPANIO_HEDGE_PERCENTILE of the
+    recent latencies (after COMPANIO_HEDGE_MIN_SAMPLES calls, or after
+    COMPANIO_HEDGE_INITIAL_DELAY seconds before that). COMPANIO_HEDGE_MAX_RATE
+    caps the share of hedged calls. The duplicate goes to the configured
+    model unless COMPANIO_HEDGE_PROVIDER, COMPANIO_HEDGE_MODEL and
+    COMPANIO_HEDGE_API_KEY name a secondary one.
+    
+    Returns:
+        Dictionary with enabled, percentile, min_samples, initial_delay,
+        max_hedge_rate, provider, model and api_key
+    """
+    initial_delay = _env_number("COMPANIO_HEDGE_INITIAL_DELAY", 0.0)
+    return {
+        "enabled": _env_flag("COMPANIO_HEDGE"),
+        "percentile": _env_number("COMPANIO_HEDGE_PERCENTILE", 90.0),
+        "min_samples": _env_number("COMPANIO_HEDGE_MIN_SAMPLES", 5, int),
+        "initial_delay": initial_delay if initial_delay > 0 else None,
+        "max_hedge_rate": _env_number("COMPANIO_HEDGE_MAX_RATE", 0.25),
+        "provider": os.getenv("COMPANIO_HEDGE_PROVIDER", "").strip().lower() or None,
+        "model": os.getenv("COMPANIO_HEDGE_MODEL", "").strip() or None,
+        "api_key": os.getenv("COMPANIO_HEDGE_API_KEY", "").strip() or None,
+    }
+
+
+def get_key_cooldown() -> float:
+    """Get how long a throttled pooled key is left out when the provider names no delay.
+    
+    Returns:
+        COMPANIO_KEY_COOLDOWN in seconds (default: 30)
+    """
+    return max(0.0, _env_number("COMPANIO_KEY_COOLDOWN", 30.0))
+
+
+def get_daemon_socket() -> Path:
+    """Get the Unix socket the warm daemon listens on.
+    
+    Returns:
+        COMPANIO_DAEMON_SOCKET, or ~/.companio/daemon.sock
+    """
+    path = os.getenv("COMPANIO_DAEMON_SOCKET", "").strip()
+    return Path(path).expanduser() if path else CONFIG_DIR / "daemon.sock"
+
+
+def get_batch_api_settings() -> Dict[str, Any]:
+    """Get settings of the provider batch-API mode.
+    
+    Batch mode is off by default; set COMPANIO_BATCH_API=1 (or pass
+    ``--batch-api`` to ``main.py --batch``) to send every LLM call through the
+    provider's batch endpoint. Requests are submitted once none arrived for
+    COMPANIO_BATCH_FLUSH_SECONDS or COMPANIO_BATCH_MAX_REQUESTS are waiting,
+    and batch status is checked every COMPANIO_BATCH_POLL_SECONDS.
+    COMPANIO_BATCH_BASE_URL points at another OpenAI-compatible batch API,
+    e.g. the local stand-in server of ``python -m Agent.batch``.
+    
+    Returns:
+        Dictionary with enabled, base_url, flush_seconds, poll_seconds,
+        max_requests and completion_window
+    """
+    return {
+        "enabled": _env_flag("COMPANIO_BATCH_API"),
+        "base_url": os.getenv("COMPANIO_BATCH_BASE_URL", "").strip() or None,
+        "flush_seconds": max(0.0, _env_number("COMPANIO_BATCH_FLUSH_SECONDS", 5.0)),
+        "poll_seconds": max(0.1, _env_number("COMPANIO_BATCH_POLL_SECONDS", 30.0)),
+        "max_requests": max(1, _env_number("COMPANIO_BATCH_MAX_REQUESTS", 50000, int)),
+        "completion_window": os.getenv("COMPANIO_BATCH_WINDOW", "").strip() or "24h",
+    }
+
+
+def get_task_queue_settings() -> Dict[str, Any]:
+    """Get settings of the shared queue that distributes coder tasks to workers.
+    
+    The queue is off by default. Set COMPANIO_TASK_QUEUE to the path of a
+    SQLite database that the controller and every ``main.py --worker`` can
+    reach to publish coder tasks instead of running them in-process. A
+    worker holds a claimed task for COMPANIO_TASK_LEASE_SECONDS and renews
+    the lease while it works; tasks of workers that stop renewing are handed
+    out again, at most COMPANIO_TASK_MAX_ATTEMPTS times. Workers look for
+    tasks every COMPANIO_TASK_POLL_SECONDS. Tasks still unfinished after
+    COMPANIO_TASK_TIMEOUT seconds (0: wait indefinitely) are withdrawn and
+    coded by the controller itself.
+    
+    Returns:
+        Dictionary with enabled, path, lease_seconds, max_attempts,
+        poll_seconds and timeout
+    """
+    path = os.getenv("COMPANIO_TASK_QUEUE", "").strip()
+    return {
+        "enabled": bool(path),
+        "path": Path(path).expanduser() if path else None,
+        "lease_seconds": max(1.0, _env_number("COMPANIO_TASK_LEASE_SECONDS", 60.0)),
+        "max_attempts": max(1, _env_number("COMPANIO_TASK_MAX_ATTEMPTS", 3, int)),
+        "poll_seconds": max(0.05, _env_number("COMPANIO_TASK_POLL_SECONDS", 1.0)),
+        "timeout": max(0.0, _env_number("COMPANIO_TASK_TIMEOUT", 3600.0)),
+    }
+
+
+def get_run_deadline() -> Optional[float]:
+    """Get the wall-time budget of a run.
+    
+    Runs are unbounded by default; set COMPANIO_RUN_DEADLINE (or pass
+    ``main.py --deadline``) to stop a run after that many seconds. The
+    deadline counts from when the run starts, not from when it was queued.
+    
+    Returns:
+        The deadline in seconds, or None for no deadline
+    """
+    seconds = _env_number("COMPANIO_RUN_DEADLINE", 0.0)
+    return seconds if seconds > 0 else None
@@ -0,0 +1,337 @@
+"""Warm daemon that runs agent jobs for thin command line clients.
+
+Every ``python main.py`` used to import LangChain, LangGraph and the
+provider SDKs, compile the graph and build the LLM client before doing any
+work. ``AgentDaemon`` does that once and then accepts runs over a local
+Unix socket, queueing them on a shared ``JobManager`` so that the compiled
+graph and the model client (with its connection pool) are reused.
+
+The protocol is newline-delimited JSON. A client sends one request::
+
+    {"action": "run", "prompt": ..., "recursion_limit": 100,
+     "project_dir": "/abs/path", "revise": false, "deadline": 300}
+    {"action": "ping"}
+
+and receives ``{"type": "accepted", "job_id": ...}``, one
+``{"type": "event", "event": {...}}`` line per job event, and finally
+``{"type": "result", "job": {...}}`` (or ``{"type": "error", ...}``).
+Closing the connection cancels the job.
+
+This module only imports the standard library at module level, so the
+client side starts in a fraction of a second::
+
+    python main.py --daemon &                       # start the warm process
+    echo "A todo app" | python main.py --client     # dispatch a run to it
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import socket
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .config import get_daemon_socket
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUEST_BYTES = 1024 * 1024
+# How long a connection waits for new job events before checking the client
+EVENT_POLL_SECONDS = 0.5
+
+
+class DaemonError(RuntimeError):
+    """Raised by the client when the daemon is unreachable or rejects a request."""
+
+
+class AgentDaemon:
+    """Serves agent runs on a Unix socket on top of a shared job manager."""
+
+    def __init__(self, manager, socket_path: Optional[pathlib.Path] = None):
+        self.manager = manager
+        self.socket_path = pathlib.Path(socket_path or get_daemon_socket())
+        self.started_at = time.time()
+
+    async def serve(self) -> None:
+        """Start listening and serve until cancelled.
+
+        Raises:
+            DaemonError: If another daemon already listens on the socket
+        """
+        if ping(self.socket_path) is not None:
+            raise DaemonError(f"A daemon is already listening on {self.socket_path}")
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # A socket file left behind by a daemon that died
+        self.socket_path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(
+            self.handle_connection, path=str(self.socket_path), limit=MAX_REQUEST_BYTES
+        )
+        # Runs write wherever the client asks, so only the owner may connect
+        os.chmod(self.socket_path, 0o600)
+        logger.info(f"Agent daemon listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.socket_path.unlink(missing_ok=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle one request and stream its responses."""
+        try:
+            try:
+                request = json.loads(await reader.readline())
+            except (ValueError, asyncio.LimitOverrunError) as e:
+                await _send(writer, {"type": "error", "error": f"Invalid request: {e}"})
+                return
+            if not isinstance(request, dict):
+                await _send(writer, {"type": "error", "error": "Invalid request: expected a JSON object"})
+                return
+            action = request.get("action", "run")
+            if action == "ping":
+                await _send(writer, {
+                    "type": "pong",
+                    "pid": os.getpid(),
+                    "uptime": time.time() - self.started_at,
+                    "pending": self.manager.pending_count(),
+                })
+            elif action == "run":
+                await self._run(request, reader, writer)
+            else:
+                await _send(writer, {"type": "error", "error": f"Unknown action: {action}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _run(self, request: Dict[str, Any], reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        from .jobs import JobQueueFull
+
+        try:
+            recursion_limit = int(request.get("recursion_limit", 100))
+            if not 1 <= recursion_limit <= 1000:
+                raise ValueError("Recursion limit must be between 1 and 1000")
+            project_dir = request.get("project_dir")
+            if project_dir is not None and not pathlib.Path(project_dir).is_absolute():
+                raise ValueError("project_dir must be an absolute path")
+            deadline = request.get("deadline")
+            if deadline is not None and not float(deadline) > 0:
+                raise ValueError("deadline must be a positive number of seconds")
+            job = self.manager.submit(
+                str(request.get("prompt", "")),
+                recursion_limit=recursion_limit,
+                workspace=pathlib.Path(project_dir) if project_dir is not None else None,
+                revise=bool(request.get("revise")),
+                deadline=float(deadline) if deadline is not None else None,
+            )
+        except (ValueError, TypeError, JobQueueFull) as e:
+            await _send(writer, {"type": "error", "error": str(e)})
+            return
+        await _send(writer, {"type": "accepted", "job_id": job.job_id})
+
+        # The client sends nothing after its request, so EOF means it went away
+        disconnected = asyncio.ensure_future(reader.read())
+        cursor = 0
+        try:
+            while True:
+                finished = job.status.finished
+                events, cursor = await asyncio.to_thread(
+                    self.manager.events_since, job.job_id, cursor, EVENT_POLL_SECONDS
+                )
+                for event in events:
+                    await _send(writer, {"type": "event", "event": event})
+                if finished:
+                    break
+                if disconnected.done():
+                    raise ConnectionResetError("client disconnected")
+            await _send(writer, {"type": "result", "job": job.to_dict()})
+        except ConnectionError:
+            if self.manager.cancel(job.job_id):
+                logger.info(f"Client of job {job.job_id} disconnected; job cancelled")
+        finally:
+            disconnected.cancel()
+
+
+async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]) -> None:
+    writer.write(json.dumps(message, default=str).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+def warm_up() -> None:
+    """Import and compile the graph and build the model client ahead of the first run."""
+    from .graph import agent, get_llm  # noqa: F401  (compiles the graph)
+
+    try:
+        get_llm()
+    except Exception as e:
+        logger.warning(f"Model client not initialized yet ({e}); it is created on the first run")
+
+
+def serve_daemon(socket_path: Optional[pathlib.Path] = None, workers: int = 2, max_pending: Optional[int] = None) -> None:
+    """Warm up and serve runs on ``socket_path`` until interrupted.
+
+    Args:
+        socket_path: Unix socket to listen on (default: ``get_daemon_socket()``)
+        workers: Concurrent generation jobs
+        max_pending: Maximum queued jobs before rejecting new ones
+
+    Raises:
+        DaemonError: If Unix sockets are unsupported or a daemon is already running
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonError("Daemon mode needs Unix domain sockets, which this platform lacks")
+    from langchain_core.globals import set_debug, set_verbose
+    from .jobs import JobManager
+
+    started = time.perf_counter()
+    warm_up()
+    # Debug tracing would flood the daemon's output with every run
+    set_debug(False)
+    set_verbose(False)
+    logger.info(f"Warmed up in {time.perf_counter() - started:.2f}s")
+
+    manager = JobManager(max_workers=workers, max_pending=max_pending)
+    try:
+        asyncio.run(AgentDaemon(manager, socket_path).serve())
+    except KeyboardInterrupt:
+        logger.info("Daemon stopped by user.")
+    finally:
+        manager.shutdown(wait=False)
+
+
+@contextlib.contextmanager
+def _connect(socket_path: pathlib.Path, timeout: Optional[float] = None) -> Iterator[socket.socket]:
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonError("Daemon mode needs Unix domain sockets, which this platform lacks")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonError(
+                f"No daemon listening on {socket_path} ({e.strerror}); start one with: python main.py --daemon"
+            ) from e
+        yield sock
+    finally:
+        sock.close()
+
+
+def _messages(sock: socket.socket) -> Iterator[Dict[str, Any]]:
+    with sock.makefile("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def ping(socket_path: Optional[pathlib.Path] = None, timeout: float = 2.0) -> Optional[Dict[str, Any]]:
+    """Return the daemon's status, or None if no daemon answers on the socket."""
+    path = pathlib.Path(socket_path or get_daemon_socket())
+    try:
+        with _connect(path, timeout) as sock:
+            sock.sendall(b'{"action": "ping"}\n')
+            return next(_messages(sock), None)
+    except (DaemonError, OSError, ValueError):
+        return None
+
+
+def submit_to_daemon(
+    prompt: str,
+    recursion_limit: int = 100,
+    project_dir: Optional[pathlib.Path] = None,
+    revise: bool = False,
+    socket_path: Optional[pathlib.Path] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run a prompt on the daemon and wait for the result.
+
+    Args:
+        prompt: The user's project description
+        recursion_limit: Recursion limit for the graph
+        project_dir: Directory to generate into (default: a daemon workspace)
+        revise: Revise the project already in ``project_dir``
+        socket_path: Daemon socket (default: ``get_daemon_socket()``)
+        on_event: Called with each job event as it arrives; the first call
+            comes with ``{"type": "accepted", "job_id": ...}``
+        deadline: Seconds the run may take once started (default: the
+            daemon's COMPANIO_RUN_DEADLINE)
+
+    Returns:
+        The finished job as a dictionary (see ``Job.to_dict``)
+
+    Raises:
+        DaemonError: If no daemon answers, it rejects the request or the
+            connection drops before the result
+    """
+    path = pathlib.Path(socket_path or get_daemon_socket())
+    request = {
+        "action": "run",
+        "prompt": prompt,
+        "recursion_limit": recursion_limit,
+        "project_dir": str(pathlib.Path(project_dir).resolve()) if project_dir is not None else None,
+        "revise": revise,
+        "deadline": deadline,
+    }
+    with _connect(path) as sock:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        for message in _messages(sock):
+            kind = message.get("type")
+            if kind == "error":
+                raise DaemonError(message.get("error", "request rejected"))
+            if kind == "result":
+                return message["job"]
+            if on_event is not None:
+                on_event(message if kind == "accepted" else message.get("event", {}))
+    raise DaemonError("Daemon closed the connection before the job finished")
+
+
+def format_event(event: Dict[str, Any]) -> Optional[str]:
+    """Render a job event as a one-line progress message, or None to skip it."""
+    kind = event.get("type")
+    if kind == "accepted":
+        return f"Job {event['job_id']} accepted"
+    if kind == "node":
+        progress = f" ({event['completed_tasks']}/{event['total_tasks']} tasks)" if "total_tasks" in event else ""
+        return f"[{event['node']}]{progress}"
+    if kind == "status":
+        return f"Status: {event['status']}" + (f" ({event['error']})" if event.get("error") else "")
+    if kind == "file_written":
+        return f"Wrote {event['path']} ({event['bytes']} bytes)"
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the warm agent daemon on a Unix socket")
+    parser.add_argument("--socket", type=pathlib.Path, default=None, help="Socket path (default: ~/.companio/daemon.sock)")
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent generation jobs (default: 2)")
+    parser.add_argument("--max-queue", type=int, default=16, help="Maximum queued jobs before rejecting (default: 16)")
+    parser.add_argument("--stand-in", action="store_true", help="Use the offline stand-in model instead of the configured provider")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.stand_in:
+        from . import graph
+        from .stand_in import StandInChatModel
+        graph.llm = StandInChatModel()
+
+    try:
+        serve_daemon(args.socket, args.workers, args.max_queue)
+    except DaemonError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
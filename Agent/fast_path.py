@@ -0,0 +1,176 @@
+"""Fast path that builds small apps in a single LLM call.
+
+A request like "a single-page tip calculator" does not need a planner, an
+architect and one coder session per file. ``classify_request`` scores a
+request locally from its length, the number of features it lists and words
+that point at a backend, accounts or several screens. Requests that score
+low enough are generated as one ``FileBundle`` by the ``fast_path`` node of
+the graph and written in one bulk write.
+
+``validate_bundle`` checks the bundle before anything is written: the file
+count, safe and unique paths, non-empty content, an entry point, parseable
+JSON, complete HTML documents and local references that resolve. If the
+call or the validation fails, the request falls back to the full graph.
+"""
+
+import json
+import posixpath
+import re
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Tuple
+
+from .states import FileBundle, ImplementationTask, Plan
+
+# Words that point at more than one self-contained screen, with their weight
+_COMPLEX_SIGNALS = {
+    r"auth\w*|log ?in|sign ?(up|in)|accounts?|user roles?|profiles?": 2,
+    r"back ?end|server|database|\bdb\b|api|graphql|rest\b|persist\w*|sync\w*": 3,
+    r"dashboards?|admin|analytics|reports?": 2,
+    r"payments?|checkout|subscriptions?|e-?commerce|marketplace|cart": 3,
+    r"real-?time|chat|multiplayer|collaborat\w*|notifications?|social|feeds?": 3,
+    r"routing|router|multiple pages|multi-?page|pages": 2,
+    r"uploads?|drag and drop|drag-and-drop|charts?|maps?|calendars?|search|filters?": 1,
+    r"teams?|workspaces?|permissions?|i18n|internationali\w*": 1,
+}
+# Words that point at a small, self-contained app
+_SIMPLE_SIGNALS = (
+    r"single[- ]page|one[- ]page|simple|basic|minimal|tiny|small|static|landing page|"
+    r"calculator|converter|counter|timer|stopwatch|countdown|clock|quiz|dice|coin|"
+    r"color picker|random quote|to-?do"
+)
+# Separators between listed features
+_FEATURE_SEPARATORS = re.compile(r",|;|\band\b|\bwith\b|\bplus\b|\balso\b")
+# Local references of HTML files: src="..." and href="..."
+_HTML_REFERENCES = re.compile(r"""\b(?:src|href)\s*=\s*["']([^"'#?]+)["']""", re.IGNORECASE)
+_ENTRY_POINTS = {"index.html", "package.json", "main.py", "app.py"}
+
+
+@dataclass
+class Complexity:
+    """Outcome of classifying a request."""
+    score: int
+    simple: bool
+    signals: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def classify_request(user_prompt: str, max_score: int = 2) -> Complexity:
+    """Score how complex a request is, without calling a model.
+
+    Every signal of a backend, accounts, integrations or several screens
+    adds its weight, every listed feature beyond the second adds one, and so
+    does every 20 words of length. Words such as "simple" or "calculator"
+    take one off.
+
+    Args:
+        user_prompt: The user's project description
+        max_score: Highest score still treated as a small app
+
+    Returns:
+        The score, whether the request is small, and the signals found
+    """
+    text = " ".join(user_prompt.lower().split())
+    score = 0
+    signals = []
+    for pattern, weight in _COMPLEX_SIGNALS.items():
+        match = re.search(rf"\b(?:{pattern})", text)
+        if match:
+            score += weight
+            signals.append(match.group())
+    features = len(_FEATURE_SEPARATORS.findall(text)) + 1
+    if features > 2:
+        score += features - 2
+        signals.append(f"{features} features")
+    words = len(text.split())
+    if words >= 20:
+        score += words // 20
+        signals.append(f"{words} words")
+    simple = re.search(rf"\b(?:{_SIMPLE_SIGNALS})", text)
+    if simple:
+        score -= 1
+        signals.append(simple.group())
+    return Complexity(score=max(score, 0), simple=score <= max_score, signals=signals)
+
+
+def validate_bundle(bundle: FileBundle, max_files: int) -> List[str]:
+    """Check a generated bundle before it is written.
+
+    Args:
+        bundle: Files from single-shot generation
+        max_files: Most files the bundle may have
+
+    Returns:
+        A message for every problem found; empty if the bundle is usable
+    """
+    problems = []
+    if not bundle.files:
+        return ["no files were generated"]
+    if len(bundle.files) > max_files:
+        problems.append(f"{len(bundle.files)} files, more than {max_files}")
+    paths = {}
+    for file in bundle.files:
+        path = posixpath.normpath(file.path.strip().replace("\\", "/"))
+        if file.path.startswith("/") or path.startswith("..") or path in (".", ""):
+            problems.append(f"{file.path}: path outside the project")
+            continue
+        if any(part.startswith(".") for part in path.split("/")[:-1]):
+            problems.append(f"{file.path}: path inside a hidden directory")
+            continue
+        if path in paths:
+            problems.append(f"{path}: generated twice")
+        if not file.content.strip():
+            problems.append(f"{path}: empty content")
+        paths[path] = file.content
+    if not any(posixpath.basename(path) in _ENTRY_POINTS for path in paths):
+        problems.append(f"no entry point ({', '.join(sorted(_ENTRY_POINTS))})")
+
+    for path, content in paths.items():
+        extension = posixpath.splitext(path)[1].lower()
+        if extension == ".json":
+            try:
+                json.loads(content)
+            except ValueError as e:
+                problems.append(f"{path}: invalid JSON ({e})")
+        elif extension in (".html", ".htm"):
+            lowered = content.lower()
+            if "<html" in lowered and "</html>" not in lowered:
+                problems.append(f"{path}: truncated HTML document")
+            for reference in _HTML_REFERENCES.findall(content):
+                if re.match(r"^(?:[a-z][a-z0-9+.-]*:|//)", reference, re.IGNORECASE):
+                    continue  # Absolute URLs, data: and mailto: links
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(path), reference.lstrip("/")))
+                if target not in paths and reference.rstrip("/") not in ("", "."):
+                    problems.append(f"{path}: references missing file {reference}")
+    return problems
+
+
+def bundle_files(bundle: FileBundle) -> Dict[str, str]:
+    """Return the content of every file of a validated bundle by normalized path."""
+    return {posixpath.normpath(f.path.strip().replace("\\", "/")): f.content for f in bundle.files}
+
+
+def bundle_plan(bundle: FileBundle, user_prompt: str) -> Tuple[Plan, List[ImplementationTask]]:
+    """Build the plan and tasks stored with a fast-path project, so that it can be revised.
+
+    Args:
+        bundle: Validated bundle
+        user_prompt: The request the bundle was generated for
+
+    Returns:
+        A (Plan, implementation tasks) pair with one task per file
+    """
+    paths = list(bundle_files(bundle))
+    plan = Plan(
+        name=bundle.name,
+        description=bundle.description,
+        techstack=bundle.techstack,
+        features=[" ".join(user_prompt.split())],
+        files=paths,
+    )
+    tasks = [
+        ImplementationTask(filepath=path, task_description=f"Implement {path} for: {' '.join(user_prompt.split())}")
+        for path in paths
+    ]
+    return plan, tasks
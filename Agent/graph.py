@@ -1,20 +1,48 @@
-from typing import TypedDict, List
+from typing import Any, Dict, TypedDict, List, Optional, Tuple
 from langchain_groq import ChatGroq
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_core.globals import set_verbose, set_debug
+from langchain_core.runnables.config import ensure_config, merge_configs
 from langchain.agents import create_agent
 from langgraph.graph import StateGraph, END
 from dotenv import load_dotenv
+import logging
+import threading
+import time
+import uuid
 
-from .prompts import planner_prompt, architect_prompt, coder_system_prompt
-from .states import Plan, TaskPlan, CoderState
-from .tools import read_file, write_file, list_files, get_current_directory, init_project_root
-from .config import get_api_provider, get_api_key, get_model_name
+from .prompts import planner_prompt, lean_planner_prompt, fast_path_prompt, architect_prompt, coder_system_prompt, coder_task_prompt
+from .prompt_compiler import render_file_context
+from .states import Plan, LeanPlan, TaskPlan, CoderState, FileBundle, ImplementationTask
+from .tools import (
+    read_file, write_file, list_files, get_current_directory, init_project_root, get_project_root,
+    discard_streamed_files, commit_snapshot, emit_event, write_project_files,
+)
+from .cancellation import RunCancelled, cancellable, check_cancelled
+from .config import (
+    get_api_provider, get_api_key, get_model_name, get_key_pool, get_key_cooldown,
+    is_scaffolding_enabled, is_plan_optimizer_enabled, get_coder_group_limits, get_structured_output_retries,
+    get_hedging_settings, is_streaming_writes_enabled, get_prompt_budgets, get_planner_mode,
+    get_tool_concurrency, get_batch_api_settings, get_fast_path_settings, get_task_queue_settings,
+)
+from .fast_path import classify_request, validate_bundle, bundle_files, bundle_plan
+from .hedging import HedgedChatModel, HedgeStats
+from .key_pool import build_pooled_model
+from .metrics import ToolLatencyCallback
+from .plan_optimizer import optimize_tasks, companion_group_size, normalize_filepath, task_references
+from .repair import invoke_structured
+from .revision import diff_task_plans, select_revision_tasks, project_files, save_revision
+from .scaffolds import scaffold_for_task
+from .streaming import StreamingWriteCallback
+from .task_cache import get_task_cache
+from .task_queue import DONE, get_task_queue, project_context, coder_payload
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 set_debug(True)
 set_verbose(True)
 
@@ -22,46 +50,132 @@ set_verbose(True)
 init_project_root()
 
 
-def initialize_llm():
-    """Initialize the LLM based on configuration.
+def _build_chat_model(api_provider: str, api_key: str, model_name: str, base_url: str = None, max_retries: int = None):
+    """Create the chat model client for a provider.
     
+    Args:
+        api_provider: Provider name (openai, anthropic, google, llama, qwen, deepseek)
+        api_key: API key for the provider
+        model_name: Model to use
+        base_url: Endpoint to use instead of the provider's default
+        max_retries: Retries of the provider SDK (default: the SDK's own)
+        
     Returns:
-        Initialized language model instance
+        Chat model instance
     """
-    api_provider = get_api_provider()
-    api_key = get_api_key()
-    model_name = get_model_name()
-    
+    options = {}
+    if base_url:
+        options["base_url"] = base_url
+    if max_retries is not None:
+        options["max_retries"] = max_retries
     if api_provider == "openai":
-        return ChatOpenAI(api_key=api_key, model=model_name)
+        return ChatOpenAI(api_key=api_key, model=model_name, stream_usage=True, **options)
     elif api_provider == "anthropic":
-        return ChatAnthropic(api_key=api_key, model=model_name)
+        return ChatAnthropic(api_key=api_key, model=model_name, **options)
     elif api_provider == "google":
-        return ChatGoogleGenerativeAI(api_key=api_key, model=model_name)
+        return ChatGoogleGenerativeAI(api_key=api_key, model=model_name, **options)
     elif api_provider == "llama":
         # Llama via Groq or Together AI
-        return ChatGroq(api_key=api_key, model=model_name)
+        return ChatGroq(api_key=api_key, model=model_name, **options)
     elif api_provider == "qwen":
         # Qwen models via OpenAI-compatible API
         return ChatOpenAI(
             api_key=api_key,
             model=model_name,
-            base_url="https://api.openai.com/v1"  # Can be customized for Qwen endpoint
+            **{"base_url": "https://api.openai.com/v1", **options},  # Can be customized for Qwen endpoint
+            stream_usage=True,
         )
     elif api_provider == "deepseek":
         # Deepseek models via OpenAI-compatible API
         return ChatOpenAI(
             api_key=api_key,
             model=model_name,
-            base_url="https://api.deepseek.com/v1"
+            **{"base_url": "https://api.deepseek.com/v1", **options},
+            stream_usage=True,
         )
     else:
         # Default to Google
-        return ChatGoogleGenerativeAI(api_key=api_key, model=model_name)
+        return ChatGoogleGenerativeAI(api_key=api_key, model=model_name, **options)
+
+
+def _build_provider_model(api_provider: str, model_name: str, api_key: str = None):
+    """Create the chat model of a provider, spread over its pooled API keys.
+    
+    Args:
+        api_provider: Provider name
+        model_name: Model to use
+        api_key: Use only this key instead of the provider's key pool
+        
+    Returns:
+        Chat model instance, a ``PooledChatModel`` if the pool has several keys
+    """
+    entries = [{"api_key": api_key, "base_url": None}] if api_key else get_key_pool(api_provider)
+    if not entries:
+        entries = [{"api_key": get_api_key(), "base_url": None}]
+    # With several keys a throttled call moves on to another key instead of
+    # backing off inside the SDK
+    retries = 0 if len(entries) > 1 else None
+    if get_batch_api_settings()["enabled"]:
+        from .batch import build_batch_model
+        build = lambda key, base_url: build_batch_model(api_provider, key, model_name, base_url)
+    else:
+        build = lambda key, base_url: _build_chat_model(api_provider, key, model_name, base_url, retries)
+    return build_pooled_model(entries, build, get_key_cooldown())
+
 
+def initialize_llm():
+    """Initialize the LLM based on configuration.
+    
+    Returns:
+        Initialized language model instance, spread over the provider's
+        pooled API keys, wrapped for hedged requests if enabled, or
+        collecting its calls into provider batches in batch-API mode
+    """
+    model = _build_provider_model(get_api_provider(), get_model_name())
+    if get_batch_api_settings()["enabled"]:
+        # Batch calls wait for the whole batch, so there is no latency to hedge
+        return model
 
-# Initialize LLM with configured API
-llm = initialize_llm()
+    hedging = get_hedging_settings()
+    if not hedging["enabled"]:
+        return model
+
+    secondary = None
+    if hedging["provider"] or hedging["model"]:
+        secondary = _build_provider_model(
+            hedging["provider"] or get_api_provider(),
+            hedging["model"] or get_model_name(),
+            hedging["api_key"],
+        )
+    stats = HedgeStats(
+        percentile=hedging["percentile"],
+        min_samples=hedging["min_samples"],
+        initial_delay=hedging["initial_delay"],
+        max_hedge_rate=hedging["max_hedge_rate"],
+    )
+    logger.info(f"Hedged LLM requests enabled at p{hedging['percentile']:g} latency")
+    return HedgedChatModel(primary=model, secondary=secondary, stats=stats)
+
+
+# LLM with configured API, created on first use so that importing the graph
+# does not require credentials (e.g. when a stand-in model is injected)
+llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Return the shared LLM, initializing it from the configuration if needed.
+
+    Inside a run with a cancel token, the model is bound to that token so
+    that its requests end with the run (see cancellation.py).
+    """
+    global llm
+    if llm is None:
+        # Concurrent jobs must share one client (and, in batch-API mode, one collector)
+        with _llm_lock:
+            if llm is None:
+                llm = initialize_llm()
+    return cancellable(llm)
 
 
 class AgentState(TypedDict):
@@ -70,75 +184,456 @@ class AgentState(TypedDict):
     project_plan: Plan
     architect_plan: List[str]  # List of implementation tasks
     coder_state: CoderState
+    plan_report: Dict[str, Any]  # What the plan optimizer changed
+    project_tasks: List[str]  # All tasks of the project, including those a revision skips
+    previous_prompt: str  # Revise mode: request the project was generated from
+    previous_plan: Plan  # Revise mode: stored plan of the project
+    previous_tasks: List[str]  # Revise mode: stored tasks of the project
+    revision_report: Dict[str, Any]  # Revise mode: which files are regenerated
+    fast_path_report: Dict[str, Any]  # How the fast path classified the request and whether it was used
     status: str  # Tracking agent status
 
+# Planner mode -> (prompt template, output schema)
+PLANNER_MODES = {
+    "full": (planner_prompt, Plan),
+    "lean": (lean_planner_prompt, LeanPlan),
+}
+
+def fast_path_agent(state: AgentState) -> AgentState:
+    """Generate a small app in one call, or leave the request to the full pipeline."""
+
+    check_cancelled()
+    settings = get_fast_path_settings()
+    user_input = state.get("user_prompt", "").strip()
+    # Revisions regenerate only affected files, which needs the full pipeline
+    if not settings["enabled"] or not user_input or state.get("previous_tasks"):
+        return state
+    complexity = classify_request(user_input, settings["max_score"])
+    report: Dict[str, Any] = {"complexity": complexity.to_dict(), "used": False}
+    state["fast_path_report"] = report
+    if not complexity.simple:
+        return state
+
+    logger.info(f"Fast path: complexity {complexity.score} ({', '.join(complexity.signals) or 'no signals'}), generating in one call")
+    try:
+        bundle, _ = invoke_structured(
+            get_llm(), FileBundle, fast_path_prompt(user_input, settings["max_files"]), get_structured_output_retries()
+        )
+        problems = validate_bundle(bundle, settings["max_files"])
+        if not problems:
+            plan, tasks = bundle_plan(bundle, user_input)
+            files = bundle_files(bundle)
+    except RunCancelled:
+        raise
+    except Exception as e:
+        problems = [f"generation failed: {e}"]
+    if problems:
+        report["fallback"] = problems
+        logger.warning(f"Fast path output rejected, falling back to the full pipeline: {'; '.join(problems)}")
+        emit_event("fast_path", used=False, problems=problems)
+        return state
+
+    written = write_project_files(files)
+    step = commit_snapshot("fast path: " + ", ".join(written))
+    if step is not None:
+        emit_event("snapshot", step=step, label=f"fast path: {len(written)} files")
+    report["used"] = True
+    report["files"] = len(written)
+    emit_event("fast_path", used=True, files=len(written))
+    state["project_plan"] = plan
+    state["architect_plan"] = tasks
+    state["project_tasks"] = tasks
+    state["coder_state"] = CoderState(
+        task_plan=TaskPlan(implementation_steps=tasks),
+        current_step_idx=len(tasks),
+        generated_files=len(tasks),
+        llm_sessions=1,
+    )
+    state["status"] = "DONE"
+    _save_project_plan(state)
+    return state
+
+def _route_after_fast_path(state: AgentState) -> str:
+    """Finish after a fast-path build, otherwise plan the project."""
+    return "END" if (state.get("fast_path_report") or {}).get("used") else "planner"
+
 def planner_agent(state: AgentState) -> AgentState:
     """Convert the user prompt into a COMPLETE engineering project plan."""
 
+    check_cancelled()
     user_input = state.get("user_prompt", "").strip()
     if not user_input:
         raise ValueError("User prompt cannot be empty.")
     
-    response = llm.with_structured_output(Plan).invoke(planner_prompt(user_input))
-    if response is None:
-        raise ValueError("Planner did not return a valid response.")
+    prompt_template, schema = PLANNER_MODES[get_planner_mode()]
+    prompt = prompt_template(user_input, state.get("previous_prompt"), state.get("previous_plan"))
+    response, _ = invoke_structured(get_llm(), schema, prompt, get_structured_output_retries())
     state["project_plan"] = response
     return state
 
 def architect_agent(state: AgentState) -> AgentState:
     """Break down the project plan into explicit engineering tasks."""
 
+    check_cancelled()
     if not isinstance(state.get("project_plan"), Plan):
         raise ValueError("Invalid project plan from planner agent.")
     
-    response = llm.with_structured_output(TaskPlan).invoke(architect_prompt(state["project_plan"]))
-    if response is None:
-        raise ValueError("Architect did not return a valid response.")
+    response, _ = invoke_structured(
+        get_llm(), TaskPlan, architect_prompt(state["project_plan"], state.get("previous_tasks")),
+        get_structured_output_retries()
+    )
     state["architect_plan"] = response.implementation_steps
     return state
 
+def plan_optimizer_agent(state: AgentState) -> AgentState:
+    """Merge tasks that target the same file and drop duplicate or no-op tasks."""
+
+    check_cancelled()
+    architect_plan = state.get("architect_plan", [])
+    if is_plan_optimizer_enabled() and architect_plan:
+        architect_plan, report = optimize_tasks(architect_plan)
+        logger.info(
+            f"Plan optimizer: {report.original_tasks} tasks -> {report.optimized_tasks} "
+            f"({report.merged_tasks} merged, {report.duplicate_tasks} duplicates, "
+            f"{report.noop_tasks} no-ops); saved {report.saved_invocations} coder invocations"
+        )
+        state["plan_report"] = report.to_dict()
+    state["architect_plan"] = architect_plan
+    state["project_tasks"] = architect_plan
+
+    # Revise mode: only files whose tasks changed, or that use changed files, are regenerated
+    if state.get("previous_tasks"):
+        diff = diff_task_plans(
+            state["previous_tasks"], architect_plan,
+            state.get("previous_plan"), state.get("project_plan"),
+            existing_files=project_files(get_project_root()),
+        )
+        state["architect_plan"] = select_revision_tasks(architect_plan, diff)
+        state["revision_report"] = diff.to_dict()
+        logger.info(
+            f"Revision: {len(diff.added)} files added, {len(diff.changed)} changed, "
+            f"{len(diff.dependents)} dependents, {len(diff.missing)} missing, {len(diff.removed)} removed; "
+            f"regenerating {len(state['architect_plan'])} of {len(architect_plan)} tasks"
+        )
+        if diff.removed:
+            logger.info(f"Files no longer in the plan are left in place: {diff.removed}")
+    return state
+
 def coder_agent(state: AgentState) -> AgentState:
     """Write complete code for the specific engineering task."""
 
+    check_cancelled()
     coder_state = state.get("coder_state")
     if coder_state is None:
         architect_plan = state.get("architect_plan", [])
-        if not architect_plan:
+        if not architect_plan and not state.get("previous_tasks"):
             raise ValueError("No architecture plan available for coder agent.")
         task_plan = TaskPlan(implementation_steps=architect_plan)
         coder_state = CoderState(task_plan=task_plan, current_step_idx=0)
 
     steps = coder_state.task_plan.implementation_steps
     
-    # Check if all tasks are completed
+    # Check if all tasks are completed (a revision may leave nothing to do)
     if coder_state.current_step_idx >= len(steps):
+        state["coder_state"] = coder_state
         state["status"] = "DONE"
+        _save_project_plan(state)
         return state
     
-    current_task = steps[coder_state.current_step_idx]
-    existing_content = read_file.invoke({"path": current_task.filepath})
-    
-    user_prompt = (
-        f"Task: {current_task.task_description}\n"
-        f"File: {current_task.filepath}\n"
-        f"Existing content:\n{existing_content}\n"
-        "Use write_file(path, content) to save your changes."
-    )
-    system_prompt = coder_system_prompt()
+    queue = get_task_queue()
+    if queue is not None:
+        return _code_on_workers(state, coder_state, queue)
+
+    plan = state.get("project_plan")
+    techstack = plan.techstack if isinstance(plan, Plan) else ""
+    task_cache = get_task_cache()
+    kind, group, value = _next_coder_unit(plan, steps, coder_state.current_step_idx, task_cache)
+    current_task = group[0]
+
+    # Standard boilerplate is rendered locally instead of costing an LLM round trip
+    if kind == "scaffold":
+        write_file.invoke({"path": current_task.filepath, "content": value})
+        logger.info(f"Scaffolded {current_task.filepath} from template")
+        coder_state.scaffolded_files += 1
+        _advance_coder(state, coder_state)
+        return state
+
+    # Reuse the output of a near-identical task from an earlier run
+    if kind == "cached":
+        write_file.invoke({"path": current_task.filepath, "content": value})
+        coder_state.cached_files += 1
+        _advance_coder(state, coder_state)
+        return state
+
+    if len(group) > 1:
+        logger.info(f"Coding {len(group)} companion files in one session: {[t.filepath for t in group]}")
+    run_coder_session(plan, group, value)
+    _cache_generated_files(task_cache, techstack, group)
+
+    coder_state.generated_files += len(group)
+    coder_state.llm_sessions += 1
+    _advance_coder(state, coder_state, len(group))
+    return state
+
+
+def _next_coder_unit(plan, steps: List[ImplementationTask], index: int, task_cache) -> Tuple[str, List[ImplementationTask], Any]:
+    """Decide how the task at ``index`` is implemented.
+
+    Returns:
+        ("scaffold", [task], content) for standard boilerplate,
+        ("cached", [task], content) for a file reused from the task cache, or
+        ("session", tasks, draft) for an LLM session over the task and its
+        companion files, with an optional (filepath, description, content)
+        draft from the task cache
+    """
+    current_task = steps[index]
+    scaffold = scaffold_for_task(plan, current_task) if is_scaffolding_enabled() else None
+    if scaffold is not None:
+        return "scaffold", [current_task], scaffold
+
+    techstack = plan.techstack if isinstance(plan, Plan) else ""
+    cache_hit = None
+    if task_cache is not None:
+        cache_hit = task_cache.lookup(techstack, current_task.filepath, current_task.task_description)
+    if cache_hit is not None and cache_hit.mode == "skip" and not read_file.invoke({"path": current_task.filepath}).strip():
+        return "cached", [current_task], cache_hit.content
+
+    # Companion files (component, styles, test, index) share one session
+    group = [current_task]
+    limits = get_coder_group_limits()
+    if limits["max_tokens"] > 0:
+        size = companion_group_size(steps, index, limits["max_tokens"], limits["max_files"])
+        for task in steps[index + 1:index + size]:
+            if is_scaffolding_enabled() and scaffold_for_task(plan, task) is not None:
+                break
+            group.append(task)
+    draft = None
+    if cache_hit is not None:
+        draft = (current_task.filepath, cache_hit.task_description, cache_hit.content)
+    return "session", group, draft
+
+
+def run_coder_session(plan, group: List[ImplementationTask], draft: Optional[Tuple[str, str, str]] = None) -> Dict[str, Any]:
+    """Run one coder LLM session that writes the files of a group of tasks.
+
+    The session works on the project root of the current context; queue
+    workers run it on a scratch copy of the project (see task_queue.py).
+
+    Args:
+        plan: The project plan, for the UI direction
+        group: The task and its companion tasks
+        draft: Optional (filepath, task description, content) of a similar cached file
+
+    Returns:
+        Tool call counts and latencies of the session
+    """
+    budget = get_prompt_budgets()["file"]
+    files = [
+        (task, render_file_context(task.filepath, read_file.invoke({"path": task.filepath}), budget))
+        for task in group
+    ]
+    user_prompt = coder_task_prompt(files, draft)
+    system_prompt = coder_system_prompt(getattr(plan, "ui_direction", ""))
 
     coder_tools = [read_file, write_file, list_files, get_current_directory]
-    react_agent = create_agent(llm, coder_tools)
-    react_agent.invoke({
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    })
-
-    coder_state.current_step_idx += 1
-    state["coder_state"] = coder_state
+    react_agent = create_agent(get_llm(), coder_tools)
+    # The tool calls of one turn run concurrently (file tools lock per path);
+    # each turn's wall time is reported against running its calls one by one
+    tool_latency = ToolLatencyCallback(on_turn=_report_tool_turn)
+    callbacks = [tool_latency]
+    if is_streaming_writes_enabled():
+        # Stream write_file content to disk while the model is still generating it
+        callbacks.append(StreamingWriteCallback())
+    config = merge_configs(ensure_config(), {"callbacks": callbacks, "max_concurrency": get_tool_concurrency()})
+    try:
+        react_agent.invoke({
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ]
+        }, config)
+    finally:
+        discard_streamed_files()
+    tools_summary = tool_latency.summary()
+    if tools_summary["calls"]:
+        logger.info(
+            f"Coder tools: {tools_summary['calls']} calls in {tools_summary['turns']} turns took "
+            f"{tools_summary['wall']:.3f}s ({tools_summary['sequential']:.3f}s if run one by one)"
+        )
+    return tools_summary
+
+
+def _cache_generated_files(task_cache, techstack: str, group: List[ImplementationTask]) -> None:
+    """Index the files a coder session wrote in the task cache."""
+    if task_cache is None:
+        return
+    for task in group:
+        generated = read_file.invoke({"path": task.filepath})
+        if generated and not generated.startswith("ERROR:"):
+            task_cache.add(techstack, task.filepath, task.task_description, generated)
+
+
+def _code_on_workers(state: AgentState, coder_state: CoderState, queue) -> AgentState:
+    """Publish the remaining coder sessions to the task queue and apply the files workers return.
+
+    Scaffolds and task cache hits are still written here. Sessions are
+    published in dependency waves: a session whose tasks mention files of an
+    earlier session, or rewrite one of them, is only published once that
+    session's files are in the project, so workers see them like the
+    in-process coder would. Only the files of a session's own tasks are
+    applied. Sessions that fail on every attempt are coded in this process
+    as they fail, and sessions unfinished at the queue timeout once it passes.
+    """
+    steps = coder_state.task_plan.implementation_steps
+    plan = state.get("project_plan")
+    techstack = plan.techstack if isinstance(plan, Plan) else ""
+    task_cache = get_task_cache()
+
+    sessions = []  # (step indices, group, draft) in plan order
+    index = coder_state.current_step_idx
+    while index < len(steps):
+        kind, group, value = _next_coder_unit(plan, steps, index, task_cache)
+        if kind == "session":
+            sessions.append((range(index, index + len(group)), group, value))
+        else:
+            write_file.invoke({"path": group[0].filepath, "content": value})
+            if kind == "scaffold":
+                coder_state.scaffolded_files += 1
+            else:
+                coder_state.cached_files += 1
+            _commit_coder_step(group)
+        index += len(group)
+
+    # A session waits for the latest earlier session writing a file it mentions or writes
+    references = task_references(steps)
+    dependencies: List[set] = []
+    writers: Dict[str, int] = {}
+    for number, (indices, group, _) in enumerate(sessions):
+        paths = set().union(*(references[i] for i in indices))
+        paths.update(normalize_filepath(task.filepath) for task in group)
+        dependencies.append({writers[path] for path in paths if path in writers})
+        for task in group:
+            writers[normalize_filepath(task.filepath)] = number
+
+    def finish(group: List[ImplementationTask]) -> None:
+        _cache_generated_files(task_cache, techstack, group)
+        coder_state.generated_files += len(group)
+        coder_state.llm_sessions += 1
+        _commit_coder_step(group)
+
+    def code_here(number: int) -> None:
+        check_cancelled()
+        _, group, draft = sessions[number]
+        run_coder_session(plan, group, draft)
+        finish(group)
+
+    settings = get_task_queue_settings()
+    run_id = uuid.uuid4().hex[:12]
+    deadline = time.monotonic() + settings["timeout"] if settings["timeout"] else None
+    unpublished = list(range(len(sessions)))
+    finished: set = set()
+    in_flight: Dict[str, int] = {}
+
+    def publish_ready() -> None:
+        ready = [number for number in unpublished if dependencies[number] <= finished]
+        if not ready:
+            return
+        # Each wave sees the files of the sessions before it
+        context = project_context(get_project_root())
+        for number in ready:
+            unpublished.remove(number)
+            _, group, draft = sessions[number]
+            in_flight[queue.publish(run_id, coder_payload(plan, group, draft, context))] = number
+        logger.info(f"Published {len(ready)} coder sessions to {queue.path} (run {run_id}, {len(unpublished)} waiting)")
+        emit_event("tasks_published", run_id=run_id, tasks=len(ready))
+
+    local = []
+    try:
+        publish_ready()
+        while in_flight:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            task = next(queue.as_completed(list(in_flight), remaining, settings["poll_seconds"]))
+            number = in_flight.pop(task.task_id)
+            _, group, _ = sessions[number]
+            if task.status != DONE:
+                logger.warning(f"Task {task.task_id} {task.status} ({task.error}); coding {[t.filepath for t in group]} here")
+                code_here(number)
+            else:
+                own = {normalize_filepath(t.filepath) for t in group}
+                files = task.result.get("files") or {}
+                foreign = sorted(path for path in files if normalize_filepath(path) not in own)
+                if foreign:
+                    # Other sessions own these files; applying them could overwrite their output
+                    logger.warning(f"Ignoring files outside the tasks of task {task.task_id}: {foreign}")
+                files = {path: content for path, content in files.items() if normalize_filepath(path) in own}
+                if files:
+                    write_project_files(files)
+                finish(group)
+                emit_event("remote_task", worker=task.result.get("worker"), files=sorted(files), seconds=task.result.get("seconds"))
+            finished.add(number)
+            publish_ready()
+    except TimeoutError:
+        local = sorted(set(in_flight.values()) | set(unpublished))
+        logger.warning(f"{len(local)} coder sessions unfinished after {settings['timeout']}s; withdrawing them and coding them here")
+        queue.cancel_run(run_id)
+    except BaseException:
+        queue.cancel_run(run_id)
+        raise
+
+    for number in local:
+        code_here(number)
+    # Every step is committed already; this only advances the coder and logs totals
+    _advance_coder(state, coder_state, len(steps) - coder_state.current_step_idx)
     return state
 
+
+def _report_tool_turn(stats: Dict[str, Any]) -> None:
+    """Publish the latency of one turn of coder tool calls."""
+    logger.debug(
+        f"Tool turn: {stats['calls']} calls {stats['tools']} in {stats['wall']:.3f}s "
+        f"(slowest {stats['slowest']:.3f}s, sum {stats['sequential']:.3f}s)"
+    )
+    emit_event("tool_turn", **{key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()})
+
+
+def _advance_coder(state: AgentState, coder_state: CoderState, completed: int = 1) -> None:
+    """Move the coder past the completed tasks and log totals once all tasks are done."""
+    _commit_coder_step(coder_state.task_plan.implementation_steps[coder_state.current_step_idx:coder_state.current_step_idx + completed])
+    coder_state.current_step_idx += completed
+    state["coder_state"] = coder_state
+    if coder_state.current_step_idx >= len(coder_state.task_plan.implementation_steps):
+        logger.info(
+            f"Coder finished: {coder_state.scaffolded_files} files scaffolded, "
+            f"{coder_state.cached_files} reused from the task cache, "
+            f"{coder_state.generated_files} files generated by the LLM "
+            f"in {coder_state.llm_sessions} sessions"
+        )
+        task_cache = get_task_cache()
+        if task_cache is not None:
+            logger.info(f"Task cache: {task_cache.report()['session']}")
+        _save_project_plan(state)
+
+
+def _commit_coder_step(tasks: List[ImplementationTask]) -> None:
+    """Commit the files of completed tasks as one snapshot step."""
+    # One snapshot step per coder step, so a later step that breaks a file can be rolled back
+    label = "coder: " + ", ".join(task.filepath for task in tasks)
+    step = commit_snapshot(label)
+    if step is not None:
+        emit_event("snapshot", step=step, label=label)
+
+
+def _save_project_plan(state: AgentState) -> None:
+    """Store the plan and tasks in the project so that it can be revised later."""
+    plan = state.get("project_plan")
+    if not isinstance(plan, Plan):
+        return
+    tasks = state.get("project_tasks") or state["coder_state"].task_plan.implementation_steps
+    try:
+        save_revision(get_project_root(), state.get("user_prompt", ""), plan, tasks)
+    except OSError as e:
+        logger.warning(f"Could not store the project plan: {e}")
+
 def _should_continue_coding(state: AgentState) -> str:
     """Determines whether to continue coding or finish."""
     coder_state = state.get("coder_state")
@@ -153,18 +648,26 @@ def _should_continue_coding(state: AgentState) -> str:
 
 # Build the agentic workflow graph
 graph = StateGraph(AgentState)
+graph.add_node("fast_path", fast_path_agent)
 graph.add_node("planner", planner_agent)
 graph.add_node("architect", architect_agent)
+graph.add_node("optimizer", plan_optimizer_agent)
 graph.add_node("coder", coder_agent)
 
+graph.add_conditional_edges(
+    "fast_path",
+    _route_after_fast_path,
+    {"planner": "planner", "END": END}
+)
 graph.add_edge("planner", "architect")
-graph.add_edge("architect", "coder")
+graph.add_edge("architect", "optimizer")
+graph.add_edge("optimizer", "coder")
 graph.add_conditional_edges(
     "coder",
     _should_continue_coding,
     {"coder": "coder", "END": END}
 )
 
-graph.set_entry_point("planner")
+graph.set_entry_point("fast_path")
 
 agent = graph.compile()
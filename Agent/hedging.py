@@ -0,0 +1,324 @@
+"""Hedged LLM requests for tail-latency control.
+
+Every node of the graph waits on one LLM request at a time, so a few slow
+responses dominate the run time. ``HedgedChatModel`` wraps the configured
+model: when a request takes longer than a percentile of the recent
+latencies of the same kind of call (plain chat, tool-calling or a given
+structured-output schema), a duplicate request is sent to a secondary
+model, or to the same model if none is configured. The first valid
+response wins and the other request is cancelled.
+
+The requests are raced with ``ainvoke`` on one long-lived background event
+loop (async provider clients are bound to the loop they were first used
+on), so the loser's HTTP request is actually cancelled instead of left
+running on a thread. To keep a slow provider from turning every call into
+two, hedging pauses while the share of hedged calls in the window is above
+``max_hedge_rate``.
+
+The latency saved by a hedge cannot be known once the slow request is
+cancelled, so every ``measure_every``-th winning hedge lets the slow
+request finish in the background; the measured savings are extrapolated
+to all winning hedges.
+"""
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ConfigDict, Field
+
+from .metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+
+class HedgeStats:
+    """Latency window and hedging outcomes, per kind of call.
+
+    Args:
+        percentile: Latency percentile after which a request is hedged
+        min_samples: Samples needed before the percentile is trusted
+        initial_delay: Hedge delay used until enough samples exist (None: do not hedge)
+        max_hedge_rate: Maximum share of hedged calls in the window
+        window: Number of recent calls kept per kind
+        measure_every: Let every n-th slow request that lost to a hedge run
+            to completion to measure the latency saved (0 disables)
+    """
+
+    def __init__(
+        self,
+        percentile: float = 90.0,
+        min_samples: int = 5,
+        initial_delay: Optional[float] = None,
+        max_hedge_rate: float = 0.25,
+        window: int = 100,
+        measure_every: int = 5,
+    ):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.window = window
+        self.measure_every = measure_every
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedged: Dict[str, Deque[bool]] = {}
+        self._savings: Deque[float] = deque(maxlen=window)
+        self.counters = {
+            "calls": 0, "hedged": 0, "hedge_wins": 0, "primary_wins_after_hedge": 0,
+            "skipped_rate_limit": 0, "failures": 0,
+        }
+
+    def threshold(self, kind: str) -> Optional[float]:
+        """Return the delay after which a call of ``kind`` is hedged, or None."""
+        with self._lock:
+            latencies = self._latencies.get(kind)
+            hedged = self._hedged.get(kind)
+            if hedged and sum(hedged) / len(hedged) >= self.max_hedge_rate:
+                self.counters["skipped_rate_limit"] += 1
+                return None
+            if latencies is None or len(latencies) < self.min_samples:
+                return self.initial_delay
+            return percentile(list(latencies), self.percentile)
+
+    def record(self, kind: str, latency: float, hedged: bool, hedge_won: bool) -> bool:
+        """Record the outcome of one call.
+
+        Returns:
+            True if the losing primary request should be left running to
+            measure how much time the hedge saved
+        """
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=self.window)).append(latency)
+            self._hedged.setdefault(kind, deque(maxlen=self.window)).append(hedged)
+            self.counters["calls"] += 1
+            if not hedged:
+                return False
+            self.counters["hedged"] += 1
+            self.counters["hedge_wins" if hedge_won else "primary_wins_after_hedge"] += 1
+            return hedge_won and self.measure_every > 0 and self.counters["hedge_wins"] % self.measure_every == 1 % self.measure_every
+
+    def record_saving(self, seconds: float) -> None:
+        """Record the measured latency saved by one winning hedge."""
+        with self._lock:
+            self._savings.append(max(0.0, seconds))
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.counters["failures"] += 1
+
+    def report(self) -> Dict[str, Any]:
+        """Return hedge rate, win counts and latency percentiles per kind."""
+        with self._lock:
+            counters = dict(self.counters)
+            kinds = {
+                kind: {
+                    "samples": len(values),
+                    "p50": round(percentile(list(values), 50), 3),
+                    f"p{self.percentile:g}": round(percentile(list(values), self.percentile), 3),
+                }
+                for kind, values in self._latencies.items()
+            }
+            savings = list(self._savings)
+        calls = counters["calls"]
+        mean_saving = sum(savings) / len(savings) if savings else None
+        return {
+            **counters,
+            "hedge_rate": round(counters["hedged"] / calls, 3) if calls else 0.0,
+            "measured_savings": len(savings),
+            "mean_saving_seconds": round(mean_saving, 3) if mean_saving is not None else None,
+            "estimated_saved_seconds": round(mean_saving * counters["hedge_wins"], 3) if mean_saving is not None else None,
+            "latency": kinds,
+        }
+
+
+def _is_valid(result: Any) -> bool:
+    """A structured-output result with a parsing error is not a valid answer."""
+    if isinstance(result, dict) and "parsing_error" in result:
+        return result.get("parsing_error") is None and result.get("parsed") is not None
+    return result is not None
+
+
+async def _race(
+    stats: HedgeStats,
+    kind: str,
+    primary: Callable[[], Awaitable[Any]],
+    secondary: Callable[[], Awaitable[Any]],
+    context: Optional[contextvars.Context] = None,
+) -> Any:
+    """Run ``primary`` and hedge it with ``secondary`` once it is slow.
+
+    Args:
+        stats: Latency window and counters to use and update
+        kind: Kind of call, each kind has its own latency window
+        primary: Factory of the primary request
+        secondary: Factory of the duplicate request
+        context: Context the requests run in (defaults to the current one)
+    """
+    loop = asyncio.get_running_loop()
+    threshold = stats.threshold(kind)
+    started = time.monotonic()
+    first = loop.create_task(primary(), context=context)
+    if threshold is not None:
+        done, _ = await asyncio.wait({first}, timeout=threshold)
+    if threshold is None or done:
+        try:
+            result = await first
+        except BaseException:
+            stats.record_failure()
+            raise
+        stats.record(kind, time.monotonic() - started, hedged=False, hedge_won=False)
+        return result
+
+    logger.info(f"Hedging {kind} request after {threshold:.2f}s")
+    second = loop.create_task(secondary(), context=context)
+    pending = {first, second}
+    fallback = None
+    errors: List[BaseException] = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                result = task.result()
+                if not _is_valid(result):
+                    fallback = fallback or (task, result)
+                    continue
+                latency = time.monotonic() - started
+                measure = stats.record(kind, latency, hedged=True, hedge_won=task is second)
+                logger.info(f"{'Hedge' if task is second else 'Primary'} won {kind} request in {latency:.2f}s")
+                if measure and first in pending:
+                    pending.discard(first)
+                    first.add_done_callback(lambda t: None if t.cancelled() or t.exception() else
+                                            stats.record_saving(time.monotonic() - started - latency))
+                return result
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    if fallback is not None:
+        task, result = fallback
+        stats.record(kind, time.monotonic() - started, hedged=True, hedge_won=task is second)
+        return result
+    stats.record_failure()
+    raise errors[0]
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop that runs hedged and cancellable requests for synchronous callers."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-hedging", daemon=True).start()
+        return _loop
+
+
+def _run_sync(race: Callable[[contextvars.Context], Awaitable[Any]]) -> Any:
+    """Run a race on the background loop in the caller's context and wait for it."""
+    context = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(race(context), background_loop()).result()
+
+
+class HedgedRunnable(Runnable):
+    """Races two equivalent runnables (e.g. tool-bound or structured models)."""
+
+    def __init__(self, stats: HedgeStats, kind: str, primary: Runnable, secondary: Runnable):
+        self.stats = stats
+        self.kind = kind
+        self.primary = primary
+        self.secondary = secondary
+
+    def _race(self, input: Any, config: Optional[RunnableConfig], context: Optional[contextvars.Context], **kwargs: Any):
+        return _race(
+            self.stats, self.kind,
+            lambda: self.primary.ainvoke(input, config, **kwargs),
+            lambda: self.secondary.ainvoke(input, config, **kwargs),
+            context,
+        )
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return _run_sync(lambda context: self._race(input, config, context, **kwargs))
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self._race(input, config, None, **kwargs)
+
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model that hedges slow requests with a duplicate request.
+
+    Attributes:
+        primary: Model every request goes to first
+        secondary: Model for the hedged duplicate (defaults to ``primary``)
+        stats: Latency window, thresholds and hedging counters
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    primary: BaseChatModel
+    secondary: Optional[BaseChatModel] = None
+    stats: HedgeStats = Field(default_factory=HedgeStats)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"hedged-{self.primary._llm_type}"
+
+    @property
+    def _hedge(self) -> BaseChatModel:
+        return self.secondary if self.secondary is not None else self.primary
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return HedgedRunnable(
+            self.stats, "tools",
+            self.primary.bind_tools(tools, **kwargs),
+            self._hedge.bind_tools(tools, **kwargs),
+        )
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        name = getattr(schema, "__name__", None) or type(schema).__name__
+        return HedgedRunnable(
+            self.stats, f"structured:{name}",
+            self.primary.with_structured_output(schema, **kwargs),
+            self._hedge.with_structured_output(schema, **kwargs),
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return _run_sync(lambda context: self._race_generate(messages, stop, context, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self._race_generate(messages, stop, None, **kwargs)
+
+    def _race_generate(self, messages: List[BaseMessage], stop: Optional[List[str]], context, **kwargs: Any):
+        # The inner models are called without callbacks so usage is counted once
+        return _race(
+            self.stats, "chat",
+            lambda: self.primary._agenerate(messages, stop=stop, **kwargs),
+            lambda: self._hedge._agenerate(messages, stop=stop, **kwargs),
+            context,
+        )
@@ -0,0 +1,444 @@
+"""Background job execution for agent runs.
+
+Runs of the compiled agent are submitted to a shared worker pool and tracked
+by job ID, so that callers (the Streamlit app, scripts) can poll progress,
+cancel a run or reattach to it later without blocking on ``agent.invoke``.
+"""
+
+import logging
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancelToken, DeadlineExceeded, RunCancelled, use_cancel_token
+from .config import get_profiling_settings, get_run_deadline
+from .metrics import TokenUsageCallback
+from .profiling import RunProfiler, profile_dir_for
+from .revision import load_revision, revision_path
+from .states import Plan, CoderState
+from .tools import use_project_root, use_event_sink
+from .transcript import open_transcript
+
+logger = logging.getLogger(__name__)
+
+# Each job writes into its own workspace so concurrent runs never share files
+WORKSPACES_ROOT = pathlib.Path.cwd() / "workspaces"
+
+# Finished jobs kept in memory before the oldest ones are forgotten
+MAX_FINISHED_JOBS = 200
+
+
+class JobStatus(str, Enum):
+    """Lifecycle states of a background job."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+    TIMED_OUT = "timed_out"
+
+    @property
+    def finished(self) -> bool:
+        return self in (JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.TIMED_OUT)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled."""
+
+
+class JobQueueFull(RuntimeError):
+    """Raised when a job is submitted while the pending queue is full."""
+
+
+@dataclass
+class Job:
+    """A single agent run tracked by the job manager."""
+    job_id: str
+    prompt: str
+    recursion_limit: int
+    workspace: pathlib.Path
+    status: JobStatus = JobStatus.QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    current_node: Optional[str] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    final_state: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    transcript_path: Optional[pathlib.Path] = None
+    profile_dir: Optional[pathlib.Path] = None
+    revises: Optional[str] = None  # Job whose workspace this run revises
+    revise: bool = False  # Revise the project already in the workspace
+    deadline: Optional[float] = None  # Wall-time budget of the run in seconds
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+    cancel_token: CancelToken = field(default_factory=CancelToken, repr=False)
+
+    @property
+    def duration(self) -> Optional[float]:
+        """Wall time of the run in seconds, or None if it has not started."""
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return a JSON-serializable view of the job (without the raw state)."""
+        return {
+            "job_id": self.job_id,
+            "prompt": self.prompt,
+            "status": self.status.value,
+            "workspace": str(self.workspace),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": self.duration,
+            "current_node": self.current_node,
+            "event_count": len(self.events),
+            "error": self.error,
+            "usage": self.usage,
+            "transcript": str(self.transcript_path) if self.transcript_path else None,
+            "profile": str(self.profile_dir) if self.profile_dir else None,
+            "revises": self.revises,
+            "deadline": self.deadline,
+            "summary": summarize_state(self.final_state) if self.final_state else None,
+        }
+
+
+def summarize_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a compact JSON-serializable summary of an agent state.
+
+    Args:
+        state: Agent state as returned by the graph
+
+    Returns:
+        Dictionary with the plan, task count and status
+    """
+    summary: Dict[str, Any] = {"status": state.get("status", "completed"), "project_plan": None}
+    plan = state.get("project_plan")
+    if isinstance(plan, Plan):
+        summary["project_plan"] = plan.model_dump()
+    architect_plan = state.get("architect_plan") or []
+    summary["task_count"] = len(architect_plan)
+    if state.get("plan_report"):
+        summary["plan_report"] = state["plan_report"]
+    if state.get("revision_report"):
+        summary["revision_report"] = state["revision_report"]
+    if state.get("fast_path_report"):
+        summary["fast_path_report"] = state["fast_path_report"]
+    coder_state = state.get("coder_state")
+    if isinstance(coder_state, CoderState):
+        summary["completed_tasks"] = coder_state.current_step_idx
+        summary["scaffolded_files"] = coder_state.scaffolded_files
+        summary["cached_files"] = coder_state.cached_files
+        summary["generated_files"] = coder_state.generated_files
+        summary["llm_sessions"] = coder_state.llm_sessions
+    else:
+        summary["completed_tasks"] = 0
+    return summary
+
+
+class JobManager:
+    """Runs agent jobs on a bounded thread pool and tracks their progress.
+
+    One manager is meant to be shared by every caller in the process so
+    that runs from different users queue on the same pool instead of
+    blocking each other's request threads.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        workspace_root: Optional[pathlib.Path] = None,
+        max_pending: Optional[int] = None,
+        on_finish: Optional[Callable[[Job], None]] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.on_finish = on_finish
+        self.workspace_root = pathlib.Path(workspace_root or WORKSPACES_ROOT)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(
+        self,
+        prompt: str,
+        recursion_limit: int = 100,
+        job_id: Optional[str] = None,
+        revises: Optional[str] = None,
+        workspace: Optional[pathlib.Path] = None,
+        revise: bool = False,
+        deadline: Optional[float] = None,
+    ) -> Job:
+        """Queue a new agent run.
+
+        Args:
+            prompt: The user's project description
+            recursion_limit: Recursion limit passed to the graph
+            job_id: Optional explicit job ID (must be unique)
+            revises: ID of an earlier job whose project this run revises; its
+                workspace is copied and only affected files are regenerated
+            workspace: Directory to generate into instead of a new workspace
+                under ``workspace_root``
+            revise: Revise the project already in ``workspace`` in place
+            deadline: Seconds the run may take once started (default:
+                COMPANIO_RUN_DEADLINE); it then stops with its partial result
+
+        Returns:
+            The queued job
+
+        Raises:
+            ValueError: If the prompt is empty, the job ID is already in use,
+                the workspace is in use by another job or the revised project
+                has no stored plan
+            JobQueueFull: If ``max_pending`` jobs are already waiting for a worker
+        """
+        if not prompt or not prompt.strip():
+            raise ValueError("User prompt cannot be empty.")
+        if revises is not None and (
+            pathlib.Path(revises).name != revises or not revision_path(self.workspace_root / revises).is_file()
+        ):
+            raise ValueError(f"Job {revises} has no project to revise")
+        job_id = job_id or uuid.uuid4().hex[:12]
+        workspace = pathlib.Path(workspace) if workspace is not None else self.workspace_root / job_id
+        if revise and (revises is not None or not revision_path(workspace).is_file()):
+            raise ValueError(f"{workspace} has no project to revise")
+        job = Job(
+            job_id=job_id,
+            prompt=prompt.strip(),
+            recursion_limit=recursion_limit,
+            workspace=workspace,
+            revises=revises,
+            revise=revise,
+            deadline=deadline if deadline is not None else get_run_deadline(),
+        )
+        with self._lock:
+            if job_id in self._jobs:
+                raise ValueError(f"Job ID already in use: {job_id}")
+            busy = next((j for j in self._jobs.values() if j.workspace == workspace and not j.status.finished), None)
+            if busy is not None:
+                raise ValueError(f"{workspace} is in use by job {busy.job_id}")
+            if self.max_pending is not None and self._pending_count() >= self.max_pending:
+                raise JobQueueFull(f"Job queue is full ({self.max_pending} pending)")
+            self._jobs[job_id] = job
+            self._forget_old_jobs()
+        self._record(job, "status", {"status": job.status.value})
+        self._executor.submit(self._run, job)
+        logger.info(f"Job {job_id} queued")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return the job with the given ID, or None if unknown."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending_count(self) -> int:
+        """Return the number of jobs waiting for a free worker."""
+        with self._lock:
+            return self._pending_count()
+
+    def list_jobs(self) -> List[Job]:
+        """Return all known jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation of a job.
+
+        Queued jobs are cancelled immediately; running jobs stop at once, with
+        their LLM requests and commands cancelled.
+
+        Returns:
+            True if the job exists and was not already finished
+        """
+        job = self.get(job_id)
+        if job is None or job.status.finished:
+            return False
+        job.cancel_requested.set()
+        job.cancel_token.cancel()
+        if job.status == JobStatus.QUEUED:
+            self._finish(job, JobStatus.CANCELLED)
+        logger.info(f"Cancellation requested for job {job_id}")
+        return True
+
+    def events_since(self, job_id: str, cursor: int = 0, timeout: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """Return events recorded after ``cursor``, optionally waiting for new ones.
+
+        Args:
+            job_id: The job to read events from
+            cursor: Number of events the caller has already seen
+            timeout: Seconds to wait for new events if there are none yet
+
+        Returns:
+            A tuple of (new events, new cursor)
+
+        Raises:
+            KeyError: If the job is unknown
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if timeout and len(job.events) <= cursor and not job.status.finished:
+                self._changed.wait_for(
+                    lambda: len(job.events) > cursor or job.status.finished,
+                    timeout=timeout,
+                )
+            events = job.events[cursor:]
+            return list(events), cursor + len(events)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Block until the job has finished or the timeout expires."""
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._changed.wait_for(lambda: job.status.finished, timeout=timeout)
+            return job
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Cancel outstanding jobs and stop the worker pool."""
+        for job in self.list_jobs():
+            self.cancel(job.job_id)
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job) -> None:
+        """Execute a job on a worker thread."""
+        from .graph import agent
+
+        with self._lock:
+            if job.status.finished or job.cancel_requested.is_set():
+                return
+            job.status = JobStatus.RUNNING
+            job.started_at = time.time()
+        self._set_status(job, JobStatus.RUNNING)
+        state: Dict[str, Any] = {}
+        usage = TokenUsageCallback()
+        callbacks: List[Any] = [usage]
+        # Transcripts sit next to the workspaces so they never end up in a project;
+        # runs in a caller's own directory use the configured transcript directory
+        transcript_dir = job.workspace.parent / ".transcripts" if job.workspace.parent == self.workspace_root else None
+        transcript = open_transcript(job.job_id, transcript_dir)
+        if transcript is not None:
+            job.transcript_path = transcript.path
+            transcript.start(prompt=job.prompt, job_id=job.job_id, recursion_limit=job.recursion_limit)
+            callbacks.append(transcript.callback)
+        profiler = None
+        profiling = get_profiling_settings()
+        if profiling["enabled"]:
+            run_path = transcript.path if transcript is not None else (transcript_dir or job.workspace.parent / ".transcripts") / job.job_id
+            profiler = RunProfiler(profile_dir_for(run_path), profiling["interval"], profiling["trace_memory"])
+            job.profile_dir = profiler.output_dir
+            callbacks.append(profiler.callback)
+            profiler.start()
+
+        def sink(event_type: str, data: Dict[str, Any]) -> None:
+            # File contents go to the transcript only, not to event streams
+            self._record(job, event_type, {key: value for key, value in data.items() if key != "content"})
+            if transcript is not None:
+                transcript.event_sink(event_type, data)
+
+        status, error = JobStatus.COMPLETED, None
+        if job.deadline:
+            job.cancel_token.set_timeout(job.deadline)
+        try:
+            inputs: Dict[str, Any] = {"user_prompt": job.prompt}
+            if job.revises is not None:
+                shutil.copytree(self.workspace_root / job.revises, job.workspace, dirs_exist_ok=True)
+            if job.revises is not None or job.revise:
+                inputs.update(load_revision(job.workspace))
+            with use_project_root(job.workspace), use_event_sink(sink), use_cancel_token(job.cancel_token):
+                for chunk in agent.stream(
+                    inputs,
+                    {"recursion_limit": job.recursion_limit, "callbacks": callbacks},
+                    stream_mode="updates",
+                ):
+                    for node, update in chunk.items():
+                        if update:
+                            state.update(update)
+                        job.current_node = node
+                        job.usage = usage.totals()
+                        if transcript is not None:
+                            transcript.record_node(node, update)
+                        self._record(job, "node", {"node": node, **_node_progress(state)})
+                    if job.cancel_requested.is_set():
+                        raise JobCancelled()
+            job.final_state = state
+        except JobCancelled:
+            job.final_state = state or None
+            status = JobStatus.CANCELLED
+        except RunCancelled as e:
+            # Keep what the finished nodes produced as a partial result
+            job.final_state = {**state, "status": e.status}
+            if isinstance(e, DeadlineExceeded):
+                job.error = error = str(e)
+                status = JobStatus.TIMED_OUT
+            else:
+                status = JobStatus.CANCELLED
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+            job.final_state = state or None
+            job.error = error = str(e)
+            status = JobStatus.FAILED
+        job.cancel_token.close()
+        job.usage = usage.totals()
+        if profiler is not None:
+            profiler.stop()
+        if transcript is not None:
+            transcript.close(status.value, error=error, usage=job.usage)
+        self._finish(job, status)
+
+    def _finish(self, job: Job, status: JobStatus) -> None:
+        with self._lock:
+            if job.status.finished:
+                return
+            job.finished_at = time.time()
+        self._set_status(job, status)
+        logger.info(f"Job {job.job_id} {status.value}")
+        if self.on_finish is not None:
+            try:
+                self.on_finish(job)
+            except Exception as e:
+                logger.warning(f"on_finish callback failed for job {job.job_id}: {e}")
+
+    def _set_status(self, job: Job, status: JobStatus) -> None:
+        job.status = status
+        data: Dict[str, Any] = {"status": status.value}
+        if job.error:
+            data["error"] = job.error
+        self._record(job, "status", data)
+
+    def _record(self, job: Job, event_type: str, data: Dict[str, Any]) -> None:
+        with self._changed:
+            job.events.append({"seq": len(job.events), "time": time.time(), "type": event_type, **data})
+            self._changed.notify_all()
+
+    def _pending_count(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status == JobStatus.QUEUED)
+
+    def _forget_old_jobs(self) -> None:
+        """Drop the oldest finished jobs once the history grows too large."""
+        finished = [j for j in self._jobs.values() if j.status.finished]
+        excess = len(finished) - MAX_FINISHED_JOBS
+        if excess > 0:
+            for job in sorted(finished, key=lambda j: j.created_at)[:excess]:
+                del self._jobs[job.job_id]
+
+
+def _node_progress(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract coder progress counters from a partial state."""
+    coder_state = state.get("coder_state")
+    if isinstance(coder_state, CoderState):
+        return {
+            "completed_tasks": coder_state.current_step_idx,
+            "total_tasks": len(coder_state.task_plan.implementation_steps),
+        }
+    return {}
@@ -0,0 +1,395 @@
+"""Pools of API keys per provider to raise the rate-limit ceiling.
+
+A single key caps the throughput of every run by that key's rate limits.
+The local configuration file can list more keys (or key and endpoint pairs)
+per provider under ``key_pools``; ``initialize_llm`` then builds one client
+per key and wraps them in a ``PooledChatModel``.
+
+Each call goes to the least-loaded key (fewest calls in flight, then fewest
+calls so far) that is not cooling down. A key the provider throttles (HTTP
+429) is put on cooldown for the ``Retry-After`` the provider sent, or
+``COMPANIO_KEY_COOLDOWN`` seconds, and the call is retried on another key;
+when every key cools down, calls wait for the first one to come back.
+Calls, failures, throttles, tokens and latency are tracked per key, and keys
+are only ever shown masked. Manage the pool with::
+
+    python -m Agent.key_pool list [--provider openai]
+    python -m Agent.key_pool add - [--base-url URL]   # reads the key from stdin
+    python -m Agent.key_pool remove 3f9a               # key or the end of it
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ConfigDict
+
+from . import cancellation
+from .config import get_api_provider, get_key_pool, load_config, update_key_pool
+
+logger = logging.getLogger(__name__)
+
+# Exception names of provider SDKs for throttling and for transient failures
+_RATE_LIMIT_ERRORS = {"RateLimitError", "ResourceExhausted", "TooManyRequests"}
+_TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError", "InternalServerError", "ServiceUnavailable", "OverloadedError"}
+
+
+def mask_key(api_key: str) -> str:
+    """Return a printable form of an API key that does not reveal it."""
+    return f"...{api_key[-4:]}" if len(api_key) > 8 else "..."
+
+
+def _error_chain(error: BaseException) -> Iterator[BaseException]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for value in (getattr(error, "status_code", None), getattr(getattr(error, "response", None), "status_code", None),
+                  getattr(error, "code", None)):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Return True if a provider call failed because the key was throttled."""
+    for e in _error_chain(error):
+        if _status_code(e) == 429 or type(e).__name__ in _RATE_LIMIT_ERRORS:
+            return True
+        text = str(e)
+        if "429" in text and ("rate" in text.lower() or "quota" in text.lower() or "RESOURCE_EXHAUSTED" in text):
+            return True
+    return False
+
+
+def is_transient(error: BaseException) -> bool:
+    """Return True if a provider call failed in a way another attempt may not."""
+    for e in _error_chain(error):
+        status = _status_code(e)
+        if (status is not None and status >= 500) or type(e).__name__ in _TRANSIENT_ERRORS:
+            return True
+    return False
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Return the delay a throttling provider asked for, in seconds, if it sent one."""
+    for e in _error_chain(error):
+        headers = getattr(getattr(e, "response", None), "headers", None)
+        if not headers:
+            continue
+        for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+            try:
+                return float(headers.get(header)) * scale
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+def _usage(result: Any) -> Dict[str, int]:
+    """Extract the token usage of a model result, if it carries one."""
+    if isinstance(result, ChatResult) and result.generations:
+        result = result.generations[0].message
+    elif isinstance(result, dict) and "raw" in result:
+        result = result["raw"]
+    return getattr(result, "usage_metadata", None) or {}
+
+
+class KeyPool:
+    """Selection, cooldown and usage accounting of pooled API keys.
+
+    Args:
+        names: Masked names of the keys, in pool order
+        cooldown: Seconds a throttled key is left out when the provider names no delay
+    """
+
+    def __init__(self, names: List[str], cooldown: float = 30.0):
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._keys = [{
+            "name": name, "in_flight": 0, "requests": 0, "failures": 0, "throttled": 0,
+            "cooldown_until": 0.0, "input_tokens": 0, "output_tokens": 0, "latency": 0.0,
+        } for name in names]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def name(self, index: int) -> str:
+        return self._keys[index]["name"]
+
+    def try_acquire(self) -> tuple:
+        """Reserve the least-loaded key that is not cooling down.
+
+        Returns:
+            (key index, 0.0), or (None, seconds until the first key is usable again)
+        """
+        with self._lock:
+            now = time.monotonic()
+            ready = [i for i, key in enumerate(self._keys) if key["cooldown_until"] <= now]
+            if not ready:
+                return None, min(key["cooldown_until"] for key in self._keys) - now
+            index = min(ready, key=lambda i: (self._keys[i]["in_flight"], self._keys[i]["requests"]))
+            self._keys[index]["in_flight"] += 1
+            self._keys[index]["requests"] += 1
+            return index, 0.0
+
+    def acquire(self) -> int:
+        """Reserve a key, waiting while every key cools down.
+
+        Raises:
+            RunCancelled: If the current run is cancelled while waiting
+        """
+        while True:
+            index, wait = self.try_acquire()
+            if index is not None:
+                return index
+            cancellation.sleep(wait)
+
+    async def aacquire(self) -> int:
+        """Reserve a key without blocking the event loop."""
+        while True:
+            index, wait = self.try_acquire()
+            if index is not None:
+                return index
+            await asyncio.sleep(wait)
+
+    def release(self, index: int, latency: float, usage: Optional[Dict[str, int]] = None, failed: bool = False) -> None:
+        """Record the outcome of a call on a key."""
+        with self._lock:
+            key = self._keys[index]
+            key["in_flight"] -= 1
+            key["latency"] += latency
+            key["failures"] += failed
+            key["input_tokens"] += (usage or {}).get("input_tokens", 0)
+            key["output_tokens"] += (usage or {}).get("output_tokens", 0)
+
+    def throttle(self, index: int, delay: Optional[float] = None) -> float:
+        """Put a key on cooldown after the provider throttled it.
+
+        Returns:
+            The cooldown in seconds
+        """
+        delay = self.cooldown if delay is None else delay
+        with self._lock:
+            key = self._keys[index]
+            key["in_flight"] -= 1
+            key["throttled"] += 1
+            key["cooldown_until"] = max(key["cooldown_until"], time.monotonic() + delay)
+        return delay
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Return the usage of every key: calls, failures, throttles, tokens, latency and cooldown."""
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "key": key["name"],
+                "requests": key["requests"],
+                "in_flight": key["in_flight"],
+                "failures": key["failures"],
+                "throttled": key["throttled"],
+                "input_tokens": key["input_tokens"],
+                "output_tokens": key["output_tokens"],
+                "mean_latency": round(key["latency"] / key["requests"], 3) if key["requests"] else None,
+                "cooldown_seconds": round(max(0.0, key["cooldown_until"] - now), 3),
+            } for key in self._keys]
+
+
+def _attempts(pool: KeyPool) -> int:
+    # Every key gets a second chance after its cooldown
+    return 2 * len(pool)
+
+
+def _call_pooled(pool: KeyPool, targets: List[Any], call: Callable[[Any], Any]) -> Any:
+    attempts = _attempts(pool)
+    for attempt in range(1, attempts + 1):
+        index = pool.acquire()
+        started = time.monotonic()
+        try:
+            result = call(targets[index])
+        except Exception as e:
+            if not _retry(pool, index, e, started, attempt < attempts):
+                raise
+            continue
+        except BaseException:
+            # Cancelled, e.g. the losing side of a hedged race or a run past its deadline
+            pool.release(index, time.monotonic() - started)
+            raise
+        pool.release(index, time.monotonic() - started, _usage(result))
+        return result
+
+
+async def _acall_pooled(pool: KeyPool, targets: List[Any], call: Callable[[Any], Awaitable[Any]]) -> Any:
+    attempts = _attempts(pool)
+    for attempt in range(1, attempts + 1):
+        index = await pool.aacquire()
+        started = time.monotonic()
+        try:
+            result = await call(targets[index])
+        except Exception as e:
+            if not _retry(pool, index, e, started, attempt < attempts):
+                raise
+            continue
+        except BaseException:
+            # Cancelled, e.g. the losing side of a hedged race or a run past its deadline
+            pool.release(index, time.monotonic() - started)
+            raise
+        pool.release(index, time.monotonic() - started, _usage(result))
+        return result
+
+
+def _retry(pool: KeyPool, index: int, error: Exception, started: float, can_retry: bool) -> bool:
+    """Account for a failed call and decide whether to try another key."""
+    if is_rate_limited(error):
+        delay = pool.throttle(index, retry_after(error))
+        logger.warning(f"Key {pool.name(index)} throttled, cooling down for {delay:.1f}s")
+        return can_retry
+    pool.release(index, time.monotonic() - started, failed=True)
+    if can_retry and is_transient(error):
+        logger.warning(f"Call on key {pool.name(index)} failed ({type(error).__name__}), retrying on another key")
+        return True
+    return False
+
+
+class PooledRunnable(Runnable):
+    """Sends each call to one of several equivalent runnables (e.g. tool-bound or structured models)."""
+
+    def __init__(self, pool: KeyPool, targets: List[Runnable]):
+        self.pool = pool
+        self.targets = targets
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return _call_pooled(self.pool, self.targets, lambda target: target.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await _acall_pooled(self.pool, self.targets, lambda target: target.ainvoke(input, config, **kwargs))
+
+
+class PooledChatModel(BaseChatModel):
+    """Chat model that spreads calls over one client per pooled API key.
+
+    Attributes:
+        models: One client per key, in pool order
+        pool: Selection, cooldown and usage of the keys
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    models: List[BaseChatModel]
+    pool: KeyPool
+
+    @property
+    def _llm_type(self) -> str:
+        return f"pooled-{self.models[0]._llm_type}"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        return PooledRunnable(self.pool, [model.bind_tools(tools, **kwargs) for model in self.models])
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        return PooledRunnable(self.pool, [model.with_structured_output(schema, **kwargs) for model in self.models])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # The inner models are called without callbacks so usage is counted once
+        return _call_pooled(self.pool, self.models, lambda model: model._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await _acall_pooled(self.pool, self.models, lambda model: model._agenerate(messages, stop=stop, **kwargs))
+
+
+def build_pooled_model(
+    entries: List[Dict[str, Optional[str]]],
+    build: Callable[[str, Optional[str]], BaseChatModel],
+    cooldown: float = 30.0,
+) -> BaseChatModel:
+    """Build a client per pooled key, pooled if there is more than one.
+
+    Args:
+        entries: Dictionaries with api_key and base_url, e.g. from ``get_key_pool``
+        build: Called as build(api_key, base_url) to create a client
+        cooldown: Seconds a throttled key is left out when the provider names no delay
+
+    Returns:
+        The only client, or a ``PooledChatModel`` over all of them
+    """
+    if len(entries) == 1:
+        return build(entries[0]["api_key"], entries[0]["base_url"])
+    models = [build(entry["api_key"], entry["base_url"]) for entry in entries]
+    logger.info(f"Spreading LLM calls over {len(models)} pooled API keys")
+    return PooledChatModel(models=models, pool=KeyPool([mask_key(entry["api_key"]) for entry in entries], cooldown))
+
+
+def find_pooled_model(llm: Any) -> Optional[PooledChatModel]:
+    """Return the pooled model of the shared LLM, looking through hedging, if any."""
+    for candidate in (llm, getattr(llm, "primary", None)):
+        if isinstance(candidate, PooledChatModel):
+            return candidate
+    return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="List and edit the pooled API keys of a provider")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="Show the keys of the pool, masked")
+    add_parser = commands.add_parser("add", help="Add a key to the pool")
+    add_parser.add_argument("api_key", help="The key, or - to read it from stdin")
+    add_parser.add_argument("--base-url", help="Endpoint for this key (default: the provider's)")
+    remove_parser = commands.add_parser("remove", help="Remove a key from the pool")
+    remove_parser.add_argument("api_key", help="The key or its last characters")
+    for sub in (list_parser, add_parser, remove_parser):
+        sub.add_argument("--provider", default=None, help="Provider of the pool (default: the configured one)")
+    args = parser.parse_args(argv)
+
+    provider = args.provider or get_api_provider()
+    # The configured api_key is listed by get_key_pool but stored outside the pool
+    config = load_config()
+    primary = config.get("api_key", "").strip() if provider == config.get("api_provider") else ""
+    pooled = [entry for entry in get_key_pool(provider) if not (entry["api_key"] == primary and entry["base_url"] is None)]
+
+    if args.command == "list":
+        for n, entry in enumerate(get_key_pool(provider), 1):
+            source = "configured key" if entry["api_key"] == primary and entry["base_url"] is None else "pool"
+            print(f"{n}. {mask_key(entry['api_key'])}  {entry['base_url'] or 'default endpoint'}  ({source})")
+        return 0
+    if args.command == "add":
+        api_key = sys.stdin.readline().strip() if args.api_key == "-" else args.api_key.strip()
+        if not api_key:
+            parser.error("The API key cannot be empty")
+        entry = {"api_key": api_key, "base_url": args.base_url}
+        if entry in pooled or (api_key == primary and not args.base_url):
+            print(f"{mask_key(api_key)} is already in the {provider} pool")
+            return 0
+        update_key_pool(provider, pooled + [entry])
+        print(f"Added {mask_key(api_key)} to the {provider} pool ({len(pooled) + 1 + bool(primary)} keys)")
+        return 0
+    kept = [entry for entry in pooled if not entry["api_key"].endswith(args.api_key)]
+    if len(kept) == len(pooled):
+        print(f"No pooled {provider} key matches {mask_key(args.api_key)}", file=sys.stderr)
+        return 1
+    update_key_pool(provider, kept)
+    print(f"Removed {len(pooled) - len(kept)} key(s) from the {provider} pool")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Token accounting and latency statistics for agent runs."""
+
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Callback handler that sums token usage reported by the provider.
+
+    Usage is read from ``usage_metadata`` on generated messages, falling back
+    to the provider-specific ``token_usage`` block of ``llm_output``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.llm_calls = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens) and response.llm_output:
+            usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+            input_tokens = usage.get("prompt_tokens", usage.get("input_tokens", 0)) or 0
+            output_tokens = usage.get("completion_tokens", usage.get("output_tokens", 0)) or 0
+        with self._lock:
+            self.llm_calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+    def totals(self) -> Dict[str, int]:
+        """Return the accumulated usage as a dictionary."""
+        with self._lock:
+            return {
+                "llm_calls": self.llm_calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.input_tokens + self.output_tokens,
+            }
+
+
+class ToolLatencyCallback(BaseCallbackHandler):
+    """Callback handler that measures the tool calls of each agent turn.
+
+    LangGraph agents run the tool calls of one model response as parallel
+    tasks of the same graph step, so a turn is identified by the graph run
+    and its step. A turn is complete once the graph moves on to a later step
+    or ends; its wall time is then compared with the sum of its call
+    durations, which is what running the calls one by one would have taken.
+
+    Args:
+        on_turn: Called with the statistics of each finished turn
+    """
+
+    def __init__(self, on_turn: Optional[Callable[[Dict[str, Any]], None]] = None):
+        super().__init__()
+        self.on_turn = on_turn
+        self._lock = threading.Lock()
+        self._nodes: Dict[UUID, tuple] = {}  # node run -> (graph run, step)
+        self._calls: Dict[UUID, tuple] = {}  # tool run -> (turn key, tool name, start)
+        self._open_turns: Dict[tuple, Dict[str, Any]] = {}
+        self.turns: List[Dict[str, Any]] = []
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None,
+                       **kwargs: Any) -> None:
+        step = (metadata or {}).get("langgraph_step")
+        if step is None or parent_run_id is None:
+            return
+        with self._lock:
+            self._nodes[run_id] = (parent_run_id, step)
+            done = [key for key in self._open_turns if key[0] == parent_run_id and key[1] < step]
+        for key in done:
+            self._finish_turn(key)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_run(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_run(run_id)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        now = time.perf_counter()
+        with self._lock:
+            key = self._nodes.get(parent_run_id, (parent_run_id or run_id, None))
+            self._calls[run_id] = (key, name, now)
+            self._open_turns.setdefault(key, {"start": now, "end": now, "durations": [], "tools": {}})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_call(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_call(run_id)
+
+    def _end_call(self, run_id: UUID) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+            if call is None:
+                return
+            key, name, start = call
+            turn = self._open_turns[key]
+            turn["durations"].append(now - start)
+            turn["tools"][name] = turn["tools"].get(name, 0) + 1
+            turn["end"] = max(turn["end"], now)
+        if key[1] is None:
+            # Outside of a graph every tool call is a turn of its own
+            self._finish_turn(key)
+
+    def _end_run(self, run_id: UUID) -> None:
+        with self._lock:
+            self._nodes.pop(run_id, None)
+            done = [key for key in self._open_turns if key[0] == run_id]
+        for key in done:
+            self._finish_turn(key)
+
+    def _finish_turn(self, key: tuple) -> None:
+        with self._lock:
+            turn = self._open_turns.pop(key, None)
+            if turn is None or not turn["durations"]:
+                return
+            stats = {
+                "calls": len(turn["durations"]),
+                "tools": turn["tools"],
+                "wall": turn["end"] - turn["start"],
+                "sequential": sum(turn["durations"]),
+                "slowest": max(turn["durations"]),
+            }
+            self.turns.append(stats)
+        if self.on_turn is not None:
+            self.on_turn(stats)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return totals over all finished turns."""
+        with self._lock:
+            wall = sum(t["wall"] for t in self.turns)
+            sequential = sum(t["sequential"] for t in self.turns)
+            return {
+                "turns": len(self.turns),
+                "calls": sum(t["calls"] for t in self.turns),
+                "wall": wall,
+                "sequential": sequential,
+                "speedup": sequential / wall if wall > 0 else None,
+            }
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Return the q-th percentile (0-100) using linear interpolation.
+
+    Args:
+        values: Sample values
+        q: Percentile between 0 and 100
+
+    Returns:
+        The interpolated percentile, or 0.0 for an empty sample
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100.0
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return float(ordered[low])
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(durations: List[float]) -> Dict[str, float]:
+    """Summarize a list of durations in seconds."""
+    if not durations:
+        return {"count": 0}
+    return {
+        "count": len(durations),
+        "mean": sum(durations) / len(durations),
+        "p50": percentile(durations, 50),
+        "p90": percentile(durations, 90),
+        "p99": percentile(durations, 99),
+        "max": max(durations),
+    }
@@ -0,0 +1,258 @@
+"""Plan optimization between the architect and the coder.
+
+The architect often emits several ``ImplementationTask``s for the same
+file, and the coder re-reads and rewrites the whole file for each of
+them. This pass merges all tasks of a file into one, drops duplicate and
+no-op tasks, and keeps dependency order: a file is only moved behind
+another file if one of its tasks referred to that file and originally
+came after it.
+"""
+
+import heapq
+import logging
+import posixpath
+import re
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Set, Tuple
+
+from .states import ImplementationTask
+
+logger = logging.getLogger(__name__)
+
+# Short descriptions that ask for no actual change to the file
+_NOOP_PATTERN = re.compile(
+    r"^(no (changes?|modifications?|updates?)( (are )?(needed|required|necessary))?|none|n a|nothing( to do)?|"
+    r"(this file is )?(already|previously) (implemented|done|created|complete|exists?)( in [a-z0-9 ]+)?)$"
+)
+_NOOP_MAX_WORDS = 12
+
+
+@dataclass
+class PlanOptimizationReport:
+    """Summary of what the optimization pass changed."""
+    original_tasks: int = 0
+    optimized_tasks: int = 0
+    merged_tasks: int = 0
+    duplicate_tasks: int = 0
+    noop_tasks: int = 0
+
+    @property
+    def saved_invocations(self) -> int:
+        """Coder invocations avoided by the optimization."""
+        return self.original_tasks - self.optimized_tasks
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "saved_invocations": self.saved_invocations}
+
+
+def normalize_filepath(path: str) -> str:
+    """Normalize a task file path so that equivalent spellings compare equal."""
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return posixpath.normpath(path).lstrip("/")
+
+
+def normalize_description(text: str) -> str:
+    """Lowercase a description and collapse punctuation and whitespace."""
+    return re.sub(r"\W+", " ", text.lower()).strip()
+
+
+def is_noop_task(task: ImplementationTask) -> bool:
+    """Return True if the task asks for no change (e.g. "No changes needed")."""
+    text = normalize_description(task.task_description)
+    if len(text.split()) > _NOOP_MAX_WORDS:
+        return False
+    return bool(_NOOP_PATTERN.match(text))
+
+
+def _reference_patterns(paths: List[str]) -> Dict[str, re.Pattern]:
+    """Build the regex that detects references to each file in task descriptions.
+
+    A file is referenced by its path, its path without extension (import
+    style) or its base name when that base name is unique in the plan.
+    """
+    basenames: Dict[str, int] = {}
+    for path in paths:
+        name = posixpath.basename(path)
+        basenames[name] = basenames.get(name, 0) + 1
+
+    patterns = {}
+    for path in paths:
+        names = {path, posixpath.splitext(path)[0]}
+        name = posixpath.basename(path)
+        if basenames[name] == 1:
+            names.add(name)
+        alternatives = "|".join(re.escape(n) for n in sorted(names, key=len, reverse=True))
+        patterns[path] = re.compile(rf"(?<![\w./-])(?:\./|/)?(?:{alternatives})(?![\w-])", re.IGNORECASE)
+    return patterns
+
+
+def task_references(tasks: List[ImplementationTask]) -> Dict[int, Set[str]]:
+    """Map each task index to the other files of the plan its description mentions."""
+    paths = list(dict.fromkeys(normalize_filepath(t.filepath) for t in tasks))
+    patterns = _reference_patterns(paths)
+    references: Dict[int, Set[str]] = {}
+    for i, task in enumerate(tasks):
+        own = normalize_filepath(task.filepath)
+        references[i] = {
+            path for path, pattern in patterns.items()
+            if path != own and pattern.search(task.task_description)
+        }
+    return references
+
+
+def optimize_tasks(tasks: List[ImplementationTask]) -> Tuple[List[ImplementationTask], PlanOptimizationReport]:
+    """Merge tasks per file and drop duplicate or no-op tasks.
+
+    Args:
+        tasks: Implementation steps in architect order
+
+    Returns:
+        A tuple of (optimized tasks, report)
+    """
+    report = PlanOptimizationReport(original_tasks=len(tasks))
+
+    # Group the remaining tasks by file, in order of first appearance
+    groups: Dict[str, List[int]] = {}
+    seen_descriptions: Dict[str, Set[str]] = {}
+    for i, task in enumerate(tasks):
+        path = normalize_filepath(task.filepath)
+        if is_noop_task(task):
+            report.noop_tasks += 1
+            continue
+        description = normalize_description(task.task_description)
+        if description in seen_descriptions.setdefault(path, set()):
+            report.duplicate_tasks += 1
+            continue
+        seen_descriptions[path].add(description)
+        groups.setdefault(path, []).append(i)
+
+    # A file must stay behind another file if one of its tasks referred to
+    # that file and came after it in the original order
+    references = task_references(tasks)
+    first_index = {path: indices[0] for path, indices in groups.items()}
+    depends_on: Dict[str, Set[str]] = {path: set() for path in groups}
+    for path, indices in groups.items():
+        for i in indices:
+            for ref in references[i]:
+                if ref in groups and first_index[ref] < i:
+                    depends_on[path].add(ref)
+
+    order = _stable_topological_order(first_index, depends_on)
+
+    optimized = []
+    for path in order:
+        indices = groups[path]
+        if len(indices) == 1:
+            optimized.append(tasks[indices[0]])
+            continue
+        report.merged_tasks += len(indices) - 1
+        description = "\n\n".join(
+            f"Part {n}: {tasks[i].task_description}" for n, i in enumerate(indices, 1)
+        )
+        optimized.append(ImplementationTask(
+            filepath=tasks[indices[0]].filepath,
+            task_description="Implement all of the following for this file in a single pass.\n\n" + description,
+        ))
+    report.optimized_tasks = len(optimized)
+    return optimized, report
+
+
+def _stable_topological_order(first_index: Dict[str, int], depends_on: Dict[str, Set[str]]) -> List[str]:
+    """Order files so dependencies come first, otherwise by first appearance.
+
+    Cycles are broken by taking the earliest remaining file.
+    """
+    remaining = {path: set(deps) for path, deps in depends_on.items()}
+    dependents: Dict[str, Set[str]] = {path: set() for path in remaining}
+    for path, deps in remaining.items():
+        for dep in deps:
+            dependents[dep].add(path)
+
+    ready = [(first_index[p], p) for p, deps in remaining.items() if not deps]
+    heapq.heapify(ready)
+    order: List[str] = []
+    placed: Set[str] = set()
+    while len(order) < len(remaining):
+        if not ready:
+            # Dependency cycle: fall back to the original order
+            _, path = min((first_index[p], p) for p in remaining if p not in placed)
+        else:
+            _, path = heapq.heappop(ready)
+            if path in placed:
+                continue
+        order.append(path)
+        placed.add(path)
+        for dependent in dependents[path]:
+            remaining[dependent].discard(path)
+            if not remaining[dependent] and dependent not in placed:
+                heapq.heappush(ready, (first_index[dependent], dependent))
+    return order
+
+
+# Rough output size of a file by extension, used to cap coder groups
+_ESTIMATED_TOKENS_BY_EXTENSION = {
+    ".css": 400, ".scss": 400, ".json": 200, ".html": 400, ".md": 400,
+    ".js": 600, ".ts": 600, ".jsx": 900, ".tsx": 900,
+}
+_DEFAULT_ESTIMATED_TOKENS = 600
+_INDEX_ESTIMATED_TOKENS = 80
+
+
+def _stem(path: str) -> str:
+    """Return the base name up to its first dot (Header.module.css -> Header)."""
+    return posixpath.basename(path).split(".", 1)[0].lower()
+
+
+def estimate_output_tokens(task: ImplementationTask) -> int:
+    """Estimate how many tokens the coder will emit for a task's file."""
+    path = normalize_filepath(task.filepath)
+    if _stem(path) == "index":
+        base = _INDEX_ESTIMATED_TOKENS
+    else:
+        base = _ESTIMATED_TOKENS_BY_EXTENSION.get(posixpath.splitext(path)[1].lower(), _DEFAULT_ESTIMATED_TOKENS)
+    # Longer task descriptions tend to describe larger files
+    return base + len(task.task_description) // 4
+
+
+def are_companion_files(a: str, b: str) -> bool:
+    """Return True if two files belong together (component, styles, test, index).
+
+    Files are companions when they live in the same directory and either
+    share a stem (Header.tsx, Header.module.css, Header.test.tsx) or one
+    of them is the directory's index re-export.
+    """
+    a, b = normalize_filepath(a), normalize_filepath(b)
+    if a == b or posixpath.dirname(a) != posixpath.dirname(b):
+        return False
+    stem_a, stem_b = _stem(a), _stem(b)
+    return stem_a == stem_b or "index" in (stem_a, stem_b)
+
+
+def companion_group_size(tasks: List[ImplementationTask], start: int, max_tokens: int, max_files: int) -> int:
+    """Return how many consecutive tasks from ``start`` can share one coder session.
+
+    The group grows while the next task's file is a companion of a file
+    already in the group and the estimated output stays within budget.
+
+    Args:
+        tasks: Implementation steps
+        start: Index of the first task of the group
+        max_tokens: Cap on the estimated output tokens of the group
+        max_files: Cap on the number of files in the group
+
+    Returns:
+        Group size (at least 1)
+    """
+    size = 1
+    budget = estimate_output_tokens(tasks[start])
+    while start + size < len(tasks) and size < max_files:
+        candidate = tasks[start + size]
+        if not any(are_companion_files(candidate.filepath, t.filepath) for t in tasks[start:start + size]):
+            break
+        budget += estimate_output_tokens(candidate)
+        if budget > max_tokens:
+            break
+        size += 1
+    return size
@@ -0,0 +1,165 @@
+"""Benchmark of the full and lean planner modes.
+
+Runs the planner prompt of each mode (see ``COMPANIO_PLANNER_MODE``) against
+the configured model for a set of requests and reports latency, output
+tokens and the size of the rendered plan the architect receives::
+
+    python -m Agent.planner_benchmark                    # built-in requests
+    python -m Agent.planner_benchmark --runs 3 --json    # repeat, machine-readable
+    python -m Agent.planner_benchmark --stand-in         # offline smoke run
+
+Output tokens are taken from the usage the provider reports; when it
+reports none (e.g. the stand-in model) they are estimated from the parsed
+plan with ``count_tokens``.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from .config import get_structured_output_retries
+from .metrics import TokenUsageCallback, latency_summary
+from .prompt_compiler import count_tokens, render_plan
+from .repair import invoke_structured
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUESTS = [
+    "A kanban board for small teams with drag and drop and dark mode",
+    "A personal finance tracker with monthly budgets and spending charts",
+    "A recipe search app with favorites and a weekly meal planner",
+]
+
+
+def run_planner(mode: str, user_prompt: str, llm: Any) -> Dict[str, Any]:
+    """Run the planner prompt of ``mode`` once and measure it.
+
+    Args:
+        mode: Planner mode, a key of ``PLANNER_MODES``
+        user_prompt: Request to plan
+        llm: Chat model to call
+
+    Returns:
+        Dictionary with latency, prompt_tokens, output_tokens,
+        output_reported, plan_tokens and llm_calls
+    """
+    from .graph import PLANNER_MODES
+
+    prompt_template, schema = PLANNER_MODES[mode]
+    prompt = prompt_template(user_prompt)
+    usage = TokenUsageCallback()
+    started = time.perf_counter()
+    plan, _ = invoke_structured(llm, schema, prompt, get_structured_output_retries(), {"callbacks": [usage]})
+    latency = time.perf_counter() - started
+    totals = usage.totals()
+    return {
+        "latency": latency,
+        "prompt_tokens": count_tokens(prompt),
+        "output_tokens": totals["output_tokens"] or count_tokens(plan.model_dump_json()),
+        "output_reported": bool(totals["output_tokens"]),
+        "plan_tokens": count_tokens(render_plan(plan, budget=None)),
+        "llm_calls": totals["llm_calls"],
+    }
+
+
+def benchmark(requests: Sequence[str], runs: int = 1, modes: Sequence[str] = ("full", "lean"), llm: Any = None) -> Dict[str, Any]:
+    """Run every request ``runs`` times in each planner mode.
+
+    Modes are interleaved per run so that provider latency drift affects
+    them alike.
+
+    Args:
+        requests: User requests to plan
+        runs: Repetitions per request and mode
+        modes: Planner modes to compare
+        llm: Chat model to call (default: the configured model)
+
+    Returns:
+        Per-mode summaries and the change of the last mode against the first
+    """
+    if llm is None:
+        from .graph import get_llm
+        llm = get_llm()
+    samples: Dict[str, List[Dict[str, Any]]] = {mode: [] for mode in modes}
+    for run in range(runs):
+        for user_prompt in requests:
+            for mode in modes:
+                sample = run_planner(mode, user_prompt, llm)
+                logger.info(
+                    f"{mode} run {run + 1}: {sample['latency']:.2f}s, "
+                    f"{sample['output_tokens']} output tokens for {user_prompt[:40]!r}"
+                )
+                samples[mode].append(sample)
+
+    summary: Dict[str, Any] = {"requests": len(requests), "runs": runs, "modes": {}}
+    for mode, results in samples.items():
+        count = len(results)
+        summary["modes"][mode] = {
+            "latency": latency_summary([r["latency"] for r in results]),
+            "prompt_tokens": sum(r["prompt_tokens"] for r in results) / count,
+            "output_tokens": sum(r["output_tokens"] for r in results) / count,
+            "output_reported": all(r["output_reported"] for r in results),
+            "plan_tokens": sum(r["plan_tokens"] for r in results) / count,
+            "llm_calls": sum(r["llm_calls"] for r in results),
+        }
+    if len(modes) > 1:
+        base, other = summary["modes"][modes[0]], summary["modes"][modes[-1]]
+        summary["change"] = {
+            "latency_mean": _relative(base["latency"]["mean"], other["latency"]["mean"]),
+            "output_tokens": _relative(base["output_tokens"], other["output_tokens"]),
+            "prompt_tokens": _relative(base["prompt_tokens"], other["prompt_tokens"]),
+        }
+    return summary
+
+
+def _relative(before: float, after: float) -> Optional[float]:
+    return (after - before) / before if before else None
+
+
+def _print_summary(summary: Dict[str, Any]) -> None:
+    print(f"{summary['requests']} requests x {summary['runs']} runs")
+    print(f"{'mode':6} {'mean s':>8} {'p90 s':>8} {'prompt':>8} {'output':>8} {'plan':>8}")
+    for mode, stats in summary["modes"].items():
+        latency = stats["latency"]
+        estimated = "" if stats["output_reported"] else "*"
+        print(
+            f"{mode:6} {latency['mean']:8.2f} {latency['p90']:8.2f} {stats['prompt_tokens']:8.0f} "
+            f"{stats['output_tokens']:7.0f}{estimated:1} {stats['plan_tokens']:8.0f}"
+        )
+    if any(not stats["output_reported"] for stats in summary["modes"].values()):
+        print("* estimated, the model reported no usage")
+    for name, change in summary.get("change", {}).items():
+        if change is not None:
+            print(f"{name}: {change:+.1%}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare latency and output tokens of the planner modes")
+    parser.add_argument("--prompt", action="append", dest="prompts", help="Request to plan (repeatable; default: built-in set)")
+    parser.add_argument("--runs", type=int, default=1, help="Repetitions per request and mode (default: 1)")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--stand-in", action="store_true", help="Use the offline stand-in model instead of the configured provider")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs must be positive")
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.stand_in:
+        from . import graph
+        from .stand_in import StandInChatModel
+        graph.llm = StandInChatModel()
+
+    summary = benchmark(args.prompts or DEFAULT_REQUESTS, args.runs)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_summary(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
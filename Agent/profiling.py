@@ -0,0 +1,343 @@
+"""Opt-in CPU and memory profiling of agent runs, broken down per graph node.
+
+A ``RunProfiler`` attaches to a run as a LangChain callback handler. The
+callbacks tell it which graph node, tool or LLM call every worker thread
+is currently executing, including the threads LangGraph spawns for the
+coder's tool calls. A background thread samples the Python stacks of those
+threads and tags each sample with that path, so pydantic validation,
+LangGraph internals, tools and provider SDK code all show up under the
+node that caused them.
+
+At the end of the run the profiler writes into its output directory:
+
+* ``<node>.folded`` and ``all.folded``: collapsed stacks, one
+  ``frame;frame;frame count`` line per unique stack, readable by
+  ``flamegraph.pl``, speedscope or inferno;
+* ``memory.json``: ``tracemalloc`` growth of every node and tool call,
+  with the allocation sites that grew the most for each graph node;
+* ``summary.json``: samples, wall time and memory growth per node and tool.
+
+tracemalloc is process-wide, so memory growth of concurrently running jobs
+or parallel tool calls is attributed to whichever of them was being
+measured.
+"""
+
+import json
+import logging
+import pathlib
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .transcript import TRANSCRIPT_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Allocation sites listed per node or tool call in memory.json
+TOP_ALLOCATIONS = 10
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def profile_dir_for(run_path: pathlib.Path) -> pathlib.Path:
+    """Return the profile directory that sits next to a run transcript."""
+    run_path = pathlib.Path(run_path)
+    name = run_path.name
+    if name.endswith(TRANSCRIPT_SUFFIX):
+        name = name[:-len(TRANSCRIPT_SUFFIX)]
+    return run_path.parent / f"{name}.profile"
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename.replace("\\", "/")
+    # Keep the package-relative part of library paths readable
+    marker = filename.rfind("site-packages/")
+    short = filename[marker + len("site-packages/"):] if marker >= 0 else filename.rsplit("/", 2)[-1]
+    return re.sub(r"[;\n]", "_", f"{code.co_name} ({short}:{code.co_firstlineno})")
+
+
+def _safe_name(label: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", label) or "unknown"
+
+
+class RunProfiler:
+    """Sampling CPU profiler plus tracemalloc snapshots for one agent run.
+
+    Use ``profiler.callback`` as a callback of the run and wrap the run in
+    ``with profiler:`` (or call ``start()``/``stop()``).
+
+    Args:
+        output_dir: Directory for the folded stacks and reports
+        interval: Seconds between stack samples
+        trace_memory: Take tracemalloc snapshots around nodes and tools
+        memory_frames: Traceback depth recorded by tracemalloc (deeper is much slower)
+    """
+
+    def __init__(
+        self,
+        output_dir: pathlib.Path,
+        interval: float = 0.005,
+        trace_memory: bool = True,
+        memory_frames: int = 1,
+    ):
+        self.output_dir = pathlib.Path(output_dir)
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.memory_frames = memory_frames
+        self.callback = ProfilingCallback(self)
+
+        self._lock = threading.Lock()
+        self._paths: Dict[UUID, Tuple[str, ...]] = {}
+        self._thread_runs: Dict[int, List[UUID]] = {}
+        self._samples: Dict[str, Counter] = {}
+        self._timings: Dict[str, List[float]] = {}
+        self._memory: List[Dict[str, Any]] = []
+        self._open: Dict[UUID, Tuple[float, Optional[int], Optional[tracemalloc.Snapshot]]] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+        self.sample_count = 0
+
+    def start(self) -> None:
+        """Start sampling and memory tracing."""
+        global _tracemalloc_users
+        if self.trace_memory:
+            with _tracemalloc_lock:
+                if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(self.memory_frames)
+                _tracemalloc_users += 1
+        self._started_at = time.time()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> pathlib.Path:
+        """Stop profiling and write the reports.
+
+        Returns:
+            The output directory
+        """
+        global _tracemalloc_users
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            with _tracemalloc_lock:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0:
+                    tracemalloc.stop()
+        self._write_reports(peak)
+        return self.output_dir
+
+    def __enter__(self) -> "RunProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    # Attribution of threads to graph nodes, tools and LLM calls
+
+    def enter(self, run_id: UUID, parent_run_id: Optional[UUID], label: Optional[str]) -> None:
+        """Mark the current thread as running ``run_id`` below its parent."""
+        with self._lock:
+            path = self._paths.get(parent_run_id, ()) if parent_run_id else ()
+            if label is not None:
+                path = path + (label,)
+            self._paths[run_id] = path
+            self._thread_runs.setdefault(threading.get_ident(), []).append(run_id)
+        if label is not None and path:
+            # Full snapshots only around graph nodes; nested calls just track traced size
+            snapshot = self._snapshot() if len(path) == 1 else None
+            with self._lock:
+                self._open[run_id] = (time.perf_counter(), self._traced_size(), snapshot)
+
+    def exit(self, run_id: UUID) -> None:
+        """Mark ``run_id`` as finished and record its time and memory growth."""
+        with self._lock:
+            path = self._paths.pop(run_id, ())
+            for runs in self._thread_runs.values():
+                if run_id in runs:
+                    runs.remove(run_id)
+                    break
+            opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        started, size_before, snapshot = opened
+        duration = time.perf_counter() - started
+        label = ";".join(path)
+        with self._lock:
+            self._timings.setdefault(label, []).append(duration)
+        if snapshot is not None:
+            self._record_growth(label, duration, snapshot)
+        elif size_before is not None:
+            with self._lock:
+                self._memory.append({
+                    "path": label, "duration": round(duration, 4),
+                    "growth_bytes": self._traced_size() - size_before, "top": [],
+                })
+
+    def _traced_size(self) -> Optional[int]:
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()[0]
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def _record_growth(self, label: str, duration: float, before: tracemalloc.Snapshot) -> None:
+        after = self._snapshot()
+        if after is None:
+            return
+        stats = after.compare_to(before, "lineno")
+        growth = sum(stat.size_diff for stat in stats)
+        top = [
+            {
+                "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+            }
+            for stat in sorted(stats, key=lambda s: s.size_diff, reverse=True)[:TOP_ALLOCATIONS]
+            if stat.size_diff > 0
+        ]
+        with self._lock:
+            self._memory.append({"path": label, "duration": round(duration, 4), "growth_bytes": growth, "top": top})
+
+    # Sampling
+
+    def _sample_loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = {
+                    tid: self._paths.get(runs[-1], ())
+                    for tid, runs in self._thread_runs.items() if runs and tid != own
+                }
+            for tid, path in active.items():
+                frame = frames.get(tid)
+                if frame is None or not path:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                key = ";".join(path + tuple(stack))
+                node = path[0]
+                with self._lock:
+                    self._samples.setdefault(node, Counter())[key] += 1
+                    self.sample_count += 1
+
+    # Reports
+
+    def _write_reports(self, peak: Optional[int]) -> None:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            samples = {node: Counter(counter) for node, counter in self._samples.items()}
+            timings = {label: list(values) for label, values in self._timings.items()}
+            memory = list(self._memory)
+
+        combined: Counter = Counter()
+        for node, counter in samples.items():
+            combined.update(counter)
+            self._write_folded(self.output_dir / f"{_safe_name(node)}.folded", counter)
+        self._write_folded(self.output_dir / "all.folded", combined)
+
+        growth: Dict[str, int] = {}
+        for entry in memory:
+            growth[entry["path"]] = growth.get(entry["path"], 0) + entry["growth_bytes"]
+        with open(self.output_dir / "memory.json", "w", encoding="utf-8") as f:
+            json.dump({"peak_traced_bytes": peak, "calls": memory}, f, indent=2)
+
+        summary = {
+            "wall_time": round(time.time() - self._started_at, 4) if self._started_at else None,
+            "interval": self.interval,
+            "samples": self.sample_count,
+            "samples_per_node": {node: sum(counter.values()) for node, counter in samples.items()},
+            "timings": {
+                label: {"calls": len(values), "total": round(sum(values), 4), "max": round(max(values), 4)}
+                for label, values in sorted(timings.items())
+            },
+            "memory_growth_bytes": dict(sorted(growth.items(), key=lambda item: item[1], reverse=True)),
+            "peak_traced_bytes": peak,
+        }
+        with open(self.output_dir / "summary.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Profile written to {self.output_dir} ({self.sample_count} samples)")
+
+    @staticmethod
+    def _write_folded(path: pathlib.Path, counter: Counter) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counter.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilingCallback(BaseCallbackHandler):
+    """Tells a ``RunProfiler`` which node, tool or LLM call each thread runs."""
+
+    # Must run on the thread that executes the node so it can be sampled
+    run_inline = True
+
+    def __init__(self, profiler: RunProfiler):
+        super().__init__()
+        self.profiler = profiler
+
+    def on_chain_start(
+        self, serialized: Dict[str, Any], inputs: Any, *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any,
+    ) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        label = f"node:{node}" if node and kwargs.get("name") == node else None
+        self.profiler.enter(run_id, parent_run_id, label)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, **kwargs: Any,
+    ) -> None:
+        self.profiler.enter(run_id, parent_run_id, f"tool:{(serialized or {}).get('name', 'unknown')}")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, **kwargs: Any,
+    ) -> None:
+        self.profiler.enter(run_id, parent_run_id, "llm")
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, **kwargs: Any,
+    ) -> None:
+        self.profiler.enter(run_id, parent_run_id, "llm")
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.profiler.exit(run_id)
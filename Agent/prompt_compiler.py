@@ -0,0 +1,233 @@
+"""Compact, deterministic rendering of prompt context under token budgets.
+
+Prompts used to interpolate pydantic objects through their ``repr`` and
+inline whole files. The renderers here turn a ``Plan``, a task list and file
+contents into compact plain text, and cut each section down to its token
+budget (lists keep their first entries, files keep their head and tail)
+with an explicit marker of what was left out.
+
+Token counts use a local approximation of BPE tokenizers, so budgets are
+deterministic and need no tokenizer download. Running the module checks the
+size of every prompt template for fixed fixtures against the sizes recorded
+in ``prompt_sizes.json`` and fails when one grew::
+
+    python -m Agent.prompt_compiler            # check
+    python -m Agent.prompt_compiler --update   # record the current sizes
+"""
+
+import argparse
+import json
+import math
+import pathlib
+import re
+import sys
+from typing import Dict, List, Optional, Sequence
+
+# Words, digit groups, punctuation runs and line breaks roughly map to one
+# token each; long words and punctuation runs are split like BPE would
+_PIECES = re.compile(r" ?[A-Za-z]+| ?\d{1,3}| ?\w+| ?[^\s\w]+|\n+|[^\S\n]+")
+
+# Default per-section budgets, in approximate tokens
+PLAN_TOKENS = 1200
+TASKS_TOKENS = 6000
+FILE_TOKENS = 3000
+
+SIZES_FILE = pathlib.Path(__file__).with_name("prompt_sizes.json")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens a BPE tokenizer produces for ``text``."""
+    tokens = 0
+    for match in _PIECES.finditer(text):
+        piece = match.group().lstrip(" ")
+        if not piece or piece.isspace():
+            tokens += 1
+        elif piece.isascii() and piece.isalpha():
+            tokens += math.ceil(len(piece) / 6)
+        elif piece.isdigit():
+            tokens += 1
+        else:
+            # Punctuation runs and non-ASCII words split into short pieces
+            tokens += math.ceil(len(piece) / 2)
+    return tokens
+
+
+def _fit_lines(lines: Sequence[str], budget: Optional[int], noun: str) -> List[str]:
+    """Keep leading items within ``budget`` and summarize the rest."""
+    if budget is None:
+        return list(lines)
+    kept: List[str] = []
+    used = 0
+    for n, line in enumerate(lines):
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"... ({len(lines) - n} more {noun} omitted)")
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def _one_line(text: str) -> str:
+    return " ".join(text.split())
+
+
+def render_plan(plan, budget: Optional[int] = PLAN_TOKENS) -> str:
+    """Render a ``Plan`` as compact labelled lines.
+
+    Args:
+        plan: Plan from the planner
+        budget: Approximate token budget for features and files (None: unlimited)
+
+    Returns:
+        The rendered plan
+    """
+    lines = [
+        f"Name: {_one_line(plan.name)}",
+        f"Description: {_one_line(plan.description)}",
+        f"Tech stack: {_one_line(plan.techstack)}",
+    ]
+    # Extended plans (e.g. a UI direction) add their extra fields after the core ones
+    for name, value in plan.model_dump(exclude={"name", "description", "techstack", "features", "files"}).items():
+        if isinstance(value, str) and value.strip():
+            lines.append(f"{name.replace('_', ' ').capitalize()}: {_one_line(value)}")
+    half = None if budget is None else budget // 2
+    lines.append("Features: " + "; ".join(_fit_lines([_one_line(f) for f in plan.features], half, "features")))
+    lines.append("Files: " + ", ".join(_fit_lines([_one_line(f) for f in plan.files], half, "files")))
+    return "\n".join(lines)
+
+
+def render_tasks(tasks, budget: Optional[int] = TASKS_TOKENS) -> str:
+    """Render implementation tasks as numbered ``path: description`` blocks.
+
+    Descriptions are kept verbatim (apart from surrounding whitespace) so that
+    a model can repeat them word for word.
+
+    Args:
+        tasks: ImplementationTasks in order
+        budget: Approximate token budget (None: unlimited)
+
+    Returns:
+        The rendered tasks
+    """
+    blocks = [f"{n}. {task.filepath}: {task.task_description.strip()}" for n, task in enumerate(tasks, 1)]
+    return "\n".join(_fit_lines(blocks, budget, "tasks"))
+
+
+def render_file_context(path: str, content: str, budget: Optional[int] = FILE_TOKENS) -> str:
+    """Render existing file content, keeping its head and tail within ``budget``.
+
+    Args:
+        path: File path, named in the omission marker
+        content: Current file content ("" for a new file)
+        budget: Approximate token budget (None: unlimited)
+
+    Returns:
+        The content, or a marker for a new file
+    """
+    if not content.strip():
+        return "(new file)"
+    if budget is None or count_tokens(content) <= budget:
+        return content
+    lines = content.splitlines()
+    head: List[str] = []
+    tail: List[str] = []
+    used = 0
+    i, j = 0, len(lines) - 1
+    # Two thirds of the budget for the head, the rest for the tail
+    while i <= j and used + count_tokens(lines[i]) + 1 <= budget * 2 // 3:
+        used += count_tokens(lines[i]) + 1
+        head.append(lines[i])
+        i += 1
+    while i <= j and used + count_tokens(lines[j]) + 1 <= budget:
+        used += count_tokens(lines[j]) + 1
+        tail.append(lines[j])
+        j -= 1
+    omitted = j - i + 1
+    marker = f"... [{omitted} lines omitted; call read_file('{path}') for the full content] ..."
+    return "\n".join(head + [marker] + tail[::-1])
+
+
+def _fixtures() -> Dict[str, str]:
+    """Render every prompt template for fixed inputs."""
+    from .prompts import planner_prompt, lean_planner_prompt, fast_path_prompt, architect_prompt, coder_system_prompt, coder_task_prompt
+    from .states import Plan, LeanPlan, ImplementationTask
+
+    plan = Plan(
+        name="Task Board",
+        description="A kanban board for small teams",
+        techstack="React + TypeScript, Vite, Tailwind CSS",
+        features=["Create, edit and delete tasks", "Drag tasks between columns", "Filter by assignee", "Dark mode"],
+        files=[f"src/components/{name}.tsx" for name in ("Board", "Column", "TaskCard", "Filters")] + ["src/App.tsx"],
+    )
+    lean_plan = LeanPlan(
+        **plan.model_dump(),
+        ui_direction="Minimal and airy, neutral grays with an indigo accent, Inter for text",
+    )
+    tasks = [
+        ImplementationTask(
+            filepath=path,
+            task_description=f"Implement {path} with typed props, loading and empty states, and Tailwind styling.",
+        )
+        for path in plan.files
+    ]
+    component = "\n".join(
+        f"export const Item{n} = ({{ label }}: {{ label: string }}) => <li className=\"p-2\">{{label}}</li>;"
+        for n in range(400)
+    )
+    return {
+        "planner": planner_prompt("A kanban board for small teams with drag and drop and dark mode"),
+        "planner_revision": planner_prompt("The kanban board, plus due dates", "A kanban board", plan),
+        "planner_lean": lean_planner_prompt("A kanban board for small teams with drag and drop and dark mode"),
+        "architect_lean": architect_prompt(lean_plan),
+        "fast_path": fast_path_prompt("A single-page tip calculator", 6),
+        "coder_system_lean": coder_system_prompt(lean_plan.ui_direction),
+        "architect": architect_prompt(plan),
+        "architect_revision": architect_prompt(plan, tasks),
+        "coder_system": coder_system_prompt(),
+        "coder_new_file": coder_task_prompt([(tasks[0], render_file_context(tasks[0].filepath, ""))]),
+        "coder_large_file": coder_task_prompt([(tasks[1], render_file_context(tasks[1].filepath, component))]),
+        "coder_group": coder_task_prompt([(t, render_file_context(t.filepath, "")) for t in tasks[:3]]),
+    }
+
+
+def measure() -> Dict[str, int]:
+    """Return the approximate token size of every prompt template fixture."""
+    return {name: count_tokens(text) for name, text in sorted(_fixtures().items())}
+
+
+def check(recorded: Dict[str, int], sizes: Dict[str, int]) -> List[str]:
+    """Return a message for every fixture that grew beyond its recorded size."""
+    problems = []
+    for name, size in sizes.items():
+        if name not in recorded:
+            problems.append(f"{name}: {size} tokens, no recorded size (run with --update)")
+        elif size > recorded[name]:
+            problems.append(f"{name}: {size} tokens, recorded {recorded[name]} (+{size - recorded[name]})")
+    return problems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check prompt template sizes against the recorded sizes")
+    parser.add_argument("--update", action="store_true", help="Record the current sizes")
+    parser.add_argument("--sizes", type=pathlib.Path, default=SIZES_FILE, help="Recorded sizes (JSON)")
+    args = parser.parse_args(argv)
+
+    sizes = measure()
+    if args.update:
+        args.sizes.write_text(json.dumps(sizes, indent=2) + "\n", encoding="utf-8")
+        print(f"Recorded {len(sizes)} prompt sizes in {args.sizes}")
+        return 0
+
+    recorded = json.loads(args.sizes.read_text(encoding="utf-8")) if args.sizes.is_file() else {}
+    for name, size in sizes.items():
+        before = recorded.get(name)
+        print(f"{name:20} {size:6}" + (f"  (recorded {before})" if before is not None else ""))
+    problems = check(recorded, sizes)
+    for problem in problems:
+        print(f"FAIL {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,16 @@
 """Prompt templates for the multi-agent system."""
 
+from .config import get_prompt_budgets
+from .prompt_compiler import render_plan, render_tasks
 
-def planner_prompt(user_prompt: str) -> str:
+
+def planner_prompt(user_prompt: str, previous_prompt: str = None, previous_plan=None) -> str:
     """Generate the planner agent prompt.
     
     Args:
         user_prompt: The user's project description
+        previous_prompt: The request an existing project was generated from, when revising it
+        previous_plan: The Plan of the existing project, when revising it
         
     Returns:
         The formatted prompt for the planner agent
@@ -72,14 +77,93 @@ IMPORTANT RULES:
 
 Return the plan in clear, well-formatted sections.
     """
+    if previous_plan is not None:
+        PLANNER_PROMPT += _planner_revision(previous_prompt, previous_plan)
+    return PLANNER_PROMPT
+
+
+def lean_planner_prompt(user_prompt: str, previous_prompt: str = None, previous_plan=None) -> str:
+    """Generate the lean planner prompt, which asks only for the LeanPlan fields.
+    
+    Args:
+        user_prompt: The user's project description
+        previous_prompt: The request an existing project was generated from, when revising it
+        previous_plan: The Plan of the existing project, when revising it
+        
+    Returns:
+        The formatted prompt for the planner agent
+    """
+    PLANNER_PROMPT = f"""
+You are the PLANNER agent. Turn the user's request into a web application plan.
+
+USER REQUEST:
+{user_prompt}
+
+Fill in ONLY these fields, tersely:
+- name: short app name
+- description: one sentence
+- techstack: one line naming framework, language, styling and state management (e.g. "React + TypeScript, Vite, Tailwind CSS, Zustand")
+- features: must-have features, a few words each, including empty/loading/error states where relevant
+- files: the complete list of source file paths to create, dependencies first
+- ui_direction: one or two sentences on visual style, color palette and typography
+
+No prose outside these fields.
+    """
+    if previous_plan is not None:
+        PLANNER_PROMPT += _planner_revision(previous_prompt, previous_plan)
     return PLANNER_PROMPT
 
 
-def architect_prompt(plan) -> str:
+def fast_path_prompt(user_prompt: str, max_files: int) -> str:
+    """Generate the prompt that builds a small app in a single call.
+    
+    Args:
+        user_prompt: The user's project description
+        max_files: Most files the app may have
+        
+    Returns:
+        The formatted prompt for single-shot generation
+    """
+    FAST_PATH_PROMPT = f"""
+You are a senior web engineer. Build the user's small app in ONE response.
+
+USER REQUEST:
+{user_prompt}
+
+RULES:
+- Plain HTML, CSS and JavaScript with no build step, unless the request names a framework
+- At most {max_files} files; index.html is the entry point
+- Every file referenced by another file (scripts, stylesheets, images) must be included
+- Responsive, accessible layout with semantic HTML
+- Complete, working content for every file; no placeholders or TODOs
+
+Fill in name, description, techstack and files (path and full content of each file).
+    """
+    return FAST_PATH_PROMPT
+
+
+def _planner_revision(previous_prompt: str, previous_plan) -> str:
+    """Revision instructions appended to a planner prompt."""
+    return f"""
+REVISION:
+The user request above revises an EXISTING project that was generated from this request:
+{previous_prompt}
+
+EXISTING PLAN:
+{render_plan(previous_plan, budget=None)}
+
+- Keep the name, tech stack, features and files of the existing plan unless the revised request changes them
+- Keep unchanged entries word for word and in the same order
+- Only add, change or remove what the revision requires
+"""
+
+
+def architect_prompt(plan, previous_tasks=None) -> str:
     """Generate the architect agent prompt.
     
     Args:
         plan: The Plan object from the planner agent
+        previous_tasks: The ImplementationTasks of the existing project, when revising it
         
     Returns:
         The formatted prompt for the architect agent
@@ -91,7 +175,7 @@ Your task is to translate the project plan into PRECISE, FILE-LEVEL ENGINEERING
 Think like a Staff Engineer designing a scalable web system.
 
 PROJECT PLAN:
-{plan}
+{render_plan(plan, get_prompt_budgets()["plan"])}
 
 OUTPUT REQUIREMENTS:
 Generate an ordered list of IMPLEMENTATION TASKS.
@@ -135,12 +219,26 @@ Task 2:
 
 Do NOT write code. Only write engineering instructions.
     """
+    if previous_tasks:
+        ARCHITECT_PROMPT += f"""
+REVISION:
+The plan above revises an EXISTING project that was implemented from these tasks (file: description):
+
+{render_tasks(previous_tasks, budget=None)}
+
+- For every file the revision does not affect, repeat its task with the SAME file path and the SAME description, word for word
+- Only add, change or remove the tasks the revision requires, and update tasks of files that use changed files
+- Only files whose tasks differ will be regenerated
+"""
     return ARCHITECT_PROMPT
 
 
-def coder_system_prompt() -> str:
+def coder_system_prompt(ui_direction: str = "") -> str:
     """Generate the system prompt for the coder agent.
     
+    Args:
+        ui_direction: UI direction of a lean project plan, if any
+        
     Returns:
         The system prompt for the coder agent
     """
@@ -179,4 +277,47 @@ OUTPUT RULES:
 
 You are a senior engineer writing code that will be reviewed.
     """
+    if ui_direction.strip():
+        CODER_SYSTEM_PROMPT += f"\nUI DIRECTION OF THE PROJECT PLAN:\n{' '.join(ui_direction.split())}\n"
     return CODER_SYSTEM_PROMPT
+
+
+def coder_task_prompt(files, draft=None) -> str:
+    """Generate the coder's user prompt for one file or a group of related files.
+    
+    Args:
+        files: (ImplementationTask, rendered existing content) pairs
+        draft: Optional (filepath, task description, content) of a similar
+            earlier task to adapt
+        
+    Returns:
+        The formatted user prompt for the coder agent
+    """
+    if len(files) == 1:
+        task, content = files[0]
+        prompt = (
+            f"Task: {task.task_description}\n"
+            f"File: {task.filepath}\n"
+            f"Existing content:\n{content}\n"
+            "Use write_file(path, content) to save your changes."
+        )
+    else:
+        sections = [
+            f"Implement the following {len(files)} related files in this session. "
+            "Call write_file(path, content) once for EACH file with its complete content."
+        ]
+        for n, (task, content) in enumerate(files, 1):
+            sections.append(
+                f"--- File {n} of {len(files)} ---\n"
+                f"Task: {task.task_description}\n"
+                f"File: {task.filepath}\n"
+                f"Existing content:\n{content}"
+            )
+        prompt = "\n\n".join(sections) + "\n"
+    if draft is not None:
+        filepath, description, content = draft
+        prompt += (
+            f"\nDraft for {filepath} from a similar earlier task ({description}); "
+            f"adapt it to this task instead of starting from scratch:\n{content}\n"
+        )
+    return prompt
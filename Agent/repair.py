@@ -0,0 +1,460 @@
+"""Targeted repair of structured LLM output.
+
+``with_structured_output`` returns ``None`` (or raises) as soon as any part
+of the model's answer fails to parse or validate, which used to abort the
+whole planner or architect node. ``invoke_structured`` asks for the raw
+message alongside the parsed object and, when parsing fails:
+
+1. repairs the JSON locally (code fences, trailing commas, comments,
+   smart quotes, unclosed brackets) and coerces common shape mistakes
+   (wrapper objects, synonymous keys, strings instead of lists and vice
+   versa) without another LLM call;
+2. re-asks the model only for the fields, or the list items, that still
+   fail validation, with the validation errors attached and the valid
+   part of the answer as context;
+3. after the retry budget is spent, drops list items that are still
+   invalid rather than failing the run, as long as some items remain.
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple, Type, Union, get_args, get_origin
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, ValidationError, create_model
+
+logger = logging.getLogger(__name__)
+
+# Keys models commonly use instead of the schema's field names
+_FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "filepath": ("file", "path", "file_path", "filename", "file_name"),
+    "task_description": ("description", "task", "details", "instructions", "instruction"),
+    "implementation_steps": ("steps", "tasks", "implementation_tasks", "plan"),
+    "techstack": ("tech_stack", "stack", "technologies", "technology"),
+    "features": ("feature_list", "key_features"),
+    "files": ("file_list", "project_files"),
+    "name": ("app_name", "project_name", "title"),
+}
+
+# Wrapper keys that models put around the actual object
+_WRAPPER_KEYS = ("arguments", "properties", "data", "result", "output", "response", "args")
+
+
+class StructuredOutputError(ValueError):
+    """Raised when structured output cannot be repaired within the retry budget."""
+
+
+@dataclass
+class RepairReport:
+    """What was needed to obtain a valid structured response."""
+    schema: str
+    local_fixes: List[str] = field(default_factory=list)
+    reasks: int = 0
+    reasked_fields: List[str] = field(default_factory=list)
+    dropped_items: List[str] = field(default_factory=list)
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.local_fixes or self.reasks or self.dropped_items)
+
+
+# Local JSON repair
+
+def _extract_json_text(text: str) -> Optional[str]:
+    """Return the most likely JSON object or array in free-form model text."""
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    return text[min(starts):].strip()
+
+
+def _close_brackets(text: str) -> str:
+    """Append the closing quotes and brackets of a truncated JSON document."""
+    stack: List[str] = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    text = re.sub(r",\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Tuple[Optional[Any], List[str]]:
+    """Parse JSON from model text, applying local fixes as needed.
+
+    Args:
+        text: Raw model output
+
+    Returns:
+        A tuple of (parsed value or None, names of the fixes applied)
+    """
+    fixes: List[str] = []
+    candidate = _extract_json_text(text)
+    if candidate is None:
+        return None, fixes
+    if candidate != text.strip():
+        fixes.append("extracted JSON from surrounding text")
+
+    steps = (
+        ("replaced smart quotes", lambda s: s.replace("“", '"').replace("”", '"').replace("’", "'")),
+        ("removed comments", lambda s: re.sub(r"(?m)^\s*//.*$|/\*.*?\*/", "", s, flags=re.DOTALL)),
+        ("removed trailing commas", lambda s: re.sub(r",\s*([}\]])", r"\1", s)),
+        ("converted Python literals", lambda s: re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", s)))),
+        ("closed truncated JSON", _close_brackets),
+    )
+    try:
+        return json.loads(candidate), fixes
+    except json.JSONDecodeError:
+        pass
+    for name, step in steps:
+        repaired = step(candidate)
+        if repaired == candidate:
+            continue
+        candidate = repaired
+        fixes.append(name)
+        try:
+            return json.loads(candidate), fixes
+        except json.JSONDecodeError:
+            continue
+    try:
+        # Trailing data after a complete object (e.g. a closing remark)
+        value, _ = json.JSONDecoder().raw_decode(candidate)
+        fixes.append("dropped trailing text")
+        return value, fixes
+    except json.JSONDecodeError:
+        return None, fixes
+
+
+# Coercion of common shape mistakes
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(key).lower())
+
+
+def _list_item_model(annotation: Any) -> Optional[Type[BaseModel]]:
+    """Return the model type of a ``List[Model]`` annotation, if it is one."""
+    if get_origin(annotation) in (list, List):
+        args = get_args(annotation)
+        if args and isinstance(args[0], type) and issubclass(args[0], BaseModel):
+            return args[0]
+    return None
+
+
+def _is_str_list(annotation: Any) -> bool:
+    return get_origin(annotation) in (list, List) and get_args(annotation) == (str,)
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def coerce(schema: Type[BaseModel], data: Any, fixes: List[str]) -> Any:
+    """Reshape ``data`` towards ``schema`` without changing its meaning.
+
+    Args:
+        schema: Target model
+        data: Parsed JSON from the model
+        fixes: List that receives a description of every coercion applied
+
+    Returns:
+        The coerced data (validation still has to be run on it)
+    """
+    fields = schema.model_fields
+    list_fields = [name for name, info in fields.items() if get_origin(info.annotation) in (list, List)]
+
+    if isinstance(data, list) and len(list_fields) == 1 and len(fields) == 1:
+        fixes.append(f"wrapped bare list into {schema.__name__}.{list_fields[0]}")
+        data = {list_fields[0]: data}
+    if not isinstance(data, dict):
+        return data
+
+    # {"Plan": {...}} or {"arguments": {...}}
+    if len(data) == 1:
+        (key, value), = data.items()
+        if isinstance(value, (dict, list)) and key not in fields and (
+            _normalize_key(key) == _normalize_key(schema.__name__) or key in _WRAPPER_KEYS
+        ):
+            fixes.append(f"unwrapped '{key}'")
+            return coerce(schema, value, fixes)
+
+    result = dict(data)
+    normalized = {_normalize_key(k): k for k in result}
+    for name, info in fields.items():
+        if name in result:
+            continue
+        candidates = (name,) + _FIELD_ALIASES.get(name, ())
+        for alias in candidates:
+            source = normalized.get(_normalize_key(alias))
+            if source is not None and source not in fields:
+                result[name] = result.pop(source)
+                fixes.append(f"renamed '{source}' to '{name}'")
+                break
+
+    for name, info in fields.items():
+        if name not in result:
+            continue
+        value = result[name]
+        annotation = _unwrap_optional(info.annotation)
+        item_model = _list_item_model(annotation)
+        if item_model is not None:
+            if isinstance(value, dict):
+                value = [value]
+                fixes.append(f"wrapped single {name} item into a list")
+            if isinstance(value, list):
+                value = [coerce(item_model, item, fixes) for item in value]
+        elif _is_str_list(annotation):
+            if isinstance(value, str):
+                value = [part.strip(" -*\t") for part in re.split(r"\n|,", value) if part.strip(" -*\t")]
+                fixes.append(f"split {name} string into a list")
+            elif isinstance(value, list):
+                flattened = []
+                for item in value:
+                    if isinstance(item, dict):
+                        text = item.get("path") or item.get("name") or next(
+                            (v for v in item.values() if isinstance(v, str)), None)
+                        if text is not None:
+                            fixes.append(f"flattened {name} object to '{text}'")
+                            flattened.append(text)
+                            continue
+                    flattened.append(item if isinstance(item, str) else json.dumps(item))
+                value = flattened
+        elif annotation is str:
+            if isinstance(value, list) and all(isinstance(v, str) for v in value):
+                value = ", ".join(value)
+                fixes.append(f"joined {name} list into a string")
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = str(value)
+                fixes.append(f"converted {name} to a string")
+        result[name] = value
+    return result
+
+
+# Targeted re-asking
+
+def _failures(error: ValidationError, schema: Type[BaseModel]) -> Tuple[Dict[str, List[str]], Dict[str, Dict[int, List[str]]]]:
+    """Split validation errors into failed fields and failed list items."""
+    fields: Dict[str, List[str]] = {}
+    items: Dict[str, Dict[int, List[str]]] = {}
+    for err in error.errors():
+        loc = err.get("loc") or ()
+        if not loc:
+            continue
+        name = str(loc[0])
+        message = f"{'.'.join(str(p) for p in loc)}: {err.get('msg')}"
+        info = schema.model_fields.get(name)
+        if (
+            info is not None and len(loc) > 1 and isinstance(loc[1], int)
+            and _list_item_model(_unwrap_optional(info.annotation)) is not None
+        ):
+            items.setdefault(name, {}).setdefault(loc[1], []).append(message)
+        else:
+            fields.setdefault(name, []).append(message)
+    return fields, items
+
+
+def _repair_model(schema: Type[BaseModel], field_names: Set[str], item_fields: Dict[str, Type[BaseModel]]) -> Type[BaseModel]:
+    """Build a model holding only the parts of ``schema`` that need to be re-asked."""
+    definitions: Dict[str, Any] = {}
+    for name in sorted(field_names):
+        info = schema.model_fields[name]
+        definitions[name] = (info.annotation, info)
+    for name, item_model in item_fields.items():
+        definitions[name] = (List[item_model], ...)
+    model = create_model(f"{schema.__name__}Repair", **definitions)
+    model.__doc__ = f"Corrected parts of a {schema.__name__}."
+    return model
+
+
+def _repair_prompt(
+    prompt: Any, schema: Type[BaseModel], data: Dict[str, Any],
+    fields: Dict[str, List[str]], items: Dict[str, Dict[int, List[str]]],
+) -> str:
+    valid = {k: v for k, v in data.items() if k not in fields and k not in items}
+    for name, failed in items.items():
+        valid[name] = [item for i, item in enumerate(data.get(name) or []) if i not in failed]
+    lines = [
+        f"Your previous answer for the {schema.__name__} below failed validation. "
+        "Do NOT repeat the parts that are already valid; answer ONLY with corrected values for the parts listed.",
+        "",
+        "ORIGINAL REQUEST:",
+        str(prompt),
+        "",
+        "VALID PART OF YOUR ANSWER (context only):",
+        json.dumps(valid, indent=2, ensure_ascii=False, default=str),
+    ]
+    if fields:
+        lines += ["", "FIELDS TO PROVIDE AGAIN:"]
+        for name, messages in fields.items():
+            lines.append(f"- {name} (previous value: {json.dumps(data.get(name), ensure_ascii=False, default=str)})")
+            lines += [f"    error: {m}" for m in messages]
+    for name, failed in items.items():
+        lines += ["", f"ITEMS OF '{name}' TO PROVIDE AGAIN, in this order (return exactly {len(failed)} items):"]
+        for index, messages in sorted(failed.items()):
+            previous = data.get(name, [])[index] if index < len(data.get(name, [])) else None
+            lines.append(f"- item {index}: {json.dumps(previous, ensure_ascii=False, default=str)}")
+            lines += [f"    error: {m}" for m in messages]
+    return "\n".join(lines)
+
+
+def _to_data(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return value
+
+
+def _raw_data(raw: Any, fixes: List[str]) -> Optional[Any]:
+    """Recover the structured payload from the raw model message."""
+    if isinstance(raw, AIMessage):
+        if raw.tool_calls:
+            return raw.tool_calls[0].get("args")
+        for call in raw.additional_kwargs.get("tool_calls") or []:
+            arguments = (call.get("function") or {}).get("arguments")
+            if isinstance(arguments, str):
+                value, parse_fixes = repair_json(arguments)
+                fixes.extend(parse_fixes)
+                if value is not None:
+                    return value
+        content = raw.content if isinstance(raw.content, str) else json.dumps(raw.content, default=str)
+    else:
+        content = str(raw) if raw is not None else ""
+    value, parse_fixes = repair_json(content)
+    fixes.extend(parse_fixes)
+    return value
+
+
+def _structured_call(llm: BaseChatModel, schema: Type[BaseModel], prompt: Any, config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Invoke the model for ``schema`` and return the raw/parsed/parsing_error dict."""
+    try:
+        runnable = llm.with_structured_output(schema, include_raw=True)
+    except (TypeError, NotImplementedError, ValueError):
+        # Providers without include_raw support can only be checked for a result
+        parsed = llm.with_structured_output(schema).invoke(prompt, config=config)
+        return {"raw": None, "parsed": parsed, "parsing_error": None}
+    result = runnable.invoke(prompt, config=config)
+    if isinstance(result, dict) and "parsed" in result:
+        return result
+    return {"raw": None, "parsed": result, "parsing_error": None}
+
+
+def invoke_structured(
+    llm: BaseChatModel,
+    schema: Type[BaseModel],
+    prompt: Any,
+    max_repairs: int = 2,
+    config: Optional[Dict[str, Any]] = None,
+) -> Tuple[BaseModel, RepairReport]:
+    """Get a validated ``schema`` instance, repairing bad output where possible.
+
+    Args:
+        llm: Chat model supporting ``with_structured_output``
+        schema: Pydantic model to produce
+        prompt: Prompt for the initial request
+        max_repairs: Targeted re-asks allowed after local repair fails
+        config: Optional runnable config for the LLM calls
+
+    Returns:
+        A tuple of (validated instance, repair report)
+
+    Raises:
+        StructuredOutputError: If no valid instance can be produced
+    """
+    report = RepairReport(schema=schema.__name__)
+    result = _structured_call(llm, schema, prompt, config)
+    parsed = result.get("parsed")
+    if isinstance(parsed, schema):
+        return parsed, report
+
+    data = _raw_data(result.get("raw"), report.local_fixes) if parsed is None else _to_data(parsed)
+    if data is None:
+        raise StructuredOutputError(
+            f"{schema.__name__}: the model returned no usable output ({result.get('parsing_error')})"
+        )
+    data = coerce(schema, data, report.local_fixes)
+    report.local_fixes = list(dict.fromkeys(report.local_fixes))
+
+    for attempt in range(max_repairs + 1):
+        try:
+            instance = schema.model_validate(data)
+        except ValidationError as e:
+            error = e
+        else:
+            if report.repaired:
+                logger.info(
+                    f"Repaired {schema.__name__}: {len(report.local_fixes)} local fixes, "
+                    f"{report.reasks} re-asks ({', '.join(report.reasked_fields) or 'none'})"
+                )
+            return instance, report
+        if not isinstance(data, dict):
+            break
+
+        fields, items = _failures(error, schema)
+        if attempt == max_repairs:
+            break
+        item_models = {name: _list_item_model(_unwrap_optional(schema.model_fields[name].annotation)) for name in items}
+        repair_schema = _repair_model(schema, set(fields), item_models)
+        report.reasks += 1
+        report.reasked_fields += list(fields) + [f"{name}[{i}]" for name, failed in items.items() for i in sorted(failed)]
+        logger.warning(
+            f"{schema.__name__} failed validation; re-asking for "
+            f"{', '.join(list(fields) + [f'{len(f)} {n} items' for n, f in items.items()])}"
+        )
+        reply = _structured_call(llm, repair_schema, _repair_prompt(prompt, schema, data, fields, items), config)
+        patch = reply.get("parsed")
+        patch = _to_data(patch) if patch is not None else _raw_data(reply.get("raw"), report.local_fixes)
+        if not isinstance(patch, dict):
+            continue
+        patch = coerce(repair_schema, patch, report.local_fixes)
+        report.local_fixes = list(dict.fromkeys(report.local_fixes))
+        data = dict(data)
+        for name in fields:
+            if name in patch:
+                data[name] = patch[name]
+        for name, failed in items.items():
+            replacements = patch.get(name)
+            if not isinstance(replacements, list):
+                continue
+            merged = list(data.get(name) or [])
+            for index, replacement in zip(sorted(failed), replacements):
+                merged[index] = _to_data(replacement)
+            data[name] = merged
+
+    # Out of budget: drop list items that are still invalid, keep the rest
+    fields, items = _failures(error, schema) if isinstance(data, dict) else ({"__root__": [str(error)]}, {})
+    if not fields and items:
+        data = dict(data)
+        for name, failed in items.items():
+            kept = [item for i, item in enumerate(data[name]) if i not in failed]
+            report.dropped_items += [f"{name}[{i}]" for i in sorted(failed)]
+            data[name] = kept
+        try:
+            instance = schema.model_validate(data)
+        except ValidationError as e:
+            error = e
+        else:
+            if all(data[name] for name in items):
+                logger.warning(f"{schema.__name__}: dropped invalid items {', '.join(report.dropped_items)}")
+                return instance, report
+    raise StructuredOutputError(f"{schema.__name__} is still invalid after {report.reasks} re-asks: {error}")
@@ -0,0 +1,200 @@
+"""Incremental regeneration of an existing project.
+
+Every run stores its ``Plan`` and the coder's task list in
+``<project>/.companio/plan.json``. A revise run hands the stored plan to the
+planner and architect so that they keep unaffected parts word for word,
+diffs the new task list against the stored one per file, and only sends
+files to the coder whose tasks were added or changed, that depend on a
+changed file, or that are missing on disk. All other files stay as they
+are.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Set
+
+from .plan_optimizer import normalize_filepath, task_references, normalize_description
+from .states import Plan, LeanPlan, ImplementationTask
+from .tools import is_hidden_path
+
+logger = logging.getLogger(__name__)
+
+# Directory inside a project with agent metadata; file tools never list it
+REVISION_DIR = ".companio"
+REVISION_FILE = "plan.json"
+REVISION_VERSION = 1
+
+
+def revision_path(project_root) -> pathlib.Path:
+    """Return where the plan of a project is stored."""
+    return pathlib.Path(project_root) / REVISION_DIR / REVISION_FILE
+
+
+def save_revision(project_root, user_prompt: str, plan: Plan, tasks: List[ImplementationTask]) -> pathlib.Path:
+    """Store the plan and task list a project was generated from.
+
+    Args:
+        project_root: Project directory
+        user_prompt: Prompt the project was generated from
+        plan: The planner's output
+        tasks: All coder tasks of the project, after plan optimization
+
+    Returns:
+        Path of the stored plan
+    """
+    path = revision_path(project_root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "version": REVISION_VERSION,
+        "saved_at": time.time(),
+        "user_prompt": user_prompt,
+        "plan": plan.model_dump(),
+        "tasks": [task.model_dump() for task in tasks],
+    }
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+    logger.info(f"Saved project plan to {path}")
+    return path
+
+
+def load_revision(project_root) -> Dict[str, Any]:
+    """Load the stored plan of a project as initial graph state for a revise run.
+
+    Args:
+        project_root: Project directory generated by an earlier run
+
+    Returns:
+        State keys ``previous_prompt``, ``previous_plan`` and ``previous_tasks``
+
+    Raises:
+        FileNotFoundError: If the project has no stored plan
+        ValueError: If the stored plan cannot be read
+    """
+    path = revision_path(project_root)
+    if not path.is_file():
+        raise FileNotFoundError(f"No stored plan in {project_root}; generate the project first")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        plan_schema = LeanPlan if "ui_direction" in data["plan"] else Plan
+        return {
+            "previous_prompt": data.get("user_prompt", ""),
+            "previous_plan": plan_schema.model_validate(data["plan"]),
+            "previous_tasks": [ImplementationTask.model_validate(t) for t in data["tasks"]],
+        }
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid stored plan {path}: {e}") from e
+
+
+@dataclass
+class TaskPlanDiff:
+    """Per-file difference between the stored and the new task list."""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    dependents: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    techstack_changed: bool = False
+
+    @property
+    def selected(self) -> Set[str]:
+        """Files the coder has to (re)generate."""
+        return set(self.added) | set(self.changed) | set(self.dependents) | set(self.missing)
+
+    def to_dict(self) -> Dict[str, Any]:
+        selected = self.selected
+        return {
+            **asdict(self),
+            "selected": len(selected),
+            "skipped": sum(path not in selected for path in self.unchanged),
+        }
+
+
+def _tasks_by_file(tasks: List[ImplementationTask]) -> Dict[str, str]:
+    """Map each file to the normalized text of all its tasks, in order."""
+    by_file: Dict[str, List[str]] = {}
+    for task in tasks:
+        by_file.setdefault(normalize_filepath(task.filepath), []).append(normalize_description(task.task_description))
+    return {path: "\n".join(descriptions) for path, descriptions in by_file.items()}
+
+
+def diff_task_plans(
+    previous_tasks: List[ImplementationTask],
+    tasks: List[ImplementationTask],
+    previous_plan: Optional[Plan] = None,
+    plan: Optional[Plan] = None,
+    existing_files: Optional[Set[str]] = None,
+) -> TaskPlanDiff:
+    """Compare two task lists file by file.
+
+    Files whose tasks mention an added or changed file are marked as
+    dependents, transitively. If the tech stack changed every file is
+    treated as changed.
+
+    Args:
+        previous_tasks: Tasks the project was generated from
+        tasks: Tasks of the revised plan
+        previous_plan: Plan the project was generated from
+        plan: Revised plan
+        existing_files: Normalized paths of the files on disk, to regenerate missing ones
+
+    Returns:
+        The diff
+    """
+    old, new = _tasks_by_file(previous_tasks), _tasks_by_file(tasks)
+    diff = TaskPlanDiff()
+    diff.techstack_changed = bool(
+        previous_plan is not None and plan is not None
+        and normalize_description(previous_plan.techstack) != normalize_description(plan.techstack)
+    )
+    for path, text in new.items():
+        if path not in old:
+            diff.added.append(path)
+        elif diff.techstack_changed or old[path] != text:
+            diff.changed.append(path)
+        else:
+            diff.unchanged.append(path)
+            if existing_files is not None and path not in existing_files:
+                diff.missing.append(path)
+    diff.removed = [path for path in old if path not in new]
+
+    # Files that refer to a changed file are regenerated so that imports and
+    # usages stay in sync with it
+    references: Dict[str, Set[str]] = {}
+    for i, refs in task_references(tasks).items():
+        references.setdefault(normalize_filepath(tasks[i].filepath), set()).update(refs)
+    dirty = set(diff.added) | set(diff.changed) | set(diff.removed)
+    frontier = set(dirty)
+    while frontier:
+        frontier = {
+            path for path in diff.unchanged
+            if path not in dirty and references.get(path, set()) & frontier
+        }
+        dirty |= frontier
+        diff.dependents.extend(sorted(frontier))
+    return diff
+
+
+def select_revision_tasks(tasks: List[ImplementationTask], diff: TaskPlanDiff) -> List[ImplementationTask]:
+    """Return the tasks of the files the coder has to (re)generate, in order."""
+    selected = diff.selected
+    return [task for task in tasks if normalize_filepath(task.filepath) in selected]
+
+
+def project_files(project_root) -> Set[str]:
+    """Return the normalized paths of the files of a project, without agent metadata."""
+    root = pathlib.Path(project_root)
+    if not root.is_dir():
+        return set()
+    return {
+        normalize_filepath(str(f.relative_to(root)))
+        for f in root.glob("**/*")
+        if f.is_file() and not is_hidden_path(f.relative_to(root))
+    }
@@ -0,0 +1,236 @@
+"""Local scaffold library for framework boilerplate files.
+
+The architect routinely emits tasks for standard config and entry files
+(Vite/React/TypeScript config, ``index.html``, ``main.tsx``, Tailwind
+config). Those files hardly vary between projects, so matching tasks are
+satisfied directly from these templates instead of an LLM round trip.
+
+A scaffold matches when every keyword in ``stacks`` and none of its
+``conflicts`` appear in ``Plan.techstack``, the task's file path equals
+``path``, ``Plan.files`` lists the files the template refers to
+(``requires``) and the task description mentions none of the
+``disqualifiers`` (which hint at custom content the template cannot
+provide). ``package.json`` is left to the LLM: its dependencies depend on
+what the rest of the project imports.
+"""
+
+import html
+import re
+from dataclasses import dataclass
+from string import Template
+from typing import Optional, Set, Tuple
+
+from .states import Plan, ImplementationTask
+
+
+@dataclass(frozen=True)
+class Scaffold:
+    """A boilerplate file template."""
+    path: str
+    stacks: Tuple[str, ...]
+    template: str
+    disqualifiers: Tuple[str, ...] = ()
+    conflicts: Tuple[str, ...] = ()
+    # Each group names alternative paths, one of which Plan.files must list
+    requires: Tuple[Tuple[str, ...], ...] = ()
+
+_VITE_CONFIG = """import { defineConfig } from 'vite';
+import react from '@vitejs/plugin-react';
+
+// https://vitejs.dev/config/
+export default defineConfig({
+  plugins: [react()],
+});
+"""
+
+_INDEX_HTML = """<!doctype html>
+<html lang="en">
+  <head>
+    <meta charset="UTF-8" />
+    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
+    <meta name="description" content="$description" />
+    <title>$title</title>
+  </head>
+  <body>
+    <div id="root"></div>
+    <script type="module" src="/$entry"></script>
+  </body>
+</html>
+"""
+
+_MAIN_ENTRY = """import { StrictMode } from 'react';
+import { createRoot } from 'react-dom/client';
+import App from './App';
+import './index.css';
+
+createRoot(document.getElementById('root')$non_null).render(
+  <StrictMode>
+    <App />
+  </StrictMode>,
+);
+"""
+
+_TSCONFIG = """{
+  "compilerOptions": {
+    "target": "ES2020",
+    "useDefineForClassFields": true,
+    "lib": ["ES2020", "DOM", "DOM.Iterable"],
+    "module": "ESNext",
+    "skipLibCheck": true,
+    "moduleResolution": "bundler",
+    "allowImportingTsExtensions": true,
+    "resolveJsonModule": true,
+    "isolatedModules": true,
+    "noEmit": true,
+    "jsx": "react-jsx",
+    "strict": true,
+    "noUnusedLocals": true,
+    "noUnusedParameters": true,
+    "noFallthroughCasesInSwitch": true
+  },
+  "include": ["src"],
+  "references": [{ "path": "./tsconfig.node.json" }]
+}
+"""
+
+_TSCONFIG_NODE = """{
+  "compilerOptions": {
+    "composite": true,
+    "skipLibCheck": true,
+    "module": "ESNext",
+    "moduleResolution": "bundler",
+    "allowSyntheticDefaultImports": true,
+    "strict": true
+  },
+  "include": ["vite.config.ts"]
+}
+"""
+
+_TAILWIND_CONFIG = """/** @type {import('tailwindcss').Config} */
+export default {
+  content: ['./index.html', './src/**/*.{js,ts,jsx,tsx}'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
+"""
+
+_POSTCSS_CONFIG = """export default {
+  plugins: {
+    tailwindcss: {},
+    autoprefixer: {},
+  },
+};
+"""
+
+_TAILWIND_CSS = """@tailwind base;
+@tailwind components;
+@tailwind utilities;
+"""
+
+_GITIGNORE = """node_modules
+dist
+dist-ssr
+*.local
+.env
+.DS_Store
+"""
+
+_CUSTOM_CONTENT = ("alias", "proxy", "pwa", "plugin", "environment variable", "env var")
+_CUSTOM_ENTRY = ("router", "provider", "store", "query", "theme", "context", "redux", "service worker")
+_CUSTOM_STYLES = ("font", "variable", "custom", "animation", "keyframe", "color", "colour", "palette", "extend")
+# Frameworks that use React but not the Vite project layout
+_NOT_VITE = ("next", "native", "remix", "expo")
+_ENTRIES = ("src/main.tsx", "src/main.jsx")
+
+SCAFFOLDS: Tuple[Scaffold, ...] = (
+    Scaffold("vite.config.ts", ("react", "typescript", "vite"), _VITE_CONFIG, _CUSTOM_CONTENT, _NOT_VITE),
+    Scaffold("vite.config.js", ("react", "vite"), _VITE_CONFIG, _CUSTOM_CONTENT, _NOT_VITE),
+    Scaffold("tsconfig.json", ("react", "typescript", "vite"), _TSCONFIG, ("paths", "alias", "baseurl"), _NOT_VITE),
+    Scaffold("tsconfig.node.json", ("react", "typescript", "vite"), _TSCONFIG_NODE, (), _NOT_VITE),
+    Scaffold("index.html", ("react", "vite"), _INDEX_HTML, ("font", "analytics", "manifest", "open graph"), _NOT_VITE,
+             requires=(_ENTRIES,)),
+    Scaffold("src/main.tsx", ("react", "typescript", "vite"), _MAIN_ENTRY, _CUSTOM_ENTRY, _NOT_VITE,
+             requires=(("src/App.tsx", "src/App.jsx"), ("src/index.css",))),
+    Scaffold("src/main.jsx", ("react", "vite"), _MAIN_ENTRY, _CUSTOM_ENTRY, _NOT_VITE,
+             requires=(("src/App.jsx", "src/App.js"), ("src/index.css",))),
+    Scaffold("src/vite-env.d.ts", ("react", "typescript", "vite"), '/// <reference types="vite/client" />\n', (), _NOT_VITE),
+    Scaffold("tailwind.config.js", ("tailwind", "vite"), _TAILWIND_CONFIG, _CUSTOM_STYLES + ("plugin", "dark mode"), _NOT_VITE),
+    Scaffold("tailwind.config.ts", ("tailwind", "typescript", "vite"), _TAILWIND_CONFIG,
+             _CUSTOM_STYLES + ("plugin", "dark mode"), _NOT_VITE),
+    Scaffold("postcss.config.js", ("tailwind", "vite"), _POSTCSS_CONFIG, (), _NOT_VITE),
+    Scaffold("src/index.css", ("tailwind",), _TAILWIND_CSS, _CUSTOM_STYLES + ("global style", "reset")),
+    Scaffold(".gitignore", ("vite",), _GITIGNORE, (), _NOT_VITE),
+)
+
+
+def _normalize_path(path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+def slugify(name: str) -> str:
+    """Convert a project name into an npm-compatible package name."""
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+    return slug or "app"
+
+
+def _plan_paths(plan: Plan) -> Set[str]:
+    """Return the normalized paths in ``Plan.files``, which may carry a trailing purpose."""
+    paths = set()
+    for entry in plan.files:
+        words = entry.split()
+        if words:
+            paths.add(_normalize_path(words[0].rstrip(":,")))
+    return paths
+
+
+def find_scaffold(plan: Optional[Plan], task: ImplementationTask) -> Optional[Scaffold]:
+    """Return the scaffold that satisfies ``task``, or None if it needs the LLM."""
+    if plan is None:
+        return None
+    techstack = plan.techstack.lower()
+    path = _normalize_path(task.filepath)
+    description = task.task_description.lower()
+    plan_paths = _plan_paths(plan)
+    for scaffold in SCAFFOLDS:
+        if scaffold.path != path:
+            continue
+        if not all(keyword in techstack for keyword in scaffold.stacks):
+            continue
+        if any(keyword in techstack for keyword in scaffold.conflicts):
+            continue
+        if any(keyword in description for keyword in scaffold.disqualifiers):
+            continue
+        if not all(plan_paths.intersection(group) for group in scaffold.requires):
+            continue
+        return scaffold
+    return None
+
+
+def render_scaffold(plan: Plan, task: ImplementationTask, scaffold: Scaffold) -> str:
+    """Render a scaffold with light parameterization from the plan."""
+    plan_paths = _plan_paths(plan)
+    typescript = "typescript" in plan.techstack.lower()
+    # Prefer the entry matching the stack's language, but use the one the plan lists
+    preferred = _ENTRIES if typescript else _ENTRIES[::-1]
+    entry = next((path for path in preferred if path in plan_paths), preferred[0])
+    return Template(scaffold.template).safe_substitute(
+        name=plan.name,
+        slug=slugify(plan.name),
+        title=html.escape(plan.name),
+        description=html.escape(plan.description),
+        entry=entry,
+        non_null="!" if scaffold.path.endswith(".tsx") else "",
+    )
+
+
+def scaffold_for_task(plan: Optional[Plan], task: ImplementationTask) -> Optional[str]:
+    """Return rendered boilerplate for ``task``, or None if the task is custom."""
+    scaffold = find_scaffold(plan, task)
+    if scaffold is None:
+        return None
+    return render_scaffold(plan, task, scaffold)
@@ -0,0 +1,320 @@
+"""Headless HTTP API for running the agent as a service.
+
+A small asyncio HTTP/1.1 server (standard library only) that queues
+generation jobs onto a bounded ``JobManager`` pool and streams progress
+over Server-Sent Events.
+
+Endpoints:
+    GET    /health                       Liveness and queue statistics
+    POST   /jobs                         Submit {"prompt": ..., "recursion_limit": ..., "revises": job_id, "deadline": seconds}
+    GET    /jobs                         List known jobs
+    GET    /jobs/{id}                    Job status and summary
+    DELETE /jobs/{id}                    Cancel a job
+    GET    /jobs/{id}/events             SSE stream of node, file and status events
+    GET    /jobs/{id}/files              List generated files
+    GET    /jobs/{id}/files/{path}       Download a single generated file
+    GET    /jobs/{id}/artifact           Download the workspace as a zip archive
+
+Run locally against the stand-in model with:
+    python -m Agent.server --stand-in
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import pathlib
+import zipfile
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .jobs import Job, JobManager, JobQueueFull
+from .tools import is_hidden_path
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+SSE_HEARTBEAT_SECONDS = 15.0
+
+_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    """An error that is reported to the client as a JSON response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AgentServer:
+    """Serves the job API on top of a shared job manager."""
+
+    def __init__(self, manager: JobManager):
+        self.manager = manager
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8000) -> None:
+        """Start listening and serve until cancelled."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+        logger.info(f"Agent API listening on {addresses}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle a single request; connections are closed after each response."""
+        try:
+            method, path, headers, body = await self._read_request(reader)
+            await self._dispatch(method, path, headers, body, writer)
+        except HTTPError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Unhandled error while serving request: {e}", exc_info=True)
+            try:
+                await self._send_json(writer, 500, {"error": "Internal server error"})
+            except ConnectionError:
+                pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise ConnectionError("Empty request")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path, headers, body
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+
+        if parts == ["health"]:
+            self._require(method, "GET")
+            await self._send_json(writer, 200, {
+                "status": "ok",
+                "workers": self.manager.max_workers,
+                "pending": self.manager.pending_count(),
+            })
+            return
+
+        if parts == ["jobs"]:
+            if method == "POST":
+                await self._submit(body, writer)
+            else:
+                self._require(method, "GET")
+                await self._send_json(writer, 200, {"jobs": [j.to_dict() for j in self.manager.list_jobs()]})
+            return
+
+        if len(parts) >= 2 and parts[0] == "jobs":
+            job = self.manager.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"Unknown job: {parts[1]}")
+            rest = parts[2:]
+            if not rest:
+                if method == "DELETE":
+                    cancelled = self.manager.cancel(job.job_id)
+                    await self._send_json(writer, 200 if cancelled else 409, job.to_dict())
+                else:
+                    self._require(method, "GET")
+                    await self._send_json(writer, 200, job.to_dict())
+                return
+            self._require(method, "GET")
+            if rest == ["events"]:
+                await self._stream_events(job, headers, writer)
+                return
+            if rest == ["files"]:
+                await self._send_json(writer, 200, {"files": _list_workspace(job)})
+                return
+            if rest[0] == "files" and len(rest) > 1:
+                data = await asyncio.to_thread(_read_workspace_file, job, "/".join(rest[1:]))
+                await self._send(writer, 200, data, "application/octet-stream")
+                return
+            if rest == ["artifact"]:
+                data = await asyncio.to_thread(_zip_workspace, job)
+                await self._send(writer, 200, data, "application/zip", {
+                    "Content-Disposition": f'attachment; filename="{job.job_id}.zip"',
+                })
+                return
+
+        raise HTTPError(404, f"Not found: {path}")
+
+    async def _submit(self, body: bytes, writer: asyncio.StreamWriter) -> None:
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "Request body must be a JSON object")
+        recursion_limit = payload.get("recursion_limit", 100)
+        if not isinstance(recursion_limit, int) or not 0 < recursion_limit <= 1000:
+            raise HTTPError(400, "recursion_limit must be an integer between 1 and 1000")
+        revises = payload.get("revises")
+        if revises is not None and not isinstance(revises, str):
+            raise HTTPError(400, "revises must be a job ID")
+        deadline = payload.get("deadline")
+        if deadline is not None and (isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or deadline <= 0):
+            raise HTTPError(400, "deadline must be a positive number of seconds")
+        try:
+            job = self.manager.submit(
+                str(payload.get("prompt", "")), recursion_limit=recursion_limit, revises=revises, deadline=deadline
+            )
+        except JobQueueFull as e:
+            raise HTTPError(503, str(e))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        await self._send_json(writer, 202, job.to_dict())
+
+    async def _stream_events(self, job: Job, headers: Dict[str, str], writer: asyncio.StreamWriter) -> None:
+        """Stream job events as Server-Sent Events until the job finishes.
+
+        Clients that reconnect with a ``Last-Event-ID`` header resume after
+        the last event they received.
+        """
+        cursor = 0
+        last_event_id = headers.get("last-event-id")
+        if last_event_id and last_event_id.isdigit():
+            cursor = int(last_event_id) + 1
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        await writer.drain()
+
+        while True:
+            events, cursor = await asyncio.to_thread(
+                self.manager.events_since, job.job_id, cursor, SSE_HEARTBEAT_SECONDS
+            )
+            if events:
+                for event in events:
+                    writer.write(
+                        f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
+                    )
+            else:
+                writer.write(b": keep-alive\n\n")
+            await writer.drain()
+            if job.status.finished and cursor >= len(job.events):
+                break
+
+    def _require(self, method: str, expected: str) -> None:
+        if method != expected:
+            raise HTTPError(405, f"Method {method} not allowed")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+        await self._send(writer, status, json.dumps(payload, default=str).encode("utf-8"), "application/json")
+
+    async def _send(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        content_type: str,
+        extra_headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(len(body)),
+            "Connection": "close",
+            **(extra_headers or {}),
+        }
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers.items()) + "\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def _list_workspace(job: Job) -> list:
+    if not job.workspace.is_dir():
+        return []
+    return sorted(
+        str(f.relative_to(job.workspace)) for f in job.workspace.glob("**/*")
+        if f.is_file() and not is_hidden_path(f.relative_to(job.workspace))
+    )
+
+
+def _read_workspace_file(job: Job, relative_path: str) -> bytes:
+    root = job.workspace.resolve()
+    p = (root / relative_path).resolve()
+    try:
+        p.relative_to(root)
+    except ValueError:
+        raise HTTPError(400, "Path escapes the job workspace")
+    if not p.is_file():
+        raise HTTPError(404, f"File not found: {relative_path}")
+    return p.read_bytes()
+
+
+def _zip_workspace(job: Job) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for relative_path in _list_workspace(job):
+            archive.write(job.workspace / relative_path, relative_path)
+    return buffer.getvalue()
+
+
+def main() -> None:
+    """Command line entry point for the API server."""
+    parser = argparse.ArgumentParser(description="Run the agent HTTP API server")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--workers", type=int, default=2, help="Concurrent generation jobs (default: 2)")
+    parser.add_argument("--max-queue", type=int, default=16, help="Maximum queued jobs before rejecting (default: 16)")
+    parser.add_argument("--workspaces", type=pathlib.Path, default=None, help="Directory for job workspaces")
+    parser.add_argument("--stand-in", action="store_true", help="Use the offline stand-in model instead of the configured provider")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.stand_in:
+        from . import graph
+        from .stand_in import StandInChatModel
+        graph.llm = StandInChatModel()
+
+    manager = JobManager(max_workers=args.workers, workspace_root=args.workspaces, max_pending=args.max_queue)
+    try:
+        asyncio.run(AgentServer(manager).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("Server stopped by user.")
+    finally:
+        manager.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
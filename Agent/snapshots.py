@@ -0,0 +1,331 @@
+"""Per-step snapshots of a project with instant rollback.
+
+Before ``write_file`` replaces a file, the snapshot store makes sure the
+old content is kept, and it stages the new content. The coder commits the
+staged changes as one step per completed task. File contents are stored once
+each under ``<project>/.companio/snapshots/objects``, keyed by their SHA-256.
+Each step is saved as a small manifest, ``steps/<n>.json``, that lists only
+the paths the step changed. A step therefore costs as much as the files it
+touched.
+
+Any step can be restored by copying its blobs back into place, which takes
+milliseconds. Two steps can be diffed. Rollbacks are recorded as steps of
+their own, so they can be undone as well::
+
+    python -m Agent.snapshots list [--project DIR]
+    python -m Agent.snapshots diff 3 5 [--patch]
+    python -m Agent.snapshots rollback 3 [--path src/App.tsx]
+
+Only file tool writes are tracked; changes made by ``run_cmd`` or by hand are
+captured the next time a tool writes the same file.
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import stat
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = pathlib.PurePath(".companio", "snapshots")
+BASELINE_LABEL = "baseline"
+
+
+class SnapshotStore:
+    """Content-addressed snapshots of the files of one project.
+
+    Args:
+        project_root: Project directory; snapshots live in its ``.companio/snapshots``
+    """
+
+    def __init__(self, project_root: pathlib.Path):
+        self.project_root = pathlib.Path(project_root).resolve()
+        self.root = self.project_root / SNAPSHOT_DIR
+        self.objects = self.root / "objects"
+        self.steps_dir = self.root / "steps"
+        self._lock = threading.RLock()
+        self._steps: List[Dict[str, Any]] = []
+        # Committed state: relative path -> digest (None for deleted files)
+        self._current: Dict[str, Optional[str]] = {}
+        self._pending: Dict[str, Optional[str]] = {}
+        self._baseline: Dict[str, Optional[str]] = {}
+        if self.steps_dir.is_dir():
+            for path in sorted(self.steps_dir.glob("*.json")):
+                try:
+                    step = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable snapshot step {path}: {e}")
+                    continue
+                self._steps.append(step)
+                self._current.update(step["changes"])
+
+    def _relative(self, target: pathlib.Path) -> str:
+        return pathlib.Path(target).resolve().relative_to(self.project_root).as_posix()
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        """Return the on-disk path of a stored file content."""
+        return self.objects / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` once and return its SHA-256 digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if path.exists():
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        """Return a stored file content."""
+        return self.blob_path(digest).read_bytes()
+
+    def preserve(self, target: pathlib.Path) -> None:
+        """Keep the current content of ``target`` before it is replaced.
+
+        Only content the snapshots do not know yet is copied: files that
+        predate the snapshots or were changed outside the file tools.
+        """
+        path = self._relative(target)
+        with self._lock:
+            if path in self._pending or path in self._baseline:
+                return
+            known = self._current.get(path)
+            try:
+                data = pathlib.Path(target).read_bytes()
+            except FileNotFoundError:
+                if known is not None:
+                    self._baseline[path] = None
+                return
+            digest = hashlib.sha256(data).hexdigest()
+            if digest != known:
+                self._baseline[path] = self.put(data)
+
+    def record(self, target: pathlib.Path, data: Optional[bytes]) -> None:
+        """Stage the new content of ``target`` (None: the file was deleted)."""
+        path = self._relative(target)
+        digest = self.put(data) if data is not None else None
+        with self._lock:
+            self._pending[path] = digest
+
+    def commit(self, label: str) -> Optional[int]:
+        """Save the staged changes as a new step.
+
+        Args:
+            label: What the step did, e.g. the files of a coder task
+
+        Returns:
+            The step number, or None if nothing changed
+        """
+        with self._lock:
+            if self._baseline:
+                self._save_step(BASELINE_LABEL, self._baseline)
+                self._baseline = {}
+            changes = {path: digest for path, digest in self._pending.items() if self._current.get(path) != digest}
+            self._pending = {}
+            if not changes:
+                return None
+            return self._save_step(label, changes)
+
+    def _save_step(self, label: str, changes: Dict[str, Optional[str]]) -> int:
+        number = self._steps[-1]["step"] + 1 if self._steps else 1
+        step = {"step": number, "label": label, "time": time.time(), "changes": changes}
+        self.steps_dir.mkdir(parents=True, exist_ok=True)
+        path = self.steps_dir / f"{number:06d}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(step, indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+        self._steps.append(step)
+        self._current.update(changes)
+        return number
+
+    def steps(self) -> List[Dict[str, Any]]:
+        """Return every step with its number, label, time and changed paths."""
+        with self._lock:
+            return [
+                {"step": s["step"], "label": s["label"], "time": s["time"], "files": sorted(s["changes"])}
+                for s in self._steps
+            ]
+
+    def manifest(self, step: Optional[int] = None) -> Dict[str, str]:
+        """Return the files of the project after ``step`` (default: the latest).
+
+        Raises:
+            KeyError: If the step does not exist
+        """
+        with self._lock:
+            if step is not None and not any(s["step"] == step for s in self._steps) and step != 0:
+                raise KeyError(f"No snapshot step {step}")
+            # Files first seen in a baseline step existed unchanged before it
+            files: Dict[str, Optional[str]] = {}
+            seen = set()
+            for s in self._steps:
+                for path, digest in s["changes"].items():
+                    if path not in seen and s["label"] == BASELINE_LABEL:
+                        files[path] = digest
+                seen.update(s["changes"])
+            for s in self._steps:
+                if step is not None and s["step"] > step:
+                    break
+                files.update(s["changes"])
+            return {path: digest for path, digest in files.items() if digest is not None}
+
+    def diff(self, from_step: int, to_step: Optional[int] = None, patch: bool = False) -> Dict[str, Any]:
+        """Compare the project between two steps.
+
+        Args:
+            from_step: Earlier step (0: before the first step)
+            to_step: Later step (default: the latest)
+            patch: Include a unified diff of every changed text file
+
+        Returns:
+            Dictionary with added, removed and modified paths, and the patch
+            text if requested
+        """
+        old, new = self.manifest(from_step), self.manifest(to_step)
+        result: Dict[str, Any] = {
+            "added": sorted(set(new) - set(old)),
+            "removed": sorted(set(old) - set(new)),
+            "modified": sorted(path for path in set(old) & set(new) if old[path] != new[path]),
+        }
+        if patch:
+            chunks = []
+            for path in sorted(set(old) | set(new)):
+                if old.get(path) == new.get(path):
+                    continue
+                before = self._text(old.get(path))
+                after = self._text(new.get(path))
+                chunks.extend(difflib.unified_diff(
+                    before, after,
+                    f"a/{path}" if path in old else "/dev/null",
+                    f"b/{path}" if path in new else "/dev/null",
+                ))
+            result["patch"] = "".join(chunks)
+        return result
+
+    def _text(self, digest: Optional[str]) -> List[str]:
+        if digest is None:
+            return []
+        return self.read(digest).decode("utf-8", errors="replace").splitlines(keepends=True)
+
+    def rollback(
+        self,
+        step: int,
+        write: Callable[[pathlib.Path, bytes], None],
+        delete: Callable[[pathlib.Path], None],
+        paths: Optional[Iterable[str]] = None,
+    ) -> List[str]:
+        """Restore the project, or some of its files, to their state after ``step``.
+
+        Files that did not exist at that step are deleted. The restore is
+        committed as a new step, so it can be undone like any other.
+
+        Args:
+            step: Step to restore (0: before the first step)
+            write: Called as write(target, data) to restore a file
+            delete: Called as delete(target) to remove a file
+            paths: Restore only these project-relative paths
+
+        Returns:
+            The restored paths
+
+        Raises:
+            KeyError: If the step does not exist
+        """
+        with self._lock:
+            target = self.manifest(step)
+            current = self.manifest()
+            selected = set(target) | set(current) if paths is None else {pathlib.PurePath(p).as_posix() for p in paths}
+            restored = []
+            for path in sorted(selected):
+                digest = target.get(path)
+                if digest == current.get(path):
+                    continue
+                file = self.project_root / path
+                if digest is None:
+                    delete(file)
+                else:
+                    write(file, self.read(digest))
+                restored.append(path)
+            self.commit(f"rollback to step {step}")
+            return restored
+
+
+_stores: Dict[pathlib.Path, SnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(project_root: pathlib.Path) -> SnapshotStore:
+    """Return the shared snapshot store of a project, loading it on first use."""
+    root = pathlib.Path(project_root).resolve()
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None:
+            store = SnapshotStore(root)
+            _stores[root] = store
+        return store
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point for inspecting and restoring snapshots."""
+    parser = argparse.ArgumentParser(description="List, diff and restore per-step project snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="List the steps of a project")
+    diff_parser = commands.add_parser("diff", help="Show what changed between two steps")
+    diff_parser.add_argument("from_step", type=int, help="Earlier step (0: before the first step)")
+    diff_parser.add_argument("to_step", type=int, nargs="?", help="Later step (default: the latest)")
+    diff_parser.add_argument("--patch", action="store_true", help="Print a unified diff")
+    rollback_parser = commands.add_parser("rollback", help="Restore the project to a step")
+    rollback_parser.add_argument("step", type=int, help="Step to restore (0: before the first step)")
+    rollback_parser.add_argument("--path", action="append", dest="paths", help="Only restore this file (repeatable)")
+    for sub in (list_parser, diff_parser, rollback_parser):
+        sub.add_argument("--project", type=pathlib.Path, default=None,
+                         help="Project directory (default: generated_project)")
+    args = parser.parse_args(argv)
+
+    from .tools import PROJECT_ROOT, rollback_project, use_project_root
+
+    project = args.project or PROJECT_ROOT
+    if not (project / SNAPSHOT_DIR).is_dir():
+        parser.error(f"No snapshots in {project}")
+    store = get_snapshot_store(project)
+    try:
+        if args.command == "list":
+            for step in store.steps():
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(step["time"]))
+                print(f"{step['step']:5}  {stamp}  {step['label']}  ({len(step['files'])} files)")
+        elif args.command == "diff":
+            result = store.diff(args.from_step, args.to_step, patch=args.patch)
+            if args.patch:
+                print(result.pop("patch"), end="")
+            else:
+                print(json.dumps(result, indent=2))
+        else:
+            with use_project_root(project):
+                restored = rollback_project(args.step, args.paths)
+            print(f"Restored {len(restored)} files to step {args.step}: {', '.join(restored) or 'nothing to do'}")
+    except KeyError as e:
+        print(f"Error: {e.args[0]}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Deterministic stand-in chat model for running the graph offline.
+
+The stand-in answers structured-output requests with canned but valid
+``Plan``/``TaskPlan``/``FileBundle`` objects and drives the coder through real
+``write_file`` tool calls, so the whole graph, the job manager and the
+HTTP server can be exercised locally without an API key.
+"""
+
+import asyncio
+import itertools
+import json
+import re
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from .states import Plan, TaskPlan, ImplementationTask, FileBundle, GeneratedFile
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _prompt_text(value: Any) -> str:
+    """Flatten a prompt value or message list into plain text."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_prompt_text(m) for m in value)
+    if isinstance(value, BaseMessage):
+        return value.content if isinstance(value.content, str) else str(value.content)
+    if isinstance(value, dict) and "content" in value:
+        return str(value["content"])
+    return str(value)
+
+
+class StandInChatModel(BaseChatModel):
+    """Offline chat model that produces a small static web app.
+
+    Attributes:
+        delay: Seconds to sleep per call, to emulate provider latency
+        delay_schedule: Per-call delays cycled through instead of ``delay``,
+            e.g. ``[0.1, 0.1, 2.0]`` to inject a slow tail
+        files: File paths of the generated project
+        stream_chunk_size: Characters of tool-call arguments per streamed chunk
+    """
+    delay: float = 0.0
+    delay_schedule: List[float] = []
+    files: List[str] = ["index.html", "src/styles.css", "src/app.js"]
+    stream_chunk_size: int = 16
+
+    def model_post_init(self, __context: Any) -> None:
+        self._calls = itertools.count()
+        self._calls_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stand-in"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Runnable:
+        """Tools are resolved by name in the emitted tool calls, so binding is a no-op."""
+        return self
+
+    def with_structured_output(self, schema: Any, include_raw: bool = False, **kwargs: Any) -> Runnable:
+        """Return a runnable that answers with a canned instance of ``schema``.
+
+        With ``include_raw`` the answer is wrapped like LangChain does it:
+        ``{"raw": AIMessage, "parsed": instance, "parsing_error": None}``.
+        """
+        def build(prompt: Any) -> Any:
+            parsed = self.structured_response(schema, _prompt_text(prompt))
+            if not include_raw:
+                return parsed
+            return {"raw": AIMessage(content=parsed.model_dump_json()), "parsed": parsed, "parsing_error": None}
+
+        def respond(prompt: Any) -> Any:
+            self._sleep()
+            return build(prompt)
+
+        async def arespond(prompt: Any) -> Any:
+            await asyncio.sleep(self._next_delay())
+            return build(prompt)
+        return RunnableLambda(respond, afunc=arespond)
+
+    def structured_response(self, schema: Any, prompt: str) -> Any:
+        """Build the canned response for a structured-output schema.
+
+        Raises:
+            NotImplementedError: If the stand-in has no response for ``schema``
+        """
+        if isinstance(schema, type) and issubclass(schema, Plan):
+            request = re.search(r"USER REQUEST:\s*\n(.+)", prompt)
+            extra = {"ui_direction": "Minimal light theme, system font stack"} if "ui_direction" in schema.model_fields else {}
+            return schema(
+                name="Stand-in App",
+                description=f"Stand-in app for: {request.group(1).strip()[:80] if request else 'the request'}",
+                techstack="html, css, javascript",
+                features=["static page", "basic interactivity"],
+                files=list(self.files),
+                **extra,
+            )
+        if isinstance(schema, type) and issubclass(schema, TaskPlan):
+            return schema(implementation_steps=[
+                ImplementationTask(filepath=path, task_description=f"Implement {path} for the stand-in app")
+                for path in self.files
+            ])
+        if isinstance(schema, type) and issubclass(schema, FileBundle):
+            return schema(
+                name="Stand-in App",
+                description="Single-shot stand-in app",
+                techstack="html, css, javascript",
+                files=[GeneratedFile(path=path, content=self._file_content(path)) for path in self.files],
+            )
+        raise NotImplementedError(f"Stand-in model has no response for schema {schema!r}")
+
+    def _file_content(self, path: str) -> str:
+        if path.endswith(".html"):
+            scripts = "".join(f'<script src="{p}"></script>' for p in self.files if p.endswith(".js"))
+            styles = "".join(f'<link rel="stylesheet" href="{p}">' for p in self.files if p.endswith(".css"))
+            return f"<!DOCTYPE html>\n<html><head>{styles}</head><body>{scripts}</body></html>\n"
+        return f"/* {path} generated by the stand-in model */\n"
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self._sleep()
+        return self._respond(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        # Sleeping on the event loop lets a hedged duplicate cancel this call
+        await asyncio.sleep(self._next_delay())
+        return self._respond(messages)
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = _prompt_text(messages)
+        last = messages[-1] if messages else None
+        content, tool_calls = "Nothing to do.", []
+        if isinstance(last, ToolMessage):
+            content = "Done."
+        else:
+            # One write_file call per requested file, emitted in a single turn
+            paths = re.findall(r"^File: (\S+)", _prompt_text(last), re.MULTILINE)
+            if paths:
+                content = ""
+                tool_calls = [{
+                    "name": "write_file",
+                    "args": {"path": path, "content": f"/* {path} generated by the stand-in model */\n"},
+                    "id": f"call_{n}_{abs(hash(path)) % 10**8}",
+                } for n, path in enumerate(paths)]
+        input_tokens = _estimate_tokens(prompt)
+        output_tokens = _estimate_tokens(content + str(tool_calls))
+        message = AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        """Stream the response, with tool-call arguments split into JSON fragments."""
+        self._sleep()
+        message = self._respond(messages).generations[0].message
+        chunks = [AIMessageChunk(content=message.content)]
+        for index, call in enumerate(message.tool_calls):
+            args = json.dumps(call["args"])
+            pieces = [args[i:i + self.stream_chunk_size] for i in range(0, len(args), self.stream_chunk_size)]
+            for n, piece in enumerate(pieces):
+                chunks.append(AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": call["name"] if n == 0 else None,
+                    "args": piece,
+                    "id": call["id"] if n == 0 else None,
+                    "index": index,
+                }]))
+        chunks[-1].usage_metadata = message.usage_metadata
+        for chunk in chunks:
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+    def _next_delay(self) -> float:
+        if not self.delay_schedule:
+            return self.delay
+        with self._calls_lock:
+            call = next(self._calls)
+        return self.delay_schedule[call % len(self.delay_schedule)]
+
+    def _sleep(self) -> None:
+        delay = self._next_delay()
+        if delay > 0:
+            time.sleep(delay)
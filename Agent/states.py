@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field, ConfigDict, field_validator
 from typing import TypedDict
 
@@ -25,6 +25,11 @@ class Plan(BaseModel):
         return v.strip()
 
 
+class LeanPlan(Plan):
+    """Plan produced by the lean planner, with a compact UI direction for the coder."""
+    ui_direction: str = Field(default="", description="One or two sentences of UI direction: visual style, color palette, typography")
+
+
 class ImplementationTask(BaseModel):
     """A single implementation task."""
     filepath: str = Field(description="The path to the file to be modified")
@@ -44,11 +49,29 @@ class TaskPlan(BaseModel):
     model_config = ConfigDict(extra="allow")
 
 
+class GeneratedFile(BaseModel):
+    """A complete file produced by single-shot generation."""
+    path: str = Field(description="The path of the file relative to the project root, e.g. 'index.html'")
+    content: str = Field(description="The complete content of the file")
+
+
+class FileBundle(BaseModel):
+    """All files of a small app, generated in one call by the fast path."""
+    name: str = Field(description="The name of the app")
+    description: str = Field(description="A one-line description of the app")
+    techstack: str = Field(description="The tech stack used, e.g. 'html, css, javascript'")
+    files: List[GeneratedFile] = Field(description="Every file of the app with its complete content")
+
+
 class CoderState(BaseModel):
     """State of the coder agent during implementation."""
     task_plan: TaskPlan = Field(description="The plan for the task to be implemented")
     current_step_idx: int = Field(default=0, description="The index of the current step in the implementation steps")
     current_file_content: Optional[str] = Field(default=None, description="The content of the file currently being edited or created")
+    scaffolded_files: int = Field(default=0, description="Number of tasks satisfied from the local scaffold library")
+    cached_files: int = Field(default=0, description="Number of tasks satisfied from the similarity cache")
+    generated_files: int = Field(default=0, description="Number of tasks implemented by the LLM")
+    llm_sessions: int = Field(default=0, description="Number of coder LLM sessions, each covering one or more related tasks")
 
     @field_validator("current_step_idx")
     @classmethod
@@ -64,4 +87,11 @@ class AgentState(TypedDict):
     project_plan: Plan
     architect_plan: List[ImplementationTask]
     coder_state: CoderState
+    plan_report: Dict[str, Any]  # What the plan optimizer changed
+    project_tasks: List[ImplementationTask]  # All tasks of the project, including those a revision skips
+    previous_prompt: str  # Revise mode: request the project was generated from
+    previous_plan: Plan  # Revise mode: stored plan of the project
+    previous_tasks: List[ImplementationTask]  # Revise mode: stored tasks of the project
+    revision_report: Dict[str, Any]  # Revise mode: which files are regenerated
+    fast_path_report: Dict[str, Any]  # How the fast path classified the request and whether it was used
     status: str  # Tracking agent status
@@ -0,0 +1,260 @@
+"""Streaming of coder output to disk while tokens arrive.
+
+``write_file`` only runs once the model has produced the whole tool call,
+so large files used to appear on disk in one go at the very end.
+``StreamingWriteCallback`` makes the coder's model stream and decodes the
+``content`` argument of each ``write_file`` tool call as its JSON fragments
+arrive, appending it to ``.companio/partial/<path>.partial`` in the
+project and emitting ``file_progress`` events. When the model call ends the
+partial file is registered with ``write_file``, which commits it with an
+atomic rename if it matches the final content and rewrites the file
+otherwise.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .tools import emit_event, partial_path_for, register_streamed_file, safe_path_for_project
+
+logger = logging.getLogger(__name__)
+
+# Minimum time between two file_progress events of the same file
+PROGRESS_INTERVAL = 0.25
+
+_PLAIN = re.compile(r'[^"\\]+')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonStringFields:
+    """Incrementally decode the top-level string fields of a streamed JSON object.
+
+    Args:
+        on_text: Called as on_text(key, text) with each decoded fragment of a value
+        on_end: Called as on_end(key) when a string value is complete
+    """
+
+    def __init__(self, on_text: Callable[[str, str], None], on_end: Callable[[str], None]):
+        self.on_text = on_text
+        self.on_end = on_end
+        self._depth = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._in_string = False
+        self._is_key = False
+        self._escape = False
+        self._unicode: Optional[str] = None
+        self._high_surrogate: Optional[int] = None
+        self._key_parts: List[str] = []
+
+    def feed(self, data: str) -> None:
+        """Consume the next fragment of the JSON text."""
+        i, n = 0, len(data)
+        while i < n:
+            if self._in_string:
+                i = self._feed_string(data, i)
+                continue
+            c = data[i]
+            i += 1
+            if c in "{[":
+                self._depth += 1
+                self._expect_key = self._depth == 1 and c == "{"
+            elif c in "}]":
+                self._depth -= 1
+            elif c == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._expect_key
+                self._key_parts = []
+            elif c == ":" and self._depth == 1:
+                self._expect_key = False
+            elif c == "," and self._depth == 1:
+                self._expect_key = True
+                self._key = None
+
+    def _feed_string(self, data: str, i: int) -> int:
+        if self._unicode is not None:
+            while i < len(data) and len(self._unicode) < 4:
+                self._unicode += data[i]
+                i += 1
+            if len(self._unicode) == 4:
+                self._emit(self._decode_unicode(int(self._unicode, 16)))
+                self._unicode = None
+            return i
+        if self._escape:
+            self._escape = False
+            if data[i] == "u":
+                self._unicode = ""
+            else:
+                self._emit(_ESCAPES.get(data[i], data[i]))
+            return i + 1
+        match = _PLAIN.match(data, i)
+        if match:
+            self._emit(match.group())
+            return match.end()
+        if data[i] == "\\":
+            self._escape = True
+        else:
+            self._in_string = False
+            if self._is_key:
+                self._key = "".join(self._key_parts)
+            elif self._depth == 1 and self._key is not None:
+                self.on_end(self._key)
+        return i + 1
+
+    def _decode_unicode(self, code: int) -> str:
+        if 0xD800 <= code < 0xDC00:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code < 0xE000 and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
+
+    def _emit(self, text: str) -> None:
+        if not text:
+            return
+        if self._is_key:
+            self._key_parts.append(text)
+        elif self._depth == 1 and self._key is not None:
+            self.on_text(self._key, text)
+
+
+class PartialFileWriter:
+    """Writes the ``content`` argument of one streamed write_file call to disk."""
+
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.bytes = 0
+        self._path_parts: List[str] = []
+        self._pending: List[str] = []  # Content that arrived before the path
+        self._file = None
+        self._partial = None
+        self._target = None
+        self._digest = hashlib.sha256()
+        self._last_progress = 0.0
+        self._failed = False
+        self._parser = JsonStringFields(self._on_text, self._on_end)
+
+    def feed(self, fragment: str) -> None:
+        if not self._failed:
+            self._parser.feed(fragment)
+
+    def _on_text(self, key: str, text: str) -> None:
+        if key == "path" and self.path is None:
+            self._path_parts.append(text)
+        elif key == "content":
+            if self._file is None:
+                self._pending.append(text)
+            else:
+                self._write(text)
+
+    def _on_end(self, key: str) -> None:
+        if key == "path" and self.path is None:
+            self.path = "".join(self._path_parts)
+            self._open()
+
+    def _open(self) -> None:
+        try:
+            self._target = safe_path_for_project(self.path)
+            self._partial = partial_path_for(self._target)
+            self._partial.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self._partial, "wb")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot stream {self.path} to disk: {e}")
+            self._failed = True
+            return
+        emit_event("file_progress", path=self.path, bytes=0, done=False)
+        self._last_progress = time.monotonic()
+        pending, self._pending = self._pending, []
+        for text in pending:
+            self._write(text)
+
+    def _write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self._digest.update(data)
+        self.bytes += len(data)
+        now = time.monotonic()
+        if now - self._last_progress >= PROGRESS_INTERVAL:
+            self._file.flush()
+            self._last_progress = now
+            emit_event("file_progress", path=self.path, bytes=self.bytes, done=False)
+
+    def finish(self) -> None:
+        """Close the partial file and hand it to write_file for the commit."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        register_streamed_file(self._target, self._partial, self._digest.hexdigest(), self.bytes)
+        emit_event("file_progress", path=self.path, bytes=self.bytes, done=True)
+
+    def abort(self) -> None:
+        """Discard the partial file, e.g. when the model call failed."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._partial.unlink(missing_ok=True)
+
+
+class StreamingWriteCallback(BaseCallbackHandler):
+    """Streams the content of write_file tool calls to disk as tokens arrive.
+
+    Defining ``tap_output_iter``/``tap_output_aiter`` marks this handler as a
+    streaming handler, which makes chat models that support it use their
+    streaming API when the handler is attached.
+    """
+    run_inline = True
+
+    def __init__(self, tool_name: str = "write_file"):
+        super().__init__()
+        self.tool_name = tool_name
+        self._lock = threading.Lock()
+        # (model run, tool call index) -> writer, or None for other tools
+        self._calls: Dict[Tuple[UUID, Any], Optional[PartialFileWriter]] = {}
+        self._last_index: Dict[UUID, Any] = {}
+
+    def tap_output_iter(self, run_id: UUID, output: Iterator[Any]) -> Iterator[Any]:
+        return output
+
+    def tap_output_aiter(self, run_id: UUID, output: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        return output
+
+    def on_llm_new_token(self, token: str, *, chunk: Any = None, run_id: UUID, **kwargs: Any) -> None:
+        message = getattr(chunk, "message", None)
+        for call in getattr(message, "tool_call_chunks", None) or []:
+            index = call.get("index")
+            with self._lock:
+                if index is None:
+                    index = self._last_index.get(run_id, 0)
+                self._last_index[run_id] = index
+                key = (run_id, index)
+                if key not in self._calls:
+                    if call.get("name") is None:
+                        continue
+                    self._calls[key] = PartialFileWriter() if call["name"] == self.tool_name else None
+                writer = self._calls[key]
+            if writer is not None and call.get("args"):
+                writer.feed(call["args"])
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        for writer in self._pop(run_id):
+            writer.finish()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        for writer in self._pop(run_id):
+            writer.abort()
+
+    def _pop(self, run_id: UUID) -> List[PartialFileWriter]:
+        with self._lock:
+            self._last_index.pop(run_id, None)
+            keys = [key for key in self._calls if key[0] == run_id]
+            writers = [self._calls.pop(key) for key in keys]
+        return [writer for writer in writers if writer is not None]
@@ -0,0 +1,295 @@
+"""Similarity cache of previously generated files.
+
+Many prompts are variations of each other and the architect keeps
+producing near-identical tasks ("src/components/Header.tsx: responsive
+header with nav"). The cache indexes past (filepath, task description,
+techstack) tuples with hashed TF-IDF vectors held in a NumPy matrix and
+returns the prior output of the most similar task:
+
+* at or above the skip threshold, for the same file path, the cached
+  file is written directly and the LLM call is skipped;
+* at or above the draft threshold, for the same file type, the cached
+  file is handed to the coder as a draft to adapt.
+
+Entries live in a SQLite database; the least recently used entries are
+evicted once ``max_entries`` is exceeded.
+
+Usage:
+    python -m Agent.task_cache stats
+    python -m Agent.task_cache clear
+"""
+
+import argparse
+import json
+import logging
+import pathlib
+import posixpath
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .config import get_task_cache_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIMENSIONS = 1024
+
+# Path tokens are repeated so the file name weighs more than a stray word
+_PATH_WEIGHT = 3
+
+
+@dataclass
+class CacheHit:
+    """A cached file returned for a similar task."""
+    entry_id: int
+    filepath: str
+    task_description: str
+    content: str
+    score: float
+    mode: str  # "skip" or "draft"
+
+
+def _tokenize(text: str) -> List[str]:
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _normalize_path(path: str) -> str:
+    return posixpath.normpath(path.strip().replace("\\", "/")).lstrip("/").lower()
+
+
+def _extension(path: str) -> str:
+    return posixpath.splitext(path)[1].lower()
+
+
+class TaskCache:
+    """Hashed TF-IDF nearest-neighbour cache over generated files.
+
+    Args:
+        path: Directory holding the cache database
+        skip_threshold: Minimum cosine similarity to reuse a file without an LLM call
+        draft_threshold: Minimum cosine similarity to offer a file as a draft
+        max_entries: Entries kept before least-recently-used eviction
+        dimensions: Size of the hashed feature space
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        skip_threshold: float = 0.95,
+        draft_threshold: float = 0.6,
+        max_entries: int = 1000,
+        dimensions: int = DEFAULT_DIMENSIONS,
+    ):
+        self.path = pathlib.Path(path)
+        self.skip_threshold = skip_threshold
+        self.draft_threshold = draft_threshold
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._db_path = self.path / "cache.sqlite3"
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "skip_hits": 0, "draft_hits": 0, "misses": 0, "evictions": 0}
+
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, techstack TEXT NOT NULL, filepath TEXT NOT NULL, "
+                "description TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL, "
+                "last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            rows = db.execute("SELECT id, techstack, filepath, description FROM entries ORDER BY id").fetchall()
+
+        self._ids: List[int] = [row[0] for row in rows]
+        self._paths: List[str] = [_normalize_path(row[2]) for row in rows]
+        # Row buffer with spare capacity so that adding entries stays cheap
+        self._matrix = np.zeros((max(len(rows) * 2, 64), dimensions), dtype=np.float32)
+        for i, (_, techstack, filepath, description) in enumerate(rows):
+            self._matrix[i] = self._vectorize(techstack, filepath, description)
+        self._df = (self._counts > 0).sum(axis=0).astype(np.float32)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._db_path, timeout=30)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def _counts(self) -> np.ndarray:
+        return self._matrix[:len(self._ids)]
+
+    def _vectorize(self, techstack: str, filepath: str, description: str) -> np.ndarray:
+        """Return sublinear term frequencies over hashed features."""
+        tokens = _tokenize(description) + _tokenize(techstack) + _tokenize(filepath) * _PATH_WEIGHT
+        counts = np.zeros(self.dimensions, dtype=np.float32)
+        for token in tokens:
+            counts[zlib.crc32(token.encode("utf-8")) % self.dimensions] += 1
+        nonzero = counts > 0
+        counts[nonzero] = 1 + np.log(counts[nonzero])
+        return counts
+
+    def _append(self, entry_id: int, filepath: str, counts: np.ndarray) -> None:
+        size = len(self._ids)
+        if size == self._matrix.shape[0]:
+            grown = np.zeros((size * 2, self.dimensions), dtype=np.float32)
+            grown[:size] = self._matrix
+            self._matrix = grown
+        self._matrix[size] = counts
+        self._ids.append(entry_id)
+        self._paths.append(_normalize_path(filepath))
+        self._df += counts > 0
+
+    def _idf(self) -> np.ndarray:
+        n = max(len(self._ids), 1)
+        return np.log((1 + n) / (1 + self._df)) + 1
+
+    def lookup(self, techstack: str, filepath: str, description: str) -> Optional[CacheHit]:
+        """Find the most similar cached task.
+
+        Returns:
+            A CacheHit in "skip" or "draft" mode, or None on a miss
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            if not self._ids:
+                self.stats["misses"] += 1
+                return None
+
+            idf = self._idf()
+            query = self._vectorize(techstack, filepath, description) * idf
+            query_norm = np.linalg.norm(query)
+            weighted = self._counts * idf
+            norms = np.linalg.norm(weighted, axis=1) * (query_norm or 1.0)
+            scores = (weighted @ query) / np.where(norms == 0, 1.0, norms)
+
+            # Only files of the same type are interchangeable
+            extension = _extension(filepath)
+            same_type = np.array([_extension(p) == extension for p in self._paths])
+            scores = np.where(same_type, scores, -1.0)
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+
+            same_path = self._paths[best] == _normalize_path(filepath)
+            if score >= self.skip_threshold and same_path:
+                mode = "skip"
+            elif score >= self.draft_threshold:
+                mode = "draft"
+            else:
+                self.stats["misses"] += 1
+                return None
+            self.stats[f"{mode}_hits"] += 1
+            entry_id = self._ids[best]
+
+        with closing(self._connect()) as db, db:
+            row = db.execute("SELECT filepath, description, content FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            db.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE id = ?", (time.time(), entry_id))
+        if row is None:
+            return None
+        logger.info(f"Task cache {mode} hit for {filepath} (similarity {score:.3f})")
+        return CacheHit(entry_id, row[0], row[1], row[2], score, mode)
+
+    def add(self, techstack: str, filepath: str, description: str, content: str) -> None:
+        """Index a generated file, evicting old entries if the cache is full."""
+        if not content.strip():
+            return
+        now = time.time()
+        with self._lock:
+            with closing(self._connect()) as db, db:
+                cursor = db.execute(
+                    "INSERT INTO entries(techstack, filepath, description, content, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (techstack, filepath, description, content, now, now),
+                )
+                entry_id = cursor.lastrowid
+            self._append(entry_id, filepath, self._vectorize(techstack, filepath, description))
+            if len(self._ids) > self.max_entries:
+                self._evict(len(self._ids) - self.max_entries)
+
+    def _evict(self, count: int) -> None:
+        with closing(self._connect()) as db, db:
+            victims = [row[0] for row in db.execute(
+                "SELECT id FROM entries ORDER BY last_used ASC LIMIT ?", (count,)
+            )]
+            db.executemany("DELETE FROM entries WHERE id = ?", [(v,) for v in victims])
+        evicted = set(victims)
+        keep = [i for i, entry_id in enumerate(self._ids) if entry_id not in evicted]
+        remaining = self._counts[keep]
+        self._matrix[:len(keep)] = remaining
+        self._ids = [self._ids[i] for i in keep]
+        self._paths = [self._paths[i] for i in keep]
+        self._df = (self._counts > 0).sum(axis=0).astype(np.float32)
+        self.stats["evictions"] += len(victims)
+        logger.info(f"Task cache evicted {len(victims)} least recently used entries")
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            with closing(self._connect()) as db, db:
+                db.execute("DELETE FROM entries")
+            self._ids, self._paths = [], []
+            self._matrix = np.zeros((64, self.dimensions), dtype=np.float32)
+            self._df = np.zeros(self.dimensions, dtype=np.float32)
+
+    def report(self) -> Dict[str, Any]:
+        """Return index size, hit rates and thresholds."""
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._ids)
+        hits = stats["skip_hits"] + stats["draft_hits"]
+        with closing(self._connect()) as db:
+            lifetime_hits = db.execute("SELECT COALESCE(SUM(hits), 0) FROM entries").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "index_bytes": int(self._matrix.nbytes),
+            "skip_threshold": self.skip_threshold,
+            "draft_threshold": self.draft_threshold,
+            "session": {**stats, "hit_rate": round(hits / stats["lookups"], 3) if stats["lookups"] else None},
+            "lifetime_hits_on_current_entries": lifetime_hits,
+        }
+
+
+_cache: Optional[TaskCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_task_cache() -> Optional[TaskCache]:
+    """Return the shared task cache, or None if it is disabled."""
+    global _cache
+    settings = get_task_cache_settings()
+    if not settings["enabled"]:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TaskCache(
+                settings["path"],
+                skip_threshold=settings["skip_threshold"],
+                draft_threshold=settings["draft_threshold"],
+                max_entries=settings["max_entries"],
+            )
+        return _cache
+
+
+def main() -> None:
+    """Command line entry point for inspecting the cache."""
+    parser = argparse.ArgumentParser(description="Inspect or clear the coder task cache")
+    parser.add_argument("command", choices=["stats", "clear"], help="Action to perform")
+    args = parser.parse_args()
+
+    settings = get_task_cache_settings()
+    cache = TaskCache(settings["path"], settings["skip_threshold"], settings["draft_threshold"], settings["max_entries"])
+    if args.command == "clear":
+        cache.clear()
+    print(json.dumps(cache.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,563 @@
+"""Shared queue that distributes coder tasks to worker processes.
+
+Without a queue every coder session of a run happens in the process that
+runs the graph. With COMPANIO_TASK_QUEUE pointing at a SQLite database, the
+coder node becomes a controller instead: it publishes each group of
+``ImplementationTask``s with its context (the plan, a draft from the task
+cache and the files of the project) and waits for the results. Any number
+of workers, in other processes or on other nodes sharing the database,
+claim the tasks, run the coder against a scratch copy of the project and
+return the files it wrote::
+
+    COMPANIO_TASK_QUEUE=/shared/companio/tasks.sqlite3 python main.py --worker
+    python -m Agent.task_queue worker --concurrency 4 [--stand-in]
+    python -m Agent.task_queue status
+    python -m Agent.task_queue purge --older-than 24
+
+A claimed task is leased to its worker, which renews the lease while it
+works. When a worker dies its lease runs out and the task is handed to the
+next worker, up to ``max_attempts`` times; a task that keeps failing is
+marked failed and the controller codes it itself.
+
+The database uses SQLite's default rollback journal rather than WAL, so
+that workers on other nodes can share it over a network file system that
+supports POSIX locks.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .cancellation import CancelToken, RunCancelled, remaining_time, sleep, use_cancel_token
+from .config import get_task_queue_settings
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Files larger than this are left out of the context sent to workers
+MAX_CONTEXT_FILE_BYTES = 1024 * 1024
+
+# Longest wait before a failed task is handed out again
+MAX_RETRY_DELAY = 60.0
+
+
+@dataclass
+class QueuedTask:
+    """A task as stored in the queue."""
+    task_id: str
+    run_id: str
+    status: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+    worker: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+
+class TaskQueue:
+    """SQLite-backed task queue with leases and retries.
+
+    Every method opens its own connection, so one queue object can be
+    shared by threads and every process can open the same database.
+
+    Args:
+        path: SQLite database file, created on first use
+        lease_seconds: How long a claim lasts without being renewed
+        max_attempts: Claims of a task before it is marked failed
+    """
+
+    def __init__(self, path: pathlib.Path, lease_seconds: float = 60.0, max_attempts: int = 3):
+        self.path = pathlib.Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "id TEXT PRIMARY KEY, run_id TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+                "worker TEXT, lease_expires REAL, available_at REAL NOT NULL, "
+                "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, available_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; claims open their own write transaction
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def publish(self, run_id: str, payload: Dict[str, Any]) -> str:
+        """Add a task for the workers.
+
+        Args:
+            run_id: Groups the tasks of one run, e.g. for cancelling them
+            payload: JSON-serializable task description
+
+        Returns:
+            The task ID
+        """
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT INTO tasks (id, run_id, status, payload, max_attempts, available_at, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, run_id, PENDING, json.dumps(payload), self.max_attempts, now, now, now),
+            )
+        return task_id
+
+    def claim(self, worker: str) -> Optional[QueuedTask]:
+        """Lease the oldest available task to a worker.
+
+        Expired leases are released first: their tasks become available
+        again, or fail once they have used up their attempts.
+
+        Args:
+            worker: Name of the claiming worker
+
+        Returns:
+            The claimed task, or None if no task is available
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._release_expired(db, now)
+                row = db.execute(
+                    "SELECT id FROM tasks WHERE status = ? AND available_at <= ? ORDER BY created LIMIT 1",
+                    (PENDING, now),
+                ).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                db.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, attempts = attempts + 1, lease_expires = ?, updated = ? "
+                    "WHERE id = ?",
+                    (LEASED, worker, now + self.lease_seconds, now, row[0]),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return self._get(db, row[0])
+
+    def _release_expired(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute(
+            "UPDATE tasks SET status = ?, error = 'lease of ' || worker || ' expired after ' || attempts || ' attempts', "
+            "updated = ? WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (FAILED, now, LEASED, now),
+        )
+        expired = db.execute(
+            "UPDATE tasks SET status = ?, error = 'lease of ' || worker || ' expired', worker = NULL, updated = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (PENDING, now, LEASED, now),
+        ).rowcount
+        if expired:
+            logger.warning(f"Requeued {expired} tasks whose worker stopped renewing its lease")
+
+    def heartbeat(self, task_id: str, worker: str) -> bool:
+        """Renew a worker's lease on a task.
+
+        Returns:
+            False if the worker no longer holds the task
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            return db.execute(
+                "UPDATE tasks SET lease_expires = ?, updated = ? WHERE id = ? AND status = ? AND worker = ?",
+                (now + self.lease_seconds, now, task_id, LEASED, worker),
+            ).rowcount == 1
+
+    def complete(self, task_id: str, worker: str, result: Dict[str, Any]) -> bool:
+        """Store the result of a task.
+
+        Returns:
+            False if the worker no longer held the task; the result is dropped then
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (DONE, json.dumps(result), time.time(), task_id, LEASED, worker),
+            ).rowcount == 1
+
+    def fail(self, task_id: str, worker: str, error: str) -> bool:
+        """Give a task back after an error.
+
+        The task is retried after a growing delay while it has attempts
+        left, and marked failed otherwise.
+
+        Returns:
+            True if the task will be retried
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT attempts, max_attempts FROM tasks WHERE id = ? AND status = ? AND worker = ?",
+                    (task_id, LEASED, worker),
+                ).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return False
+                attempts, max_attempts = row
+                retry = attempts < max_attempts
+                db.execute(
+                    "UPDATE tasks SET status = ?, worker = ?, error = ?, lease_expires = NULL, "
+                    "available_at = ?, updated = ? WHERE id = ?",
+                    (
+                        PENDING if retry else FAILED, None if retry else worker, error,
+                        now + min(MAX_RETRY_DELAY, 2.0 ** attempts), now, task_id,
+                    ),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return retry
+
+    def cancel_run(self, run_id: str) -> int:
+        """Withdraw the unfinished tasks of a run; results of running ones are dropped.
+
+        Returns:
+            The number of withdrawn tasks
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "UPDATE tasks SET status = ?, updated = ? WHERE run_id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), run_id, PENDING, LEASED),
+            ).rowcount
+
+    def get(self, task_id: str) -> Optional[QueuedTask]:
+        """Return a task, or None if it is unknown."""
+        with closing(self._connect()) as db:
+            return self._get(db, task_id)
+
+    def _get(self, db: sqlite3.Connection, task_id: str) -> Optional[QueuedTask]:
+        row = db.execute(
+            "SELECT id, run_id, status, payload, attempts, max_attempts, worker, result, error FROM tasks WHERE id = ?",
+            (task_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return QueuedTask(
+            task_id=row[0], run_id=row[1], status=row[2], payload=json.loads(row[3]),
+            attempts=row[4], max_attempts=row[5], worker=row[6],
+            result=json.loads(row[7]) if row[7] is not None else None, error=row[8],
+        )
+
+    def as_completed(
+        self, task_ids: Iterable[str], timeout: Optional[float] = None, poll_seconds: float = 1.0
+    ) -> Iterator[QueuedTask]:
+        """Yield tasks as they finish (done, failed or cancelled).
+
+        Args:
+            task_ids: Tasks to wait for
+            timeout: Seconds to wait in total (None: indefinitely)
+            poll_seconds: Delay between checks of the database
+
+        Raises:
+            TimeoutError: If tasks are still unfinished after ``timeout``
+            RunCancelled: If the current run is cancelled while waiting
+        """
+        waiting = set(task_ids)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while waiting:
+            with closing(self._connect()) as db:
+                placeholders = ",".join("?" * len(waiting))
+                finished = [
+                    row[0] for row in db.execute(
+                        f"SELECT id FROM tasks WHERE id IN ({placeholders}) AND status IN (?, ?, ?)",
+                        (*waiting, DONE, FAILED, CANCELLED),
+                    )
+                ]
+                tasks = [self._get(db, task_id) for task_id in finished]
+            for task in tasks:
+                waiting.discard(task.task_id)
+                yield task
+            if not waiting:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{len(waiting)} tasks unfinished after {timeout:.0f}s")
+            # Wakes up, and raises RunCancelled, as soon as the run is cancelled
+            sleep(poll_seconds if deadline is None else max(0.0, min(poll_seconds, deadline - time.monotonic())))
+
+    def status(self) -> Dict[str, Any]:
+        """Return task counts by status and the workers holding leases."""
+        now = time.time()
+        with closing(self._connect()) as db:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+            workers = db.execute(
+                "SELECT worker, COUNT(*), MIN(lease_expires) FROM tasks WHERE status = ? GROUP BY worker", (LEASED,)
+            ).fetchall()
+            oldest = db.execute("SELECT MIN(created) FROM tasks WHERE status = ?", (PENDING,)).fetchone()[0]
+        return {
+            "path": str(self.path),
+            "tasks": {state: counts.get(state, 0) for state in (PENDING, LEASED, DONE, FAILED, CANCELLED)},
+            "oldest_pending_seconds": round(now - oldest, 1) if oldest is not None else None,
+            "workers": {
+                worker: {"leased": leased, "lease_expires_in": round(expires - now, 1)}
+                for worker, leased, expires in workers
+            },
+        }
+
+    def purge(self, older_than: float = 0.0) -> int:
+        """Delete finished tasks last updated more than ``older_than`` seconds ago.
+
+        Returns:
+            The number of deleted tasks
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "DELETE FROM tasks WHERE status IN (?, ?, ?) AND updated < ?",
+                (DONE, FAILED, CANCELLED, time.time() - older_than),
+            ).rowcount
+
+
+_queue: Optional[TaskQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_task_queue() -> Optional[TaskQueue]:
+    """Return the shared task queue, or None if coder tasks run in-process."""
+    global _queue
+    settings = get_task_queue_settings()
+    if not settings["enabled"]:
+        return None
+    with _queue_lock:
+        if _queue is None or _queue.path != settings["path"]:
+            _queue = TaskQueue(settings["path"], settings["lease_seconds"], settings["max_attempts"])
+        return _queue
+
+
+def project_context(project_root: pathlib.Path) -> Dict[str, str]:
+    """Return the text files of a project by relative path, as context for a worker."""
+    from .revision import project_files
+
+    root = pathlib.Path(project_root)
+    files = {}
+    for path in sorted(project_files(root)):
+        target = root / path
+        try:
+            if target.stat().st_size > MAX_CONTEXT_FILE_BYTES:
+                continue
+            files[path] = target.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            continue
+    return files
+
+
+def coder_payload(plan, tasks, draft: Optional[Tuple[str, str, str]], files: Dict[str, str]) -> Dict[str, Any]:
+    """Describe one coder session for a worker.
+
+    Args:
+        plan: The project plan (``Plan`` or ``LeanPlan``), or None
+        tasks: The ``ImplementationTask``s coded in the session
+        draft: Optional (filepath, task description, content) of a similar cached file
+        files: Current files of the project by relative path
+
+    Returns:
+        A JSON-serializable payload; it carries the time left in the current
+        run, which bounds the worker's session
+    """
+    return {
+        "kind": "coder",
+        "timeout": remaining_time(),
+        "plan": plan.model_dump() if plan is not None else None,
+        "tasks": [task.model_dump() for task in tasks],
+        "draft": list(draft) if draft is not None else None,
+        "files": files,
+    }
+
+
+def run_coder_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the coder session described by a payload in a scratch project.
+
+    Returns:
+        The files the session created or changed, by relative path, and
+        what the session cost
+    """
+    from .graph import run_coder_session
+    from .states import ImplementationTask, LeanPlan, Plan
+    from .tools import use_project_root
+
+    plan = payload.get("plan")
+    if plan is not None:
+        plan = (LeanPlan if "ui_direction" in plan else Plan).model_validate(plan)
+    tasks = [ImplementationTask.model_validate(task) for task in payload["tasks"]]
+    draft = tuple(payload["draft"]) if payload.get("draft") else None
+    context = payload.get("files") or {}
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="companio-task-") as scratch, use_project_root(scratch) as root:
+        for path, content in context.items():
+            target = root / path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content, encoding="utf-8")
+        tools = run_coder_session(plan, tasks, draft)
+        changed = {path: content for path, content in project_context(root).items() if context.get(path) != content}
+    return {"files": changed, "tools": tools, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def default_worker_name() -> str:
+    """Return a worker name unique to this host and process."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(
+    queue: TaskQueue,
+    worker: Optional[str] = None,
+    poll_seconds: float = 1.0,
+    stop: Optional[threading.Event] = None,
+    max_tasks: Optional[int] = None,
+) -> int:
+    """Claim and run tasks until stopped.
+
+    The lease of the running task is renewed from a background thread at a
+    third of the lease time, so a task is only handed out again when its
+    worker has died or hangs.
+
+    Args:
+        queue: Queue to take tasks from
+        worker: Worker name (default: host name and process ID)
+        poll_seconds: Delay between claims while the queue is empty
+        stop: Event that ends the loop once the running task is done
+        max_tasks: Return after this many tasks
+
+    Returns:
+        The number of tasks run
+    """
+    worker = worker or default_worker_name()
+    stop = stop or threading.Event()
+    handled = 0
+    logger.info(f"Worker {worker} waiting for tasks on {queue.path}")
+    while not stop.is_set() and (max_tasks is None or handled < max_tasks):
+        task = queue.claim(worker)
+        if task is None:
+            stop.wait(poll_seconds)
+            continue
+        handled += 1
+        logger.info(f"Worker {worker} running task {task.task_id} (attempt {task.attempts}/{task.max_attempts}): "
+                    f"{[t['filepath'] for t in task.payload.get('tasks', [])]}")
+        done = threading.Event()
+        # The session stops once the run's time is up or the task is taken over or withdrawn
+        token = CancelToken(task.payload.get("timeout"))
+
+        def renew() -> None:
+            while not done.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(task.task_id, worker):
+                    logger.warning(f"Worker {worker} lost the lease on task {task.task_id}")
+                    token.cancel()
+                    return
+
+        renewer = threading.Thread(target=renew, name=f"lease-{task.task_id[:8]}", daemon=True)
+        renewer.start()
+        try:
+            if task.payload.get("kind") != "coder":
+                raise ValueError(f"Unknown task kind: {task.payload.get('kind')}")
+            with use_cancel_token(token):
+                result = run_coder_task(task.payload)
+        except RunCancelled as e:
+            logger.warning(f"Task {task.task_id} stopped: {e}")
+            queue.fail(task.task_id, worker, str(e))
+            continue
+        except Exception as e:
+            logger.error(f"Task {task.task_id} failed: {e}", exc_info=True)
+            retry = queue.fail(task.task_id, worker, f"{type(e).__name__}: {e}")
+            logger.info(f"Task {task.task_id} {'will be retried' if retry else 'failed for good'}")
+            continue
+        finally:
+            done.set()
+            token.close()
+            renewer.join()
+        if queue.complete(task.task_id, worker, {**result, "worker": worker}):
+            logger.info(f"Task {task.task_id} done: {len(result['files'])} files in {result['seconds']:.1f}s")
+        else:
+            logger.warning(f"Task {task.task_id} was taken over or withdrawn; its result is dropped")
+    return handled
+
+
+def serve_workers(queue: TaskQueue, concurrency: int = 1, poll_seconds: float = 1.0) -> None:
+    """Run ``concurrency`` worker loops in this process until interrupted."""
+    stop = threading.Event()
+    base = default_worker_name()
+    threads = [
+        threading.Thread(
+            target=run_worker, args=(queue, f"{base}-{i}" if concurrency > 1 else base, poll_seconds, stop),
+            name=f"task-worker-{i}", daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers after their running tasks")
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point for running workers and inspecting the queue."""
+    parser = argparse.ArgumentParser(description="Run coder workers on the shared task queue, or inspect it")
+    parser.add_argument("--queue", type=pathlib.Path, default=None,
+                        help="Queue database (default: COMPANIO_TASK_QUEUE)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = commands.add_parser("worker", help="Claim and run coder tasks until interrupted")
+    worker_parser.add_argument("--concurrency", type=int, default=1, help="Tasks run at once (default: 1)")
+    worker_parser.add_argument("--stand-in", action="store_true",
+                               help="Use the offline stand-in model instead of the configured provider")
+    commands.add_parser("status", help="Show task counts and active workers")
+    purge_parser = commands.add_parser("purge", help="Delete finished tasks")
+    purge_parser.add_argument("--older-than", type=float, default=0.0, metavar="HOURS",
+                              help="Only delete tasks finished this many hours ago (default: 0)")
+    args = parser.parse_args(argv)
+
+    settings = get_task_queue_settings()
+    path = args.queue or settings["path"]
+    if path is None:
+        parser.error("No queue: pass --queue or set COMPANIO_TASK_QUEUE")
+    queue = TaskQueue(path, settings["lease_seconds"], settings["max_attempts"])
+
+    if args.command == "worker":
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        if args.stand_in:
+            from . import graph
+            from .stand_in import StandInChatModel
+            graph.llm = StandInChatModel()
+        serve_workers(queue, max(1, args.concurrency), settings["poll_seconds"])
+    elif args.command == "status":
+        print(json.dumps(queue.status(), indent=2))
+    else:
+        print(f"Deleted {queue.purge(args.older_than * 3600)} finished tasks")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,267 @@
-from typing import Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+import hashlib
+import os
 import pathlib
+import signal
 import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from langchain_core.tools import tool
 import logging
 
+from .blobstore import get_blob_store, store_dir_for_project
+from .cancellation import check_cancelled, get_cancel_token
+from .config import is_blob_store_enabled, get_blob_link_mode, is_snapshots_enabled, PROJECT_ROOT
+from .snapshots import get_snapshot_store
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Generated projects are stored in the current working directory
-# This ensures the generated_project directory is in the same location as main.py
-PROJECT_ROOT = pathlib.Path.cwd() / "generated_project"
+# Background jobs run concurrently, so the active project root and the
+# listener for tool events are tracked per execution context rather than
+# globally. Outside of a job these fall back to PROJECT_ROOT and no listener.
+_active_project_root: ContextVar[pathlib.Path] = ContextVar("active_project_root", default=PROJECT_ROOT)
+_event_sink: ContextVar[Optional[Callable[[str, Dict[str, Any]], None]]] = ContextVar("tool_event_sink", default=None)
+
+
+class _PathLocks:
+    """Reader-writer locks per file path, created on demand.
+
+    The coder's tool calls of one turn run concurrently; reads of a path
+    share it, while a write waits for, and blocks, every other call on it.
+    """
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._readers: Dict[pathlib.Path, int] = {}
+        self._writers: Set[pathlib.Path] = set()
+
+    @contextmanager
+    def reading(self, path: pathlib.Path) -> Iterator[None]:
+        with self._changed:
+            self._changed.wait_for(lambda: path not in self._writers)
+            self._readers[path] = self._readers.get(path, 0) + 1
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._readers[path] -= 1
+                if not self._readers[path]:
+                    del self._readers[path]
+                self._changed.notify_all()
+
+    @contextmanager
+    def writing(self, path: pathlib.Path) -> Iterator[None]:
+        with self._changed:
+            self._changed.wait_for(lambda: path not in self._writers and path not in self._readers)
+            self._writers.add(path)
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._writers.discard(path)
+                self._changed.notify_all()
+
+
+_path_locks = _PathLocks()
+
+
+def get_project_root() -> pathlib.Path:
+    """Return the project root for the current execution context."""
+    return _active_project_root.get()
+
+
+@contextmanager
+def use_project_root(path) -> Iterator[pathlib.Path]:
+    """Temporarily direct all file tools at a different project root.
+    
+    Args:
+        path: Directory that should act as the project root
+        
+    Yields:
+        The resolved project root
+    """
+    root = pathlib.Path(path).resolve()
+    root.mkdir(parents=True, exist_ok=True)
+    token = _active_project_root.set(root)
+    try:
+        yield root
+    finally:
+        _active_project_root.reset(token)
+
+
+@contextmanager
+def use_event_sink(sink: Callable[[str, Dict[str, Any]], None]) -> Iterator[None]:
+    """Register a callback that receives tool events such as file writes.
+    
+    Args:
+        sink: Callable invoked as sink(event_type, data)
+    """
+    token = _event_sink.set(sink)
+    try:
+        yield
+    finally:
+        _event_sink.reset(token)
+
+
+def emit_event(event_type: str, **data: Any) -> None:
+    """Forward a tool event to the listener of the current context, if any."""
+    sink = _event_sink.get()
+    if sink is None:
+        return
+    try:
+        sink(event_type, data)
+    except Exception as e:
+        logger.warning(f"Tool event listener failed for {event_type}: {e}")
+
+
+def is_hidden_path(path) -> bool:
+    """Return True for paths inside dot directories, such as the agent's ``.companio`` metadata."""
+    return any(part.startswith(".") for part in pathlib.PurePath(path).parts[:-1])
 
 
 def safe_path_for_project(path: str) -> pathlib.Path:
     """Validate that a path is within the project root to prevent directory traversal attacks."""
-    p = (PROJECT_ROOT / path).resolve()
+    root = get_project_root()
+    p = (root / path).resolve()
     try:
-        p.relative_to(PROJECT_ROOT.resolve())
+        p.relative_to(root.resolve())
     except ValueError:
         raise ValueError(f"Attempt to write outside project root: {p}")
     return p
 
+# Partial files streamed by the coder (see streaming.py), keyed by the
+# resolved path of the file they are meant to become
+PARTIAL_DIR = pathlib.PurePath(".companio", "partial")
+_streamed_files: Dict[pathlib.Path, Tuple[pathlib.Path, str, int]] = {}
+_streamed_files_lock = threading.Lock()
+
+
+def partial_path_for(target: pathlib.Path) -> pathlib.Path:
+    """Return where the streamed content of a project file is written."""
+    root = get_project_root()
+    return root / PARTIAL_DIR / (str(target.relative_to(root)) + ".partial")
+
+
+def register_streamed_file(target: pathlib.Path, partial: pathlib.Path, digest: str, size: int) -> None:
+    """Offer a completely streamed partial file to the next write_file of ``target``."""
+    with _streamed_files_lock:
+        previous = _streamed_files.get(target)
+        _streamed_files[target] = (partial, digest, size)
+    if previous is not None and previous[0] != partial:
+        previous[0].unlink(missing_ok=True)
+
+
+def _commit_streamed_file(target: pathlib.Path, data: Optional[bytes]) -> bool:
+    """Move a streamed partial file into place if it holds exactly ``data``.
+
+    The partial file is removed if it does not match (or ``data`` is None).
+    """
+    with _streamed_files_lock:
+        streamed = _streamed_files.pop(target, None)
+    if streamed is None:
+        return False
+    partial, digest, size = streamed
+    try:
+        if data is not None and size == len(data) and digest == hashlib.sha256(data).hexdigest():
+            os.replace(partial, target)
+            return True
+        partial.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Could not commit streamed file {target}: {e}")
+    return False
+
+
+def discard_streamed_files() -> None:
+    """Remove streamed partial files of the current project that were never committed."""
+    root = get_project_root()
+    with _streamed_files_lock:
+        targets = [t for t in _streamed_files if root in t.parents]
+    for target in targets:
+        _commit_streamed_file(target, None)
+
+
+def _write_atomic(target: pathlib.Path, data: bytes) -> None:
+    """Write a file through a temporary file so readers never see partial content."""
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        # Replacing the directory entry also never edits a file that is
+        # hardlinked into the blob store in place
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def _write_project_file(target: pathlib.Path, data: bytes) -> None:
+    """Replace a project file, keeping its old and new content in the step snapshots."""
+    snapshots = get_snapshot_store(get_project_root()) if is_snapshots_enabled() else None
+    if snapshots is not None:
+        snapshots.preserve(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if is_blob_store_enabled():
+        _commit_streamed_file(target, None)  # The blob store materializes its own copy
+        store = get_blob_store(store_dir_for_project(get_project_root()), get_blob_link_mode())
+        store.write(target, data)
+    elif not _commit_streamed_file(target, data):
+        _write_atomic(target, data)
+    if snapshots is not None:
+        snapshots.record(target, data)
+
+
+def _delete_project_file(target: pathlib.Path) -> None:
+    """Delete a project file, recording the deletion in the step snapshots."""
+    snapshots = get_snapshot_store(get_project_root()) if is_snapshots_enabled() else None
+    if snapshots is not None:
+        snapshots.preserve(target)
+    target.unlink(missing_ok=True)
+    if is_blob_store_enabled():
+        get_blob_store(store_dir_for_project(get_project_root()), get_blob_link_mode()).release(target)
+    if snapshots is not None:
+        snapshots.record(target, None)
+
+
+def commit_snapshot(label: str) -> Optional[int]:
+    """Save the file changes since the last snapshot of the current project as one step.
+    
+    Args:
+        label: What the step did, e.g. the files of a coder task
+        
+    Returns:
+        The step number, or None if snapshots are disabled or nothing changed
+    """
+    if not is_snapshots_enabled():
+        return None
+    return get_snapshot_store(get_project_root()).commit(label)
+
+
+def rollback_project(step: int, paths=None) -> list:
+    """Restore the current project, or some of its files, to a snapshot step.
+    
+    Args:
+        step: Step to restore (0: before the first step)
+        paths: Restore only these project-relative paths
+        
+    Returns:
+        The restored paths
+        
+    Raises:
+        KeyError: If the step does not exist
+    """
+    store = get_snapshot_store(get_project_root())
+    restored = store.rollback(step, _write_project_file, _delete_project_file, paths)
+    logger.info(f"Rolled back {len(restored)} files to snapshot step {step}")
+    for path in restored:
+        target = safe_path_for_project(path)
+        content = target.read_text(encoding="utf-8", errors="replace") if target.exists() else None
+        emit_event("file_restored", path=path, step=step, content=content)
+    return restored
+
+
 @tool
 def write_file(path: str, content: str) -> str:
     """Writes content to a file at the specified path within the project root.
@@ -33,16 +274,41 @@ def write_file(path: str, content: str) -> str:
         Confirmation message with the file path written
     """
     try:
+        # Tool calls still in flight when a run is cancelled must not change the project
+        check_cancelled()
         p = safe_path_for_project(path)
-        p.parent.mkdir(parents=True, exist_ok=True)
-        with open(p, "w", encoding="utf-8") as f:
-            f.write(content)
+        data = content.encode("utf-8")
+        with _path_locks.writing(p):
+            _write_project_file(p, data)
         logger.info(f"File written: {p}")
+        emit_event("file_written", path=path, bytes=len(data), content=content)
         return f"WROTE: {p}"
     except Exception as e:
         logger.error(f"Error writing file {path}: {e}")
         return f"ERROR: Failed to write {path}: {str(e)}"
 
+def write_project_files(files: Dict[str, str]) -> List[str]:
+    """Write several files at once, checking every path before writing any.
+
+    Args:
+        files: File content by path relative to the project root
+
+    Returns:
+        The written paths
+
+    Raises:
+        ValueError: If a path lies outside the project root; nothing is written then
+        RunCancelled: If the current run has been cancelled; nothing is written then
+    """
+    check_cancelled()
+    targets = [(path, safe_path_for_project(path), content.encode("utf-8")) for path, content in files.items()]
+    for path, target, data in targets:
+        with _path_locks.writing(target):
+            _write_project_file(target, data)
+        emit_event("file_written", path=path, bytes=len(data), content=files[path])
+    logger.info(f"Wrote {len(targets)} files: {', '.join(files)}")
+    return [path for path, _, _ in targets]
+
 @tool
 def read_file(path: str) -> str:
     """Reads content from a file at the specified path within the project root.
@@ -55,11 +321,12 @@ def read_file(path: str) -> str:
     """
     try:
         p = safe_path_for_project(path)
-        if not p.exists():
-            logger.debug(f"File not found: {p}")
-            return ""
-        with open(p, "r", encoding="utf-8") as f:
-            return f.read()
+        with _path_locks.reading(p):
+            if not p.exists():
+                logger.debug(f"File not found: {p}")
+                return ""
+            with open(p, "r", encoding="utf-8") as f:
+                return f.read()
     except Exception as e:
         logger.error(f"Error reading file {path}: {e}")
         return f"ERROR: Failed to read {path}: {str(e)}"
@@ -71,7 +338,7 @@ def get_current_directory() -> str:
     Returns:
         The absolute path to the project root directory
     """
-    return str(PROJECT_ROOT)
+    return str(get_project_root())
 
 @tool
 def list_files(directory: str = ".") -> str:
@@ -87,7 +354,11 @@ def list_files(directory: str = ".") -> str:
         p = safe_path_for_project(directory)
         if not p.is_dir():
             return f"ERROR: {p} is not a directory"
-        files = [str(f.relative_to(PROJECT_ROOT)) for f in p.glob("**/*") if f.is_file()]
+        root = get_project_root()
+        files = [
+            str(f.relative_to(root)) for f in p.glob("**/*")
+            if f.is_file() and not is_hidden_path(f.relative_to(root))
+        ]
         return "\n".join(files) if files else "No files found."
     except Exception as e:
         logger.error(f"Error listing directory {directory}: {e}")
@@ -99,31 +370,64 @@ def run_cmd(cmd: str, cwd: str = None, timeout: int = 30) -> Tuple[int, str, str
     
     Args:
         cmd: The shell command to execute
-        cwd: The working directory (relative to project root), defaults to PROJECT_ROOT
+        cwd: The working directory (relative to project root), defaults to the project root
         timeout: Command timeout in seconds (default: 30)
         
     Returns:
         A tuple of (return_code, stdout, stderr)
     """
+    token = get_cancel_token()
+    handle = None
     try:
-        cwd_dir = safe_path_for_project(cwd) if cwd else PROJECT_ROOT
-        res = subprocess.run(
+        cwd_dir = safe_path_for_project(cwd) if cwd else get_project_root()
+        check_cancelled()
+        # The command may not outlive the run's deadline
+        remaining = token.remaining() if token is not None else None
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        # In its own process group, so that killing it also kills what the shell started
+        proc = subprocess.Popen(
             cmd,
             shell=True,
             cwd=str(cwd_dir),
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=timeout
+            start_new_session=True,
         )
-        logger.info(f"Command executed: {cmd} (return code: {res.returncode})")
-        return res.returncode, res.stdout, res.stderr
-    except subprocess.TimeoutExpired:
-        error_msg = f"Command timeout after {timeout} seconds"
-        logger.error(error_msg)
-        return -1, "", error_msg
+        if token is not None:
+            handle = token.add_callback(lambda: _kill_process_tree(proc))
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_tree(proc)
+            proc.communicate()
+            error_msg = f"Command timeout after {timeout:.1f} seconds"
+            logger.error(error_msg)
+            return -1, "", error_msg
+        if token is not None and token.cancelled:
+            logger.info(f"Command killed, run cancelled: {cmd}")
+            return -1, stdout, "Command killed: run cancelled"
+        logger.info(f"Command executed: {cmd} (return code: {proc.returncode})")
+        return proc.returncode, stdout, stderr
     except Exception as e:
         logger.error(f"Error running command {cmd}: {e}")
         return -1, "", str(e)
+    finally:
+        if token is not None:
+            token.remove_callback(handle)
+
+def _kill_process_tree(proc: subprocess.Popen) -> None:
+    """Kill a command started by ``run_cmd`` and every process in its group."""
+    if proc.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
 
 def init_project_root() -> str:
     """Initialize the project root directory.
@@ -135,9 +439,10 @@ def init_project_root() -> str:
         OSError: If the directory cannot be created
     """
     try:
-        PROJECT_ROOT.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Project root initialized: {PROJECT_ROOT}")
-        return str(PROJECT_ROOT)
+        root = get_project_root()
+        root.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Project root initialized: {root}")
+        return str(root)
     except Exception as e:
         logger.error(f"Failed to initialize project root: {e}")
         raise
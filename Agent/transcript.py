@@ -0,0 +1,510 @@
+"""Streaming, compressed transcripts of agent runs.
+
+A transcript is a gzip-compressed JSONL file that is appended to while
+the run progresses: node transitions, LLM requests and responses, tool
+calls and file writes each become one record with a sequence number and
+the time since the run started. Nothing is buffered beyond the gzip
+window, so memory stays flat however long the run is, and the file is
+flushed at every node transition so a crashed run can still be read back.
+
+Usage:
+    python -m Agent.transcript summary runs/20250101-120000-ab12cd34.jsonl.gz
+    python -m Agent.transcript show RUN.jsonl.gz --type tool_start --grep App.tsx
+    python -m Agent.transcript replay RUN.jsonl.gz --speed 10
+    python -m Agent.transcript extract RUN.jsonl.gz ./restored
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import pathlib
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from pydantic import BaseModel
+
+from .config import get_transcript_settings
+from .metrics import latency_summary
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_SUFFIX = ".jsonl.gz"
+
+# Flush the gzip stream at least this often so a crash loses little
+FLUSH_INTERVAL = 2.0
+
+# Suffix _jsonable appends to truncated strings
+_TRUNCATED = re.compile(r"\.\.\. \[\d+ chars truncated\]$")
+
+
+def new_transcript_path(directory: pathlib.Path, run_id: Optional[str] = None) -> pathlib.Path:
+    """Return a fresh transcript path in ``directory`` named by time and run ID."""
+    run_id = run_id or uuid.uuid4().hex[:8]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return pathlib.Path(directory) / f"{stamp}-{run_id}{TRANSCRIPT_SUFFIX}"
+
+
+def _jsonable(value: Any, max_chars: int) -> Any:
+    """Convert a value into JSON-compatible data, truncating long strings."""
+    if isinstance(value, str):
+        if len(value) > max_chars:
+            return value[:max_chars] + f"... [{len(value) - max_chars} chars truncated]"
+        return value
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, BaseMessage):
+        return _message_record(value, max_chars)
+    if isinstance(value, BaseModel):
+        return _jsonable(value.model_dump(), max_chars)
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v, max_chars) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_jsonable(v, max_chars) for v in value]
+    if isinstance(value, (pathlib.Path, UUID)):
+        return str(value)
+    return _jsonable(repr(value), max_chars)
+
+
+def _message_record(message: BaseMessage, max_chars: int) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"role": message.type, "content": _jsonable(message.content, max_chars)}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        record["tool_calls"] = _jsonable(tool_calls, max_chars)
+    tool_call_id = getattr(message, "tool_call_id", None)
+    if tool_call_id:
+        record["tool_call_id"] = tool_call_id
+    return record
+
+
+class TranscriptWriter:
+    """Appends run records to a gzip-compressed JSONL file.
+
+    The writer is thread-safe: LLM and tool callbacks arrive from the
+    worker threads of the graph.
+
+    Args:
+        path: Transcript file to create (parent directories are created)
+        max_field_chars: Strings longer than this are truncated
+    """
+
+    def __init__(self, path: pathlib.Path, max_field_chars: int = 200_000):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_field_chars = max_field_chars
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._started = time.time()
+        self._last_flush = self._started
+        self._last_values: Dict[str, Any] = {}
+        self.closed = False
+        self.callback = TranscriptCallback(self)
+
+    def write(self, record_type: str, flush: bool = False, verbatim: Sequence[str] = (), **data: Any) -> None:
+        """Append one record.
+
+        Args:
+            record_type: Kind of record (for example "node" or "tool_end")
+            flush: Force the compressed stream to disk after this record
+            verbatim: Names of string fields that are never truncated
+            **data: Record fields; converted to JSON-compatible values
+        """
+        with self._lock:
+            if self.closed:
+                return
+            now = time.time()
+            record = {"seq": self._seq, "t": round(now - self._started, 4), "type": record_type}
+            record.update(_jsonable(data, self.max_field_chars))
+            record.update({key: data[key] for key in verbatim if isinstance(data.get(key), str)})
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._seq += 1
+            if flush or now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def start(self, **data: Any) -> None:
+        """Write the header record of the run."""
+        self.write("run_start", flush=True, started_at=self._started, **data)
+
+    def record_node(self, node: str, update: Optional[Dict[str, Any]]) -> None:
+        """Record a finished graph node and the state keys it updated.
+
+        Nodes return the whole state, so keys and object fields that did
+        not change since the previous update (such as the coder's task
+        plan) are left out; repeated coder steps only record their progress.
+        """
+        compact: Dict[str, Any] = {}
+        for key, value in (update or {}).items():
+            value = _jsonable(value, self.max_field_chars)
+            previous = self._last_values.get(key)
+            self._last_values[key] = value
+            if value == previous:
+                continue
+            if isinstance(value, dict) and isinstance(previous, dict):
+                value = {k: v for k, v in value.items() if previous.get(k) != v}
+            compact[key] = value
+        self.write("node", flush=True, node=node, update=compact)
+
+    def event_sink(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Tool event listener, suitable for ``tools.use_event_sink``.
+
+        File contents of ``file_written`` and ``file_restored`` events are
+        kept whole so that ``extract_files`` can rebuild the project.
+        """
+        self.write(event_type, verbatim=("content",), **data)
+
+    def close(self, status: str = "completed", **data: Any) -> None:
+        """Write the trailer record and close the file."""
+        if self.closed:
+            return
+        self.write("run_end", status=status, duration=round(time.time() - self._started, 4), **data)
+        with self._lock:
+            self.closed = True
+            self._file.close()
+
+    def __enter__(self) -> "TranscriptWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close("completed")
+        else:
+            self.close("failed", error=str(exc) or exc_type.__name__)
+
+
+class TranscriptCallback(BaseCallbackHandler):
+    """Callback handler that records LLM and tool calls into a transcript."""
+
+    def __init__(self, writer: TranscriptWriter):
+        super().__init__()
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._started: Dict[UUID, float] = {}
+
+    def _begin(self, run_id: UUID) -> None:
+        with self._lock:
+            self._started[run_id] = time.time()
+
+    def _elapsed(self, run_id: UUID) -> Optional[float]:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        return round(time.time() - started, 4) if started is not None else None
+
+    @staticmethod
+    def _model_name(serialized: Optional[Dict[str, Any]], kwargs: Dict[str, Any]) -> Optional[str]:
+        params = kwargs.get("invocation_params") or {}
+        name = params.get("model") or params.get("model_name")
+        if not name and serialized:
+            name = (serialized.get("kwargs") or {}).get("model") or serialized.get("name")
+        return name
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, **kwargs: Any,
+    ) -> None:
+        self._begin(run_id)
+        self.writer.write(
+            "llm_start", run_id=run_id, parent_run_id=parent_run_id,
+            model=self._model_name(serialized, kwargs), node=(kwargs.get("metadata") or {}).get("langgraph_node"),
+            messages=messages[0] if len(messages) == 1 else messages,
+        )
+
+    def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, **kwargs: Any,
+    ) -> None:
+        self._begin(run_id)
+        self.writer.write(
+            "llm_start", run_id=run_id, parent_run_id=parent_run_id,
+            model=self._model_name(serialized, kwargs), node=(kwargs.get("metadata") or {}).get("langgraph_node"),
+            prompts=prompts,
+        )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        outputs = []
+        usage: Dict[str, int] = {}
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is None:
+                    outputs.append({"text": generation.text})
+                    continue
+                outputs.append(message)
+                for key, value in (getattr(message, "usage_metadata", None) or {}).items():
+                    if isinstance(value, int):
+                        usage[key] = usage.get(key, 0) + value
+        self.writer.write("llm_end", run_id=run_id, latency=self._elapsed(run_id), outputs=outputs, usage=usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.writer.write("llm_error", flush=True, run_id=run_id, latency=self._elapsed(run_id), error=repr(error))
+
+    def on_tool_start(
+        self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+        parent_run_id: Optional[UUID] = None, inputs: Optional[Dict[str, Any]] = None, **kwargs: Any,
+    ) -> None:
+        self._begin(run_id)
+        self.writer.write(
+            "tool_start", run_id=run_id, parent_run_id=parent_run_id,
+            tool=(serialized or {}).get("name"), inputs=inputs if inputs is not None else input_str,
+        )
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        content = getattr(output, "content", output)
+        self.writer.write("tool_end", run_id=run_id, latency=self._elapsed(run_id), output=content)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.writer.write("tool_error", flush=True, run_id=run_id, latency=self._elapsed(run_id), error=repr(error))
+
+
+def open_transcript(run_id: Optional[str] = None, directory: Optional[pathlib.Path] = None) -> Optional[TranscriptWriter]:
+    """Create a transcript writer from the configured settings.
+
+    Args:
+        run_id: Identifier used in the file name (random if omitted)
+        directory: Override for the configured transcript directory
+
+    Returns:
+        A writer, or None if transcripts are disabled
+    """
+    settings = get_transcript_settings()
+    if not settings["enabled"]:
+        return None
+    path = new_transcript_path(directory or settings["path"], run_id)
+    return TranscriptWriter(path, max_field_chars=settings["max_field_chars"])
+
+
+def read_transcript(path: pathlib.Path) -> Iterator[Dict[str, Any]]:
+    """Yield the records of a transcript one at a time.
+
+    A transcript cut short by a crash is read up to its last complete record.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping truncated record in {path}")
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        logger.warning(f"Transcript {path} ends early: {e}")
+
+
+def filter_records(
+    records: Iterable[Dict[str, Any]],
+    types: Optional[Sequence[str]] = None,
+    node: Optional[str] = None,
+    grep: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Select records by type, graph node or a substring of their JSON text."""
+    for record in records:
+        if types and record.get("type") not in types:
+            continue
+        if node and record.get("node") != node:
+            continue
+        if grep and grep not in json.dumps(record, ensure_ascii=False):
+            continue
+        yield record
+
+
+def summarize_transcript(path: pathlib.Path) -> Dict[str, Any]:
+    """Aggregate a transcript into counts, latencies and token usage.
+
+    The transcript is streamed, so this works on runs of any size.
+    """
+    summary: Dict[str, Any] = {"path": str(path), "records": 0, "record_types": {}, "nodes": [], "files_written": 0}
+    llm_latencies: List[float] = []
+    tool_latencies: Dict[str, List[float]] = {}
+    tool_names: Dict[str, str] = {}
+    tokens = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    errors = []
+    for record in read_transcript(path):
+        summary["records"] += 1
+        record_type = record.get("type")
+        summary["record_types"][record_type] = summary["record_types"].get(record_type, 0) + 1
+        if record_type == "run_start":
+            summary["prompt"] = record.get("prompt")
+            summary["started_at"] = record.get("started_at")
+        elif record_type == "run_end":
+            summary["status"] = record.get("status")
+            summary["duration"] = record.get("duration")
+        elif record_type == "node":
+            summary["nodes"].append(record.get("node"))
+        elif record_type == "file_written":
+            summary["files_written"] += 1
+        elif record_type == "llm_end":
+            if record.get("latency") is not None:
+                llm_latencies.append(record["latency"])
+            for key in tokens:
+                tokens[key] += record.get("usage", {}).get(key, 0)
+        elif record_type == "tool_start":
+            tool_names[record.get("run_id")] = record.get("tool") or "unknown"
+        elif record_type in ("tool_end", "tool_error"):
+            name = tool_names.pop(record.get("run_id"), "unknown")
+            if record.get("latency") is not None:
+                tool_latencies.setdefault(name, []).append(record["latency"])
+        if record_type in ("llm_error", "tool_error") or (record_type == "run_end" and record.get("error")):
+            errors.append({"seq": record.get("seq"), "type": record_type, "error": record.get("error")})
+
+    summary.setdefault("status", "incomplete")
+    summary["llm"] = {"latency": latency_summary(llm_latencies), **tokens}
+    summary["tools"] = {name: latency_summary(values) for name, values in sorted(tool_latencies.items())}
+    summary["errors"] = errors
+    return summary
+
+
+def _describe(record: Dict[str, Any]) -> str:
+    """Render a record as one line of a human-readable timeline."""
+    record_type = record.get("type")
+    if record_type == "run_start":
+        return f"run started: {record.get('prompt', '')!r}"
+    if record_type == "run_end":
+        return f"run {record.get('status')} after {record.get('duration')}s" + (
+            f" ({record['error']})" if record.get("error") else ""
+        )
+    if record_type == "node":
+        return f"node {record.get('node')} finished"
+    if record_type == "llm_start":
+        messages = record.get("messages") or record.get("prompts") or []
+        return f"llm call ({record.get('model') or 'model'}, {len(messages)} messages)"
+    if record_type == "llm_end":
+        calls = [c.get("name") for o in record.get("outputs", []) for c in o.get("tool_calls", []) or []]
+        usage = record.get("usage", {})
+        detail = f"tool calls: {', '.join(calls)}" if calls else "text reply"
+        return f"llm reply in {record.get('latency')}s, {usage.get('total_tokens', 0)} tokens, {detail}"
+    if record_type == "tool_start":
+        inputs = record.get("inputs")
+        target = inputs.get("path") if isinstance(inputs, dict) else None
+        return f"tool {record.get('tool')}" + (f"({target})" if target else "")
+    if record_type == "tool_end":
+        return f"tool done in {record.get('latency')}s"
+    if record_type == "file_written":
+        return f"wrote {record.get('path')} ({record.get('bytes')} bytes)"
+    if record_type in ("llm_error", "tool_error"):
+        return f"{record_type.replace('_', ' ')}: {record.get('error')}"
+    return json.dumps({k: v for k, v in record.items() if k not in ("seq", "t")}, ensure_ascii=False)[:200]
+
+
+def replay(path: pathlib.Path, speed: float = 0.0, out=sys.stdout) -> None:
+    """Print the run as a timeline, optionally paced like the original run.
+
+    Args:
+        path: Transcript file
+        speed: Playback speed factor; 0 prints everything immediately
+        out: Stream to print to
+    """
+    previous = 0.0
+    for record in read_transcript(path):
+        t = record.get("t", 0.0)
+        if speed > 0 and t > previous:
+            time.sleep((t - previous) / speed)
+        previous = t
+        print(f"[{t:9.3f}s] #{record.get('seq')} {_describe(record)}", file=out, flush=True)
+
+
+def extract_files(path: pathlib.Path, dest: pathlib.Path) -> Tuple[List[str], List[str]]:
+    """Rebuild the files of a run from its ``file_written`` and ``file_restored`` records.
+
+    Transcripts written before these records carried the file content fall
+    back to the inputs of the matching ``write_file`` call, unless they were
+    truncated.
+
+    Returns:
+        A tuple of (restored paths, paths whose final content is not in the transcript)
+    """
+    dest = pathlib.Path(dest).resolve()
+    files: Dict[str, Optional[str]] = {}  # None: written, but the content is unknown
+    pending: Dict[str, str] = {}  # write_file inputs awaiting their file_written record
+    for record in filter_records(read_transcript(path), types=["tool_start", "file_written", "file_restored"]):
+        record_type = record.get("type")
+        if record_type == "tool_start":
+            inputs = record.get("inputs")
+            if record.get("tool") == "write_file" and isinstance(inputs, dict) and "path" in inputs:
+                pending[inputs["path"]] = inputs.get("content", "")
+            continue
+        relative = record.get("path")
+        if not relative:
+            continue
+        if "content" not in record:
+            content = pending.pop(relative, None) if record_type == "file_written" else None
+            files[relative] = None if content is None or _TRUNCATED.search(content) else content
+        elif record["content"] is None:
+            files.pop(relative, None)  # Deleted by a rollback
+        else:
+            files[relative] = record["content"]
+
+    restored, missing = [], []
+    for relative, content in sorted(files.items()):
+        target = (dest / relative).resolve()
+        if dest not in target.parents:
+            logger.warning(f"Skipping path outside the destination: {relative}")
+            continue
+        if content is None:
+            missing.append(relative)
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content, encoding="utf-8")
+        restored.append(relative)
+    return restored, missing
+
+
+def main() -> None:
+    """Command line entry point for querying and replaying transcripts."""
+    parser = argparse.ArgumentParser(description="Query and replay agent run transcripts")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = subparsers.add_parser("summary", help="Print aggregate statistics of a run")
+    summary_parser.add_argument("path", type=pathlib.Path)
+
+    show_parser = subparsers.add_parser("show", help="Print matching records as JSON lines")
+    show_parser.add_argument("path", type=pathlib.Path)
+    show_parser.add_argument("--type", action="append", dest="types", help="Record type (repeatable)")
+    show_parser.add_argument("--node", help="Only records of this graph node")
+    show_parser.add_argument("--grep", help="Only records containing this text")
+    show_parser.add_argument("--limit", type=int, default=0, help="Stop after this many records")
+
+    replay_parser = subparsers.add_parser("replay", help="Print a human-readable timeline of the run")
+    replay_parser.add_argument("path", type=pathlib.Path)
+    replay_parser.add_argument("--speed", type=float, default=0.0,
+                               help="Playback speed factor (default: 0, no pacing)")
+
+    extract_parser = subparsers.add_parser("extract", help="Restore the files written during the run")
+    extract_parser.add_argument("path", type=pathlib.Path)
+    extract_parser.add_argument("dest", type=pathlib.Path)
+
+    args = parser.parse_args()
+    if not args.path.is_file():
+        parser.error(f"No transcript at {args.path}")
+
+    if args.command == "summary":
+        print(json.dumps(summarize_transcript(args.path), indent=2))
+    elif args.command == "show":
+        records = filter_records(read_transcript(args.path), args.types, args.node, args.grep)
+        for n, record in enumerate(records, 1):
+            print(json.dumps(record, ensure_ascii=False))
+            if args.limit and n >= args.limit:
+                break
+    elif args.command == "replay":
+        replay(args.path, args.speed)
+    else:
+        restored, missing = extract_files(args.path, args.dest)
+        for relative in restored:
+            print(relative)
+        for relative in missing:
+            print(f"not restored (content not in the transcript): {relative}", file=sys.stderr)
+        if missing:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,22 @@
 import argparse
+import contextlib
+import json
+import os
+import pathlib
+import queue
+import re
 import sys
+import time
 import traceback
 import logging
 
-from Agent.graph import agent
-from Agent.config import is_configured, load_config, update_api_config, get_api_provider, get_model_name
+# LangChain, the graph and the provider SDKs are imported where they are
+# used, so that client mode dispatches to a warm daemon without loading them
+from Agent.config import (
+    is_configured, load_config, update_api_config, get_api_provider, get_model_name,
+    get_profiling_settings, get_transcript_settings, PROJECT_ROOT,
+)
+from Agent.daemon import DaemonError
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +49,324 @@ def validate_recursion_limit(value: int) -> int:
         raise argparse.ArgumentTypeError(f"Invalid recursion limit: {value}")
 
 
+def validate_workers(value: str) -> int:
+    """Validate the number of concurrent batch workers.
+    
+    Args:
+        value: The worker count from the command line
+        
+    Returns:
+        The validated worker count
+        
+    Raises:
+        argparse.ArgumentTypeError: If the value is invalid
+    """
+    try:
+        int_value = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid worker count: {value}")
+    if not 1 <= int_value <= 64:
+        raise argparse.ArgumentTypeError("Worker count must be between 1 and 64")
+    return int_value
+
+
+def validate_deadline(value: str) -> float:
+    """Validate a run deadline.
+    
+    Args:
+        value: The deadline in seconds from the command line
+        
+    Returns:
+        The validated deadline
+        
+    Raises:
+        argparse.ArgumentTypeError: If the value is invalid
+    """
+    try:
+        float_value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid deadline: {value}")
+    if not float_value > 0:
+        raise argparse.ArgumentTypeError("Deadline must be a positive number of seconds")
+    return float_value
+
+
+def load_batch_prompts(path: pathlib.Path) -> list:
+    """Load batch prompts from a JSONL file.
+    
+    Each line is either a JSON object with a "prompt" key and an optional
+    "id" key, or a plain JSON string. Blank lines are ignored.
+    
+    Args:
+        path: Path to the JSONL file
+        
+    Returns:
+        A list of (job_id, prompt) tuples
+        
+    Raises:
+        ValueError: If a line is malformed or IDs are duplicated
+    """
+    prompts = []
+    seen = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_no}: invalid JSON: {e}")
+            if isinstance(entry, str):
+                entry = {"prompt": entry}
+            if not isinstance(entry, dict) or not str(entry.get("prompt", "")).strip():
+                raise ValueError(f"{path}:{line_no}: expected an object with a non-empty 'prompt'")
+            job_id = str(entry.get("id") or f"job-{len(prompts) + 1:04d}")
+            # Job IDs double as workspace directory names
+            job_id = re.sub(r"[^A-Za-z0-9._-]", "_", job_id)
+            if job_id in seen:
+                raise ValueError(f"{path}:{line_no}: duplicate id '{job_id}'")
+            seen.add(job_id)
+            prompts.append((job_id, str(entry["prompt"]).strip()))
+    return prompts
+
+
+def batch_result(job) -> dict:
+    """Build the machine-readable result record for a finished batch job."""
+    from Agent.revision import project_files
+
+    files = project_files(job.workspace)
+    return {
+        "type": "result",
+        "job_id": job.job_id,
+        "status": job.status.value,
+        "duration": round(job.duration, 3) if job.duration is not None else None,
+        "tokens": job.usage,
+        "files": len(files),
+        "workspace": str(job.workspace),
+        "transcript": str(job.transcript_path) if job.transcript_path else None,
+        "error": job.error,
+    }
+
+
+def run_batch(batch_path: pathlib.Path, workers: int, out_dir: pathlib.Path, recursion_limit: int) -> int:
+    """Run every prompt of a batch file concurrently.
+    
+    In batch-API mode (COMPANIO_BATCH_API) the LLM calls of the concurrent
+    jobs are collected into provider batches, so ``workers`` bounds how
+    many requests a batch can hold.
+    
+    Each job writes into ``out_dir/<job_id>``. One JSON result line per job
+    is printed to stdout as jobs finish and appended to
+    ``out_dir/results.jsonl``; an aggregate summary line is printed last
+    and saved to ``out_dir/summary.json``.
+    
+    Args:
+        batch_path: JSONL file with the prompts
+        workers: Maximum number of concurrent jobs
+        out_dir: Directory for job workspaces and reports
+        recursion_limit: Recursion limit for each job
+        
+    Returns:
+        Process exit code (0 if every job completed)
+    """
+    from langchain_core.globals import set_debug, set_verbose
+    from Agent import graph as graph_module
+    from Agent.batch import BatchChatModel
+    from Agent.hedging import HedgedChatModel
+    from Agent.jobs import Job, JobManager, JobStatus
+    from Agent.key_pool import find_pooled_model
+    from Agent.metrics import latency_summary
+
+    prompts = load_batch_prompts(batch_path)
+    if not prompts:
+        logger.error(f"No prompts found in {batch_path}")
+        return 1
+
+    # Debug tracing goes to stdout and would corrupt the result stream
+    set_debug(False)
+    set_verbose(False)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    finished: "queue.Queue[Job]" = queue.Queue()
+    manager = JobManager(max_workers=workers, workspace_root=out_dir, on_finish=finished.put)
+    logger.info(f"Running {len(prompts)} prompts with {workers} workers into {out_dir}")
+
+    started = time.time()
+    results = []
+    try:
+        for job_id, prompt in prompts:
+            manager.submit(prompt, recursion_limit=recursion_limit, job_id=job_id)
+        with open(out_dir / "results.jsonl", "a", encoding="utf-8") as results_file:
+            while len(results) < len(prompts):
+                record = batch_result(finished.get())
+                results.append(record)
+                line = json.dumps(record)
+                print(line, flush=True)
+                results_file.write(line + "\n")
+                results_file.flush()
+    finally:
+        manager.shutdown(wait=False)
+
+    wall_time = time.time() - started
+    durations = [r["duration"] for r in results if r["status"] == JobStatus.COMPLETED.value and r["duration"] is not None]
+    summary = {
+        "type": "summary",
+        "jobs": len(results),
+        "completed": sum(r["status"] == JobStatus.COMPLETED.value for r in results),
+        "failed": sum(r["status"] == JobStatus.FAILED.value for r in results),
+        "cancelled": sum(r["status"] == JobStatus.CANCELLED.value for r in results),
+        "timed_out": sum(r["status"] == JobStatus.TIMED_OUT.value for r in results),
+        "workers": workers,
+        "wall_time": round(wall_time, 3),
+        "throughput_per_minute": round(len(results) / wall_time * 60, 3) if wall_time > 0 else None,
+        "latency": {k: round(v, 3) for k, v in latency_summary(durations).items()},
+        "tokens": {
+            key: sum(r["tokens"].get(key, 0) for r in results)
+            for key in ("llm_calls", "input_tokens", "output_tokens", "total_tokens")
+        },
+        "files": sum(r["files"] for r in results),
+    }
+    if isinstance(graph_module.llm, HedgedChatModel):
+        summary["hedging"] = graph_module.llm.stats.report()
+    pooled = find_pooled_model(graph_module.llm)
+    if pooled is not None:
+        summary["key_pool"] = pooled.pool.report()
+    batch_models = [m for m in (pooled.models if pooled is not None else [graph_module.llm]) if isinstance(m, BatchChatModel)]
+    if batch_models:
+        reports = [m.collector.report() for m in batch_models]
+        summary["batch_api"] = {key: round(sum(r[key] for r in reports), 3) for key in reports[0]}
+    print(json.dumps(summary), flush=True)
+    with open(out_dir / "summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return 0 if summary["completed"] == len(results) else 1
+
+
+def run_interactive(
+    user_prompt: str, recursion_limit: int, profile: bool = False, revise: pathlib.Path = None
+) -> tuple:
+    """Run the agent for one prompt, streaming a transcript of the run to disk.
+    
+    The run is bounded by COMPANIO_RUN_DEADLINE (``--deadline``). When the
+    deadline passes, or the user presses Ctrl-C, its LLM requests and
+    commands are cancelled; past the deadline the state of the finished
+    nodes is returned with ``status`` set to "deadline_exceeded".
+    
+    Args:
+        user_prompt: What the user wants to build
+        recursion_limit: Recursion limit for the graph
+        profile: Record per-node CPU stacks and memory growth next to the transcript
+        revise: Existing project directory to revise; only files affected by
+            the revised prompt are regenerated
+        
+    Returns:
+        A tuple of (final agent state, transcript path or None if disabled)
+    """
+    from Agent.cancellation import CancelToken, RunCancelled, use_cancel_token
+    from Agent.config import get_run_deadline
+    from Agent.graph import agent
+    from Agent.profiling import RunProfiler, profile_dir_for
+    from Agent.revision import load_revision
+    from Agent.tools import use_event_sink, use_project_root
+    from Agent.transcript import open_transcript, new_transcript_path
+
+    inputs = {"user_prompt": user_prompt}
+    if revise is not None:
+        inputs.update(load_revision(revise))
+
+    transcript = open_transcript()
+    state = dict(inputs)
+    callbacks = []
+    token = CancelToken(get_run_deadline())
+    with contextlib.ExitStack() as stack:
+        stack.callback(token.close)
+        stack.enter_context(use_cancel_token(token))
+        if revise is not None:
+            stack.enter_context(use_project_root(revise))
+        if transcript is not None:
+            transcript.start(prompt=user_prompt, recursion_limit=recursion_limit)
+            logger.info(f"Recording run transcript to {transcript.path}")
+            stack.enter_context(transcript)
+            stack.enter_context(use_event_sink(transcript.event_sink))
+            callbacks.append(transcript.callback)
+        if profile:
+            settings = get_profiling_settings()
+            run_path = transcript.path if transcript is not None else new_transcript_path(get_transcript_settings()["path"])
+            profiler = RunProfiler(profile_dir_for(run_path), settings["interval"], settings["trace_memory"])
+            logger.info(f"Profiling run into {profiler.output_dir}")
+            stack.enter_context(profiler)
+            callbacks.append(profiler.callback)
+
+        try:
+            for chunk in agent.stream(
+                inputs,
+                {"recursion_limit": recursion_limit, "callbacks": callbacks},
+                stream_mode="updates",
+            ):
+                for node, update in chunk.items():
+                    if update:
+                        state.update(update)
+                    if transcript is not None:
+                        transcript.record_node(node, update)
+        except KeyboardInterrupt:
+            # Stop the provider requests and commands still running for this run
+            token.cancel()
+            raise
+        except RunCancelled as e:
+            logger.warning(f"{e}; keeping the result of the finished steps")
+            state["status"] = e.status
+            if transcript is not None:
+                transcript.close(e.status, error=str(e))
+    return state, transcript.path if transcript is not None else None
+
+
+def run_client(
+    user_prompt: str, recursion_limit: int, socket_path: pathlib.Path = None, revise: pathlib.Path = None,
+    deadline: float = None,
+) -> int:
+    """Run one prompt on the warm daemon, printing its progress as it arrives.
+    
+    Args:
+        user_prompt: What the user wants to build
+        recursion_limit: Recursion limit for the graph
+        socket_path: Daemon socket (default: COMPANIO_DAEMON_SOCKET or ~/.companio/daemon.sock)
+        revise: Existing project directory to revise instead of generating generated_project
+        deadline: Seconds the run may take (default: the daemon's own deadline)
+        
+    Returns:
+        Process exit code (0 if the job completed)
+        
+    Raises:
+        DaemonError: If no daemon answers or it rejects the request
+    """
+    from Agent.daemon import format_event, submit_to_daemon
+
+    started = time.perf_counter()
+
+    def on_event(event: dict) -> None:
+        if event.get("type") == "accepted":
+            logger.info(f"Dispatched to daemon in {(time.perf_counter() - started) * 1000:.0f} ms")
+        line = format_event(event)
+        if line:
+            print(line, file=sys.stderr, flush=True)
+
+    job = submit_to_daemon(
+        user_prompt, recursion_limit,
+        project_dir=revise if revise is not None else PROJECT_ROOT,
+        revise=revise is not None,
+        socket_path=socket_path,
+        on_event=on_event,
+        deadline=deadline,
+    )
+    if job.get("summary"):
+        print("\nSummary:", json.dumps(job["summary"], indent=2))
+    if job.get("transcript"):
+        print(f"Transcript: {job['transcript']}")
+    if job["status"] != "completed":
+        print(f"Error: job {job['status']}" + (f": {job['error']}" if job.get("error") else ""), file=sys.stderr)
+        return 1
+    return 0
+
+
 def setup_api_configuration():
     """Setup API configuration if not already configured."""
     if is_configured():
@@ -119,7 +449,13 @@ def main():
     """Main entry point for the project planner agent."""
     parser = argparse.ArgumentParser(
         description="Run engineering project planner",
-        epilog="Example: python main.py --recursion-limit 100"
+        epilog="Example: python main.py --recursion-limit 100\n"
+               "         python main.py --revise generated_project\n"
+               "         python main.py --batch prompts.jsonl --workers 4 --out runs/nightly\n"
+               "         python main.py --batch prompts.jsonl --batch-api --workers 64\n"
+               "         python main.py --daemon & echo 'A todo app' | python main.py --client\n"
+               "         COMPANIO_TASK_QUEUE=/shared/tasks.sqlite3 python main.py --worker --workers 4",
+        formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument(
         "--recursion-limit", "-r",
@@ -132,15 +468,128 @@ def main():
         action="store_true",
         help="Setup or change API configuration"
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write per-node CPU stacks and memory growth reports next to the run transcript"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=validate_deadline,
+        default=None,
+        metavar="SECONDS",
+        help="Stop a run after this many seconds, keeping what it generated so far (default: COMPANIO_RUN_DEADLINE, none)"
+    )
+    parser.add_argument(
+        "--revise",
+        type=pathlib.Path,
+        nargs="?",
+        const=PROJECT_ROOT,
+        metavar="PROJECT_DIR",
+        help="Revise an existing project (default: generated_project), regenerating only affected files"
+    )
+    parser.add_argument(
+        "--batch",
+        type=pathlib.Path,
+        metavar="PROMPTS_JSONL",
+        help="Run every prompt of a JSONL file non-interactively"
+    )
+    parser.add_argument(
+        "--batch-api",
+        action="store_true",
+        help="With --batch, send the LLM calls of all jobs through the provider's batch endpoint"
+    )
+    parser.add_argument(
+        "--workers",
+        type=validate_workers,
+        default=None,
+        help="Concurrent jobs in batch mode (default: 4, or every prompt up to 64 with --batch-api), "
+             "or concurrent tasks with --worker (default: 1)"
+    )
+    parser.add_argument(
+        "--out",
+        type=pathlib.Path,
+        default=pathlib.Path("batch_output"),
+        help="Output directory for batch workspaces and reports (default: batch_output)"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep a warm process with the compiled agent that runs prompts sent with --client"
+    )
+    parser.add_argument(
+        "--client",
+        action="store_true",
+        help="Send the prompt to a running --daemon and stream its progress"
+    )
+    parser.add_argument(
+        "--socket",
+        type=pathlib.Path,
+        default=None,
+        help="Daemon socket for --daemon and --client (default: ~/.companio/daemon.sock)"
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Run coder tasks published to the shared task queue (COMPANIO_TASK_QUEUE) until interrupted"
+    )
 
     args = parser.parse_args()
+    if args.daemon and (args.client or args.batch):
+        parser.error("--daemon cannot be combined with --client or --batch")
+    if args.batch_api and not args.batch:
+        parser.error("--batch-api requires --batch")
+    if args.worker and (args.daemon or args.client or args.batch):
+        parser.error("--worker cannot be combined with --daemon, --client or --batch")
+
+    if args.deadline is not None:
+        # Runs read the deadline when they start, in-process or through the job manager
+        os.environ["COMPANIO_RUN_DEADLINE"] = str(args.deadline)
 
     try:
-        # Setup API if requested or not configured
-        if args.setup_api or not is_configured():
+        # Setup API if requested or not configured; clients use the daemon's configuration
+        if args.setup_api or (not is_configured() and not args.client):
             setup_api_configuration()
         
-        user_prompt = input("What would you like to build: ").strip()
+        if args.daemon:
+            from Agent.daemon import serve_daemon
+            if args.profile:
+                # Daemon jobs run through the job manager, which reads the env flag
+                os.environ["COMPANIO_PROFILE"] = "1"
+            serve_daemon(args.socket, args.workers or 4)
+            return
+        
+        if args.worker:
+            from Agent.config import get_task_queue_settings
+            from Agent.task_queue import get_task_queue, serve_workers
+            queue = get_task_queue()
+            if queue is None:
+                parser.error("--worker requires COMPANIO_TASK_QUEUE to point at the shared queue database")
+            serve_workers(queue, args.workers or 1, get_task_queue_settings()["poll_seconds"])
+            return
+        
+        if args.batch:
+            if args.profile:
+                # Batch jobs run through the job manager, which reads the env flag
+                os.environ["COMPANIO_PROFILE"] = "1"
+            workers = args.workers or 4
+            if args.batch_api:
+                # The LLM is created on first use, after this
+                os.environ["COMPANIO_BATCH_API"] = "1"
+                # Jobs mostly wait on batches, and a batch only holds the calls of running jobs
+                workers = args.workers or min(64, max(1, len(load_batch_prompts(args.batch))))
+            sys.exit(run_batch(args.batch, workers, args.out, args.recursion_limit))
+        
+        if args.revise is not None and args.client:
+            print(f"Revising {args.revise}")
+            user_prompt = input("Revised request: ").strip()
+        elif args.revise is not None:
+            from Agent.revision import load_revision
+            previous = load_revision(args.revise)
+            print(f"Revising {args.revise}, generated from: {previous['previous_prompt']}")
+            user_prompt = input("Revised request: ").strip()
+        else:
+            user_prompt = input("What would you like to build: ").strip()
         
         if not user_prompt:
             logger.error("User prompt cannot be empty")
@@ -148,17 +597,33 @@ def main():
             sys.exit(1)
         
         logger.info(f"Processing user prompt: {user_prompt[:50]}...")
-        result = agent.invoke(
-            {"user_prompt": user_prompt},
-            {"recursion_limit": args.recursion_limit}
+        if args.client:
+            sys.exit(run_client(user_prompt, args.recursion_limit, args.socket, revise=args.revise, deadline=args.deadline))
+        
+        from Agent.jobs import summarize_state
+        result, transcript_path = run_interactive(
+            user_prompt, args.recursion_limit, profile=args.profile, revise=args.revise
         )
-        logger.info("Project generation completed successfully")
-        print("\nFinal State:", result)
+        summary = summarize_state(result)
+        if summary["status"] == "deadline_exceeded":
+            logger.warning("Deadline exceeded; the project holds the files generated so far")
+        else:
+            logger.info("Project generation completed successfully")
+        print("\nSummary:", json.dumps(summary, indent=2))
+        if transcript_path is not None:
+            print(f"Transcript: {transcript_path}")
+            print(f"Inspect it with: python -m Agent.transcript summary {transcript_path}")
+        if summary["status"] == "deadline_exceeded":
+            sys.exit(1)
         
     except KeyboardInterrupt:
         logger.info("Operation cancelled by user.")
         print("\nOperation cancelled by user.")
         sys.exit(0)
+    except DaemonError as e:
+        logger.error(str(e))
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
     except Exception as e:
         logger.error(f"An error occurred: {e}", exc_info=True)
         traceback.print_exc()
@@ -1,13 +1,19 @@
 import streamlit as st
+import itertools
 import logging
-import traceback
-from typing import Any, Dict, Generator
+import os
+import pathlib
+import time
+from typing import Any, Callable, Dict, Generator, List, Tuple
 import json
 from datetime import datetime
 
-from Agent.graph import agent, AgentState, initialize_llm
-from Agent.states import Plan, TaskPlan, CoderState, ImplementationTask
-from Agent.config import is_configured, load_config, update_api_config, get_api_provider, get_api_key, get_model_name
+from Agent.graph import AgentState, initialize_llm
+from Agent.states import Plan, CoderState, ImplementationTask
+from Agent.config import is_configured, load_config, update_api_config, get_api_provider, get_api_key, get_model_name, get_run_deadline
+from Agent.jobs import Job, JobManager, JobStatus, summarize_state
+from Agent.revision import project_files
+from Agent.transcript import summarize_transcript
 
 # Configure page
 st.set_page_config(
@@ -77,6 +83,20 @@ if "api_configured" not in st.session_state:
     st.session_state.api_configured = is_configured()
 if "show_api_config" not in st.session_state:
     st.session_state.show_api_config = not is_configured()
+if "active_job_id" not in st.session_state:
+    # Reattach to an in-flight job after a browser refresh
+    st.session_state.active_job_id = st.query_params.get("job")
+if "recorded_jobs" not in st.session_state:
+    st.session_state.recorded_jobs = set()
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Return the job manager shared by every browser session of this server."""
+    return JobManager(max_workers=int(os.getenv("COMPANIO_MAX_JOBS", "2")))
+
+
+job_manager = get_job_manager()
 
 
 def show_api_configuration_modal():
@@ -214,6 +234,15 @@ with st.sidebar:
         help="Maximum recursion limit for agent processing"
     )
     
+    deadline = st.number_input(
+        "Deadline (seconds)",
+        min_value=0,
+        max_value=24 * 3600,
+        value=int(get_run_deadline() or 0),
+        step=30,
+        help="Stop a run after this many seconds, keeping the files generated so far (0: no deadline)"
+    )
+    
     st.divider()
     st.title("Execution History")
     
@@ -252,6 +281,8 @@ if clear_button:
     st.session_state.execution_history = []
     st.session_state.current_execution = None
     st.session_state.agent_state = None
+    st.session_state.active_job_id = None
+    st.query_params.clear()
     st.rerun()
 
 # Execution handling
@@ -260,149 +291,277 @@ if run_button:
         st.error("❌ Please enter a project description")
     else:
         try:
-            # Create placeholders for dynamic updates
-            status_placeholder = st.empty()
-            progress_placeholder = st.empty()
-            logs_placeholder = st.empty()
-            
-            execution_log = {
-                "timestamp": datetime.now().isoformat(),
-                "prompt": user_prompt,
-                "stages": {
-                    "planner": {"status": "pending", "output": None},
-                    "architect": {"status": "pending", "output": None},
-                    "coder": {"status": "pending", "iterations": []}
-                },
-                "final_state": None,
-                "error": None
-            }
-            
-            # Planner stage
-            status_placeholder.markdown(
-                '<div class="status-running">🔄 Stage 1/3: Planning...</div>',
-                unsafe_allow_html=True
-            )
-            progress_placeholder.progress(0.33)
-            
-            logs_placeholder.info("Analyzing your project requirements...")
-            
-            # Run the agent
-            try:
-                final_state = agent.invoke(
-                    {"user_prompt": user_prompt},
-                    {"recursion_limit": recursion_limit}
-                )
-                
-                # Update execution log
-                execution_log["final_state"] = {
-                    "status": final_state.get("status", "completed"),
-                    "project_plan": None,  # Will be serialized below
-                    "architect_plan": final_state.get("architect_plan", []),
-                    "coder_iterations": len(final_state.get("coder_state", CoderState(task_plan=TaskPlan(implementation_steps=[]))).task_plan.implementation_steps)
-                    if final_state.get("coder_state") else 0
-                }
-                
-                # Serialize Plan object if it exists
-                if isinstance(final_state.get("project_plan"), Plan):
-                    plan = final_state["project_plan"]
-                    execution_log["final_state"]["project_plan"] = {
-                        "name": plan.name,
-                        "description": plan.description,
-                        "techstack": plan.techstack,
-                        "features": plan.features,
-                        "files": plan.files
-                    }
-                
-                execution_log["stages"]["planner"]["status"] = "completed"
-                execution_log["stages"]["architect"]["status"] = "completed"
-                execution_log["stages"]["coder"]["status"] = "completed"
-                
-                # Update session state
-                st.session_state.agent_state = final_state
-                st.session_state.execution_history.append(execution_log)
-                
-                # Display results
-                status_placeholder.markdown(
-                    '<div class="status-completed">✅ All stages completed successfully!</div>',
-                    unsafe_allow_html=True
+            job = job_manager.submit(user_prompt, recursion_limit=recursion_limit, deadline=deadline or None)
+            st.session_state.active_job_id = job.job_id
+            # Keep the job ID in the URL so a browser refresh reattaches to it
+            st.query_params["job"] = job.job_id
+            st.rerun()
+        except ValueError as e:
+            st.error(f"❌ {str(e)}")
+
+
+def build_execution_log(job: Job) -> Dict[str, Any]:
+    """Build the execution history entry for a finished job."""
+    stage_status = "completed" if job.status == JobStatus.COMPLETED else job.status.value
+    execution_log = {
+        "job_id": job.job_id,
+        "timestamp": datetime.fromtimestamp(job.created_at).isoformat(),
+        "prompt": job.prompt,
+        "workspace": str(job.workspace),
+        "duration": job.duration,
+        "stages": {
+            "planner": {"status": stage_status, "output": None},
+            "architect": {"status": stage_status, "output": None},
+            "coder": {"status": stage_status, "iterations": []}
+        },
+        "final_state": None,
+        "error": job.error if job.status != JobStatus.CANCELLED else "Cancelled by user"
+    }
+    # Only a compact summary is kept in the session; the full record of the
+    # run (messages, tool calls, timings) is streamed to the transcript file
+    if job.final_state:
+        execution_log["final_state"] = summarize_state(job.final_state)
+    if job.transcript_path is not None:
+        execution_log["transcript"] = str(job.transcript_path)
+    return execution_log
+
+
+# Results are rendered one page at a time so that a rerun costs the same
+# for a plan of ten tasks as for a plan of several hundred
+PAGE_SIZES = [10, 25, 50, 100]
+# File previews larger than this are truncated unless the full file is requested
+MAX_PREVIEW_CHARS = 20000
+
+
+def filter_items(items: List[Any], query: str, text: Callable[[Any], str]) -> List[Tuple[int, Any]]:
+    """Return (1-based index, item) pairs whose text contains every word of the query."""
+    words = query.lower().split()
+    indexed = list(enumerate(items, 1))
+    if not words:
+        return indexed
+    return [(i, item) for i, item in indexed if all(w in text(item).lower() for w in words)]
+
+
+def paginate(items: List[Any], key: str, label: str) -> List[Any]:
+    """Render page controls for a list and return the items of the current page."""
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col3:
+        page_size = st.selectbox("Per page", PAGE_SIZES, index=1, key=f"{key}_size")
+    pages = max(1, -(-len(items) // page_size))
+    with col2:
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key=f"{key}_page")
+    start = (int(page) - 1) * page_size
+    with col1:
+        if items:
+            st.caption(f"{label} {start + 1}-{min(start + page_size, len(items))} of {len(items)}")
+        else:
+            st.caption(f"No matching {label.lower()}")
+    return items[start:start + page_size]
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def read_workspace_file(path: str, mtime: float) -> str:
+    """Read a generated file; the modification time keeps the cache fresh."""
+    return pathlib.Path(path).read_text(encoding="utf-8", errors="replace")
+
+
+def render_file_preview(workspace: pathlib.Path, relative_path: str, key: str) -> None:
+    """Show one generated file, loaded only when this is called."""
+    path = workspace / relative_path
+    if not path.is_file():
+        st.info(f"`{relative_path}` does not exist in the workspace")
+        return
+    content = read_workspace_file(str(path), path.stat().st_mtime)
+    if len(content) > MAX_PREVIEW_CHARS and not st.toggle(
+        f"Show all {len(content):,} characters", key=f"{key}_full"
+    ):
+        content = content[:MAX_PREVIEW_CHARS] + "\n... (truncated)"
+    language = pathlib.PurePath(relative_path).suffix.lstrip(".") or None
+    st.code(content, language=language)
+
+
+def render_lazy_json(label: str, load: Callable[[], Any], key: str) -> None:
+    """Render a JSON blob only when the user asks for it."""
+    if st.toggle(label, key=key):
+        st.json(load(), expanded=False)
+
+
+def render_results(final_state: Dict[str, Any], execution_log: Dict[str, Any]) -> None:
+    """Render the result tabs for a finished run."""
+    st.divider()
+    st.subheader("📊 Execution Results")
+
+    key = execution_log.get("job_id", "run")
+    workspace = pathlib.Path(execution_log["workspace"])
+    tabs = st.tabs(["Plan", "Architecture", "Code Tasks", "Files", "Full State"])
+
+    with tabs[0]:
+        if isinstance(final_state.get("project_plan"), Plan):
+            plan = final_state["project_plan"]
+            st.markdown(f'<div class="plan-section">', unsafe_allow_html=True)
+            st.write(f"**Project Name:** {plan.name}")
+            st.write(f"**Description:** {plan.description}")
+            st.write(f"**Tech Stack:** {plan.techstack}")
+            st.write(f"**Features:**")
+            st.markdown("\n".join(f"- {feature}" for feature in plan.features))
+            st.write(f"**Files to Create:** {len(plan.files)}")
+            files = paginate(plan.files, f"{key}_plan_files", "Files")
+            st.markdown("\n".join(f"- `{file}`" for file in files))
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.warning("No project plan available")
+
+    with tabs[1]:
+        architect_plan = final_state.get("architect_plan", [])
+        if architect_plan:
+            st.write(f"**Total Implementation Steps:** {len(architect_plan)}")
+            query = st.text_input("Search steps", key=f"{key}_arch_query", placeholder="File path or keyword")
+            matches = filter_items(architect_plan, query, str)
+            for i, step in paginate(matches, f"{key}_arch", "Steps"):
+                st.markdown(f'<div class="task-item">', unsafe_allow_html=True)
+                st.write(f"**Step {i}:** {step}")
+                st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.warning("No architecture plan available")
+
+    with tabs[2]:
+        coder_state = final_state.get("coder_state")
+        if coder_state and isinstance(coder_state, CoderState):
+            steps = coder_state.task_plan.implementation_steps
+            st.write(f"**Total Code Tasks:** {len(steps)}")
+            st.write(f"**Current Step Index:** {coder_state.current_step_idx}")
+            st.write(f"**Scaffolded / LLM-generated files:** {coder_state.scaffolded_files} / {coder_state.generated_files}")
+
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                query = st.text_input("Search tasks", key=f"{key}_task_query", placeholder="File path or keyword")
+            with col2:
+                status = st.selectbox("Status", ["All", "Done", "Pending"], key=f"{key}_task_status")
+            matches = [
+                (i, task) for i, task in filter_items(steps, query, lambda t: f"{t.filepath} {t.task_description}")
+                if status == "All" or (i <= coder_state.current_step_idx) == (status == "Done")
+            ]
+            page = paginate(matches, f"{key}_tasks", "Tasks")
+            for i, task in page:
+                done = "✅" if i <= coder_state.current_step_idx else "⏳"
+                st.markdown(f"{done} **Task {i}:** `{task.filepath}`")
+            if page:
+                # Details and file content are only loaded for the selected task
+                selected = st.selectbox(
+                    "Task details", page, key=f"{key}_task_selected",
+                    format_func=lambda item: f"Task {item[0]}: {item[1].filepath}",
                 )
-                progress_placeholder.progress(1.0)
-                logs_placeholder.success("Agent execution completed!")
-                
-                # Show results
-                st.divider()
-                st.subheader("📊 Execution Results")
-                
-                tabs = st.tabs(["Plan", "Architecture", "Code Tasks", "Full State"])
-                
-                with tabs[0]:
-                    if isinstance(final_state.get("project_plan"), Plan):
-                        plan = final_state["project_plan"]
-                        st.markdown(f'<div class="plan-section">', unsafe_allow_html=True)
-                        st.write(f"**Project Name:** {plan.name}")
-                        st.write(f"**Description:** {plan.description}")
-                        st.write(f"**Tech Stack:** {plan.techstack}")
-                        st.write(f"**Features:**")
-                        for feature in plan.features:
-                            st.write(f"  - {feature}")
-                        st.write(f"**Files to Create:**")
-                        for file in plan.files:
-                            st.write(f"  - {file}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    else:
-                        st.warning("No project plan available")
-                
-                with tabs[1]:
-                    architect_plan = final_state.get("architect_plan", [])
-                    if architect_plan:
-                        st.markdown(f'<div class="plan-section">', unsafe_allow_html=True)
-                        st.write(f"**Total Implementation Steps:** {len(architect_plan)}")
-                        for i, step in enumerate(architect_plan, 1):
-                            st.markdown(f'<div class="task-item">', unsafe_allow_html=True)
-                            st.write(f"**Step {i}:** {step}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    else:
-                        st.warning("No architecture plan available")
-                
-                with tabs[2]:
-                    coder_state = final_state.get("coder_state")
-                    if coder_state and isinstance(coder_state, CoderState):
-                        steps = coder_state.task_plan.implementation_steps
-                        st.markdown(f'<div class="code-section">', unsafe_allow_html=True)
-                        st.write(f"**Total Code Tasks:** {len(steps)}")
-                        st.write(f"**Current Step Index:** {coder_state.current_step_idx}")
-                        
-                        for i, task in enumerate(steps, 1):
-                            with st.expander(f"Task {i}: {task.filepath}"):
-                                st.write(f"**File Path:** {task.filepath}")
-                                st.write(f"**Description:**")
-                                st.write(task.task_description)
-                        st.markdown('</div>', unsafe_allow_html=True)
-                    else:
-                        st.warning("No coder state available")
-                
-                with tabs[3]:
-                    st.json(execution_log, expanded=False)
-                
-            except Exception as e:
-                execution_log["error"] = str(e)
-                st.session_state.execution_history.append(execution_log)
-                
-                status_placeholder.markdown(
-                    '<div class="status-error">❌ Error occurred during execution</div>',
-                    unsafe_allow_html=True
+                i, task = selected
+                st.markdown(f'<div class="code-section">', unsafe_allow_html=True)
+                st.write(task.task_description)
+                st.markdown('</div>', unsafe_allow_html=True)
+                if st.toggle("Show file content", key=f"{key}_task_content"):
+                    render_file_preview(workspace, task.filepath, f"{key}_task_{i}")
+        else:
+            st.warning("No coder state available")
+
+    with tabs[3]:
+        files = sorted(project_files(workspace))
+        st.write(f"**Generated Files:** {len(files)}")
+        query = st.text_input("Search files", key=f"{key}_file_query", placeholder="Path fragment")
+        matches = filter_items(files, query, str)
+        page = paginate(matches, f"{key}_files", "Files")
+        if page:
+            _, selected = st.radio(
+                "File", page, key=f"{key}_file_selected", format_func=lambda item: item[1],
+                label_visibility="collapsed",
+            )
+            render_file_preview(workspace, selected, f"{key}_file")
+
+    with tabs[4]:
+        render_lazy_json("Show execution log", lambda: execution_log, f"{key}_log")
+        transcript_path = execution_log.get("transcript")
+        if transcript_path and pathlib.Path(transcript_path).is_file():
+            st.write("**Run Transcript:**")
+            render_lazy_json(
+                "Show transcript summary", lambda: summarize_transcript(pathlib.Path(transcript_path)),
+                f"{key}_transcript",
+            )
+            if st.toggle("Prepare transcript download", key=f"{key}_transcript_download"):
+                st.download_button(
+                    "⬇️ Download transcript",
+                    data=pathlib.Path(transcript_path).read_bytes(),
+                    file_name=pathlib.Path(transcript_path).name,
+                    mime="application/gzip",
                 )
-                
-                st.error(f"An error occurred: {str(e)}")
-                with st.expander("📋 Full Error Traceback"):
-                    st.code(traceback.format_exc())
-                    
-        except KeyboardInterrupt:
-            st.warning("⚠️ Operation cancelled by user")
-        except Exception as e:
-            st.error(f"❌ Unexpected error: {str(e)}")
-            st.code(traceback.format_exc())
+
+
+def job_progress(job: Job) -> float:
+    """Estimate overall progress of a job from its current node."""
+    if job.status.finished:
+        return 1.0
+    if job.current_node is None:
+        return 0.0
+    if job.current_node == "fast_path":
+        return 0.1
+    if job.current_node == "planner":
+        return 0.33
+    # Scan from the end: long runs accumulate thousands of events
+    latest = next((e for e in reversed(job.events) if e["type"] == "node" and e.get("total_tasks")), None)
+    if latest is None:
+        return 0.4
+    return 0.4 + 0.6 * latest["completed_tasks"] / max(latest["total_tasks"], 1)
+
+
+def render_job(job: Job) -> None:
+    """Render the status of the active job and its results once finished."""
+    st.divider()
+    st.caption(f"Job `{job.job_id}` · workspace `{job.workspace}`")
+
+    if job.status == JobStatus.QUEUED:
+        st.markdown('<div class="status-running">⏳ Waiting for a free worker...</div>', unsafe_allow_html=True)
+    elif job.status == JobStatus.RUNNING:
+        stage = job.current_node or "starting"
+        st.markdown(f'<div class="status-running">🔄 Running: {stage}...</div>', unsafe_allow_html=True)
+    elif job.status == JobStatus.COMPLETED:
+        st.markdown('<div class="status-completed">✅ All stages completed successfully!</div>', unsafe_allow_html=True)
+    elif job.status == JobStatus.CANCELLED:
+        st.warning("⚠️ Operation cancelled by user")
+    elif job.status == JobStatus.TIMED_OUT:
+        st.warning(f"⏱️ Deadline of {job.deadline:g}s exceeded; the workspace holds the files generated so far")
+    else:
+        st.markdown('<div class="status-error">❌ Error occurred during execution</div>', unsafe_allow_html=True)
+        st.error(f"An error occurred: {job.error}")
+
+    st.progress(job_progress(job))
+
+    if not job.status.finished:
+        if st.button("⛔ Cancel Run", key=f"cancel_{job.job_id}"):
+            job_manager.cancel(job.job_id)
+            st.rerun()
+        recent = list(itertools.islice(
+            (e for e in reversed(job.events) if e["type"] in ("node", "file_written")), 10
+        ))[::-1]
+        for event in recent:
+            if event["type"] == "node":
+                st.write(f"• Finished node **{event['node']}**")
+            else:
+                st.write(f"• Wrote `{event['path']}`")
+        # The coder streams files to disk; show the one currently being generated
+        streaming = next((e for e in reversed(job.events) if e["type"] in ("file_progress", "file_written")), None)
+        if streaming is not None and streaming["type"] == "file_progress" and not streaming.get("done"):
+            st.write(f"✍️ Writing `{streaming['path']}` ({streaming['bytes'] / 1024:.1f} KB so far)")
+        return
+
+    execution_log = build_execution_log(job)
+    if job.job_id not in st.session_state.recorded_jobs:
+        st.session_state.recorded_jobs.add(job.job_id)
+        st.session_state.execution_history.append(execution_log)
+        if job.status == JobStatus.COMPLETED:
+            st.session_state.agent_state = job.final_state
+
+    if job.status == JobStatus.COMPLETED:
+        render_results(job.final_state, execution_log)
+
+
+active_job = job_manager.get(st.session_state.active_job_id) if st.session_state.active_job_id else None
+if active_job is not None:
+    render_job(active_job)
 
 # Display current execution if selected from history
 if st.session_state.current_execution is not None:
@@ -425,7 +584,7 @@ if st.session_state.current_execution is not None:
         st.write(f"**Prompt:** {execution['prompt']}")
         
         if execution['final_state']:
-            st.json(execution['final_state'])
+            render_lazy_json("Show final state", lambda: execution['final_state'], f"hist_state_{exec_index}")
 
 # Footer
 st.divider()
@@ -435,3 +594,9 @@ st.markdown("""
     <p style="font-size: 12px;">Watch the agent analyze requirements, architect solutions, and generate code</p>
 </div>
 """, unsafe_allow_html=True)
+
+# Poll the active job until it finishes; the job itself keeps running in the
+# background, so widget interactions no longer interrupt the generation.
+if active_job is not None and not active_job.status.finished:
+    time.sleep(1.0)
+    st.rerun()